@@ -6,17 +6,33 @@ import os
 
 from flask import Flask, render_template
 
+from .arquivo import bp as arquivo_bp
 from .auth import bp as auth_bp
+from .backup import bp as backup_bp
+from .busca import bp as busca_bp
 from .clientes import bp as clientes_bp
 from .cobrancas import bp as cobrancas_bp
 from .dashboard import bp as dashboard_bp
 from .db import close_db, init_db
 from .estoque import bp as estoque_bp
+from .eventos import bp as eventos_bp
+from .exportacao import bp as exportacao_bp
+from .fila import bp as fila_bp
 from .financeiro import bp as financeiro_bp
+from .importacao import bp as importacao_bp
+from .instrumentacao import instalar as instalar_instrumentacao
+from .metricas import bp as metricas_bp
+from .metricas import instalar as instalar_metricas
 from .pedidos import bp as pedidos_bp
+from .perfilador import bp as perfil_bp
+from .perfilador import instalar as instalar_perfilador
 from .produtos import bp as produtos_bp
 from .publico import bp as publico_bp
-from .scheduler import start_scheduler
+from .repositorio import bp as repositorio_bp
+from .repositorio import instalar as instalar_repositorio
+from .sessoes import configurar_sessoes
+from .shards import bp as shards_bp
+from .utils import usuario_atual
 from .asaas_webhook import bp as asaas_webhook_bp
 
 
@@ -42,12 +58,31 @@ def create_app() -> Flask:
         os.getenv("SESSION_COOKIE_SECURE", "0") == "1"
     )
 
-    # Inicia/cria tabelas
+    # Inicia/cria tabelas (no-op quando o PRAGMA user_version já está em dia).
+    # Os jobs (fila) NÃO rodam aqui: ver worker.py / run.py.
     with app.app_context():
         init_db()
 
+    # Sessões no servidor (revogáveis) + contexto do usuário nos templates
+    configurar_sessoes(app)
+
+    @app.context_processor
+    def injetar_usuario():
+        return {"usuario": usuario_atual()}
+
     # Fecha conexão no fim de cada request
     app.teardown_appcontext(close_db)
+    # Backend do repositório (sqlite ou postgres)
+    instalar_repositorio(app)
+
+    # Conta/mede SQL por request (header Server-Timing + log de query lenta)
+    instalar_instrumentacao(app)
+
+    # Métricas por blueprint + endpoint /metrics
+    instalar_metricas(app)
+
+    # Profiler por amostragem (PROFILE_SAMPLE_RATE ou header X-Profile)
+    instalar_perfilador(app)
 
     # Registra módulos (blueprints)
     app.register_blueprint(auth_bp)
@@ -56,14 +91,22 @@ def create_app() -> Flask:
     app.register_blueprint(produtos_bp)
     app.register_blueprint(pedidos_bp)
     app.register_blueprint(estoque_bp)
+    app.register_blueprint(eventos_bp)
     app.register_blueprint(cobrancas_bp)
     app.register_blueprint(financeiro_bp)
+    app.register_blueprint(exportacao_bp)
+    app.register_blueprint(importacao_bp)
+    app.register_blueprint(busca_bp)
+    app.register_blueprint(metricas_bp)
+    app.register_blueprint(perfil_bp)
+    app.register_blueprint(shards_bp)
+    app.register_blueprint(arquivo_bp)
+    app.register_blueprint(backup_bp)
+    app.register_blueprint(fila_bp)
+    app.register_blueprint(repositorio_bp)
     app.register_blueprint(publico_bp)
     app.register_blueprint(asaas_webhook_bp)
 
-    # Inicia scheduler (WhatsApp automático), se WHATSAPP_AUTOMATICO=1
-    start_scheduler(app)
-
     @app.errorhandler(404)
     def pagina_nao_encontrada(_error):
         """Renderiza página 404."""
@@ -0,0 +1,124 @@
+"""Arquivo dos pedidos pagos (partição fria).
+
+Pedido pago há mais de ARQUIVO_MESES meses sai de `pedidos` (e os itens de
+`pedido_itens`) para `pedidos_arquivo` / `pedido_itens_arquivo`, no mesmo
+banco, em lotes de ARQUIVO_LOTE por transação: o escritor nunca fica preso
+por muito tempo. Cobranças, scheduler e a lista de pedidos leem só a tabela
+quente; exportações, financeiro, dashboard e /admin/tenants incluem o
+arquivo quando o período pedido o alcança (`repositorio.fontes_pedidos`).
+O rollup do financeiro não muda: o trigger ignora o DELETE de quem já foi
+copiado para o arquivo.
+
+Depois de arquivar, `PRAGMA incremental_vacuum` devolve as páginas livres
+e ANALYZE atualiza as estatísticas. Bancos novos já nascem com
+auto_vacuum=INCREMENTAL; os antigos precisam, uma vez, de
+`flask --app run arquivo vacuum --completo` (VACUUM inteiro, trava o banco).
+
+- `flask --app run arquivo pedidos [--meses N]`: arquiva agora.
+- ARQUIVO_AUTOMATICO: 1 (default) liga o job diário no worker.
+- ARQUIVO_MESES: idade (meses desde o pagamento) para arquivar. Default 12.
+- ARQUIVO_LOTE: pedidos por transação. Default 500.
+- ARQUIVO_HORA: hora do job diário. Default 3.
+- ARQUIVO_VACUUM_PAGINAS: páginas devolvidas por rodada (0 = todas).
+"""
+
+from __future__ import annotations
+
+import calendar
+import os
+from datetime import date, datetime
+
+import click
+from flask import Blueprint
+
+from .db import conectar, tenant_atual
+from .repositorio import repo
+from .utils import por_tenant
+
+bp = Blueprint("arquivo", __name__)
+
+ARQUIVO_AUTOMATICO = os.getenv("ARQUIVO_AUTOMATICO", "1") == "1"
+ARQUIVO_MESES = int(os.getenv("ARQUIVO_MESES", "12"))
+ARQUIVO_LOTE = int(os.getenv("ARQUIVO_LOTE", "500"))
+ARQUIVO_HORA = int(os.getenv("ARQUIVO_HORA", "3"))
+ARQUIVO_VACUUM_PAGINAS = int(os.getenv("ARQUIVO_VACUUM_PAGINAS", "0"))
+
+# Tabelas que o arquivamento reescreve (ANALYZE depois de cada rodada)
+_TABELAS = ("pedidos", "pedido_itens", "pedidos_arquivo", "pedido_itens_arquivo")
+
+
+def corte(hoje: date, meses: int) -> str:
+    """Dia (ISO) `meses` antes de `hoje`; arquiva o que foi pago antes dele."""
+    ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - meses, 12)
+    mes += 1
+    # 31/03 - 1 mês = 28 ou 29/02
+    dia = min(hoje.day, calendar.monthrange(ano, mes)[1])
+    return date(ano, mes, dia).isoformat()
+
+
+def arquivar(hoje: date | None = None, meses: int = ARQUIVO_MESES) -> int:
+    """Arquiva os pedidos pagos antigos do banco atual; retorna quantos."""
+    limite = corte(hoje or date.today(), meses)
+    agora = datetime.now().isoformat(timespec="seconds")
+    r = repo().arquivo
+    total = 0
+    while True:
+        movidos = r.arquivar_lote(limite, ARQUIVO_LOTE, agora)
+        total += movidos
+        if movidos < ARQUIVO_LOTE:
+            return total
+
+
+def manutencao(completo: bool = False) -> None:
+    """Devolve as páginas livres e atualiza as estatísticas do banco atual.
+
+    Com `completo`, liga auto_vacuum=INCREMENTAL e roda um VACUUM inteiro
+    (necessário uma vez em bancos criados antes do arquivo).
+    """
+    if repo().db.nome == "postgres":
+        # VACUUM fica com o autovacuum; ANALYZE roda dentro da transação
+        for tabela in _TABELAS:
+            repo().db.executar(f"ANALYZE {tabela}")
+        repo().commit()
+        return
+
+    con = conectar(tenant_atual())
+    try:
+        if completo:
+            con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            con.execute("VACUUM")
+        elif con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            # 0 = a lista inteira de páginas livres
+            con.execute(f"PRAGMA incremental_vacuum({ARQUIVO_VACUUM_PAGINAS})").fetchall()
+        for tabela in _TABELAS:
+            con.execute(f"ANALYZE {tabela}")
+        con.commit()
+    finally:
+        con.close()
+
+
+def arquivar_e_limpar(meses: int = ARQUIVO_MESES) -> int:
+    """Uma rodada completa no banco atual: arquiva e, se moveu algo, faz a
+    manutenção."""
+    movidos = arquivar(meses=meses)
+    if movidos:
+        manutencao()
+    return movidos
+
+
+@bp.cli.command("pedidos")
+@click.option("--meses", type=int, default=ARQUIVO_MESES, show_default=True,
+              help="arquiva os pagos há mais de N meses")
+def arquivar_cli(meses: int) -> None:
+    """Move os pedidos pagos antigos para o arquivo."""
+    for uid, movidos in por_tenant(lambda: arquivar_e_limpar(meses)).items():
+        click.echo(f"{'banco' if uid is None else f'usuario {uid}'}: {movidos} pedido(s) arquivado(s)")
+
+
+@bp.cli.command("vacuum")
+@click.option("--completo", is_flag=True,
+              help="VACUUM inteiro (liga o auto_vacuum incremental em bancos antigos)")
+def vacuum_cli(completo: bool) -> None:
+    """Devolve o espaço livre do banco e roda ANALYZE."""
+    por_tenant(lambda: manutencao(completo))
+    click.echo("manutenção concluída")
@@ -1,5 +1,9 @@
 """Integração com Asaas (Pix) + Webhook.
 
+As chamadas são assíncronas (httpx, ver http_async.py): `*_async` para quem já
+está num event loop; as versões síncronas são só um wrapper que espera o
+resultado no loop em background do processo.
+
 Requer variáveis de ambiente:
 - ASAAS_API_KEY: chave de API (produção ou sandbox)
 - ASAAS_BASE_URL: opcional (default produção). Ex.: https://api.asaas.com
@@ -10,7 +14,9 @@ from __future__ import annotations
 
 import os
 import re
-import requests
+
+from . import http_async
+from .metricas import medir_provedor
 
 DEFAULT_BASE_URL = "https://api.asaas.com"
 
@@ -33,7 +39,7 @@ def _clean_phone_br(phone: str) -> str:
         digits = "55" + digits
     return digits
 
-def create_or_get_customer(nome: str, telefone: str | None, external_reference: str | None = None) -> str:
+async def create_or_get_customer_async(nome: str, telefone: str | None, external_reference: str | None = None) -> str:
     """Cria cliente no Asaas e retorna o customerId.
 
     Para simplificar, sempre cria (evita busca complexa). Em produção, dá pra
@@ -50,12 +56,13 @@ def create_or_get_customer(nome: str, telefone: str | None, external_reference:
     if external_reference:
         payload["externalReference"] = external_reference
 
-    r = requests.post(f"{_base_url()}/v3/customers", headers=_headers(), json=payload, timeout=30)
-    r.raise_for_status()
+    with medir_provedor("asaas", "criar_cliente"):
+        r = await http_async.cliente().post(f"{_base_url()}/v3/customers", headers=_headers(), json=payload)
+        r.raise_for_status()
     data = r.json()
     return data.get("id")
 
-def create_pix_payment(customer_id: str, value: float, due_date_iso: str, description: str, external_reference: str | None = None) -> dict:
+async def create_pix_payment_async(customer_id: str, value: float, due_date_iso: str, description: str, external_reference: str | None = None) -> dict:
     """Cria cobrança PIX e retorna o JSON da cobrança."""
     payload = {
         "customer": customer_id,
@@ -67,14 +74,32 @@ def create_pix_payment(customer_id: str, value: float, due_date_iso: str, descri
     if external_reference:
         payload["externalReference"] = external_reference
 
-    r = requests.post(f"{_base_url()}/v3/payments", headers=_headers(), json=payload, timeout=30)
-    r.raise_for_status()
+    with medir_provedor("asaas", "criar_cobranca"):
+        r = await http_async.cliente().post(f"{_base_url()}/v3/payments", headers=_headers(), json=payload)
+        r.raise_for_status()
     return r.json()
 
-def get_pix_qrcode(payment_id: str) -> dict:
+async def get_pix_qrcode_async(payment_id: str) -> dict:
     """Obtém QR Code do PIX para uma cobrança.
     Endpoint: GET /v3/payments/{id}/pixQrCode
     """
-    r = requests.get(f"{_base_url()}/v3/payments/{payment_id}/pixQrCode", headers=_headers(), timeout=30)
-    r.raise_for_status()
+    with medir_provedor("asaas", "pix_qrcode"):
+        r = await http_async.cliente().get(f"{_base_url()}/v3/payments/{payment_id}/pixQrCode", headers=_headers())
+        r.raise_for_status()
     return r.json()
+
+# ---- API síncrona (views WSGI, scripts) ----
+
+def create_or_get_customer(nome: str, telefone: str | None, external_reference: str | None = None) -> str:
+    """Versão síncrona de `create_or_get_customer_async`."""
+    return http_async.executar(create_or_get_customer_async(nome, telefone, external_reference))
+
+def create_pix_payment(customer_id: str, value: float, due_date_iso: str, description: str, external_reference: str | None = None) -> dict:
+    """Versão síncrona de `create_pix_payment_async`."""
+    return http_async.executar(
+        create_pix_payment_async(customer_id, value, due_date_iso, description, external_reference)
+    )
+
+def get_pix_qrcode(payment_id: str) -> dict:
+    """Versão síncrona de `get_pix_qrcode_async`."""
+    return http_async.executar(get_pix_qrcode_async(payment_id))
@@ -1,5 +1,9 @@
 """Webhook do Asaas para dar baixa automática no pagamento.
 
+A rota só valida e enfileira; a baixa roda no worker (`asaas_baixa`, ver
+fila.py), com novas tentativas se o banco estiver ocupado. Reenvios do
+mesmo evento são inofensivos: a baixa grava os mesmos valores.
+
 Segurança:
 - Configure um token no Asaas e coloque em ASAAS_WEBHOOK_TOKEN.
   O Asaas envia esse token no header `asaas-access-token`.
@@ -12,7 +16,11 @@ from datetime import datetime
 
 from flask import Blueprint, jsonify, request
 
-from .db import get_db
+from .db import shards_ativos, tenant_do_pagamento, usar_tenant
+from .eventos import publicar
+from .fila import enfileirar, tarefa
+from .metricas import webhook_eventos
+from .repositorio import repo
 
 bp = Blueprint("asaas_webhook", __name__)
 
@@ -27,6 +35,7 @@ def _token_ok() -> bool:
 @bp.route("/webhook/asaas", methods=["POST"])
 def webhook_asaas():
     if not _token_ok():
+        webhook_eventos.inc(origem="asaas", evento="-", resultado="nao_autorizado")
         return jsonify({"ok": False, "error": "unauthorized"}), 401
 
     payload = request.get_json(silent=True) or {}
@@ -37,44 +46,58 @@ def webhook_asaas():
     # Eventos mais úteis para baixa:
     # PAYMENT_CONFIRMED e PAYMENT_RECEIVED
     if event not in ("PAYMENT_CONFIRMED", "PAYMENT_RECEIVED"):
+        webhook_eventos.inc(origem="asaas", evento=event or "-", resultado="ignorado")
         return jsonify({"ok": True, "ignored": event}), 200
 
     if not payment_id:
+        webhook_eventos.inc(origem="asaas", evento=event, resultado="invalido")
         return jsonify({"ok": False, "error": "missing payment id"}), 400
 
-    con = get_db()
-    cur = con.cursor()
-
-    # Procura o pedido associado
-    cur.execute(
-        "SELECT id, valor_pago FROM pedidos WHERE asaas_payment_id = ? LIMIT 1",
-        (payment_id,),
-    )
-    row = cur.fetchone()
-    if not row:
-        return jsonify({"ok": True, "note": "payment not linked"}), 200
-
-    pedido_id = int(row["id"])
     valor = payment.get("value") or payment.get("netValue") or payment.get("originalValue")
     data_pag = payment.get("paymentDate") or payment.get("clientPaymentDate") or payment.get("confirmedDate")
 
-    # Atualiza baixa
-    cur.execute(
-        """
-        UPDATE pedidos
-        SET pago = 1,
-            data_pagamento = ?,
-            valor_pago = ?,
-            asaas_status = ?
-        WHERE id = ?
-        """,
-        (
-            (data_pag or datetime.now().isoformat(timespec="seconds")),
-            float(valor) if valor is not None else None,
-            event,
-            pedido_id,
-        ),
+    job_id = enfileirar(
+        "asaas_baixa",
+        payment_id=payment_id,
+        evento=event,
+        valor=float(valor) if valor is not None else None,
+        data_pagamento=data_pag or datetime.now().isoformat(timespec="seconds"),
     )
-    con.commit()
+    webhook_eventos.inc(origem="asaas", evento=event, resultado="enfileirado")
 
-    return jsonify({"ok": True, "pedido_id": pedido_id, "event": event}), 200
+    return jsonify({"ok": True, "job": job_id, "event": event}), 200
+
+
+@tarefa("asaas_baixa", prioridade=10)
+def aplicar_baixa(payment_id: str, evento: str, valor: float | None, data_pagamento: str) -> None:
+    """Dá baixa no pedido da cobrança (job enfileirado pelo webhook)."""
+    # Modo shard: o catálogo diz em qual banco está o pedido
+    if shards_ativos():
+        uid = tenant_do_pagamento(payment_id)
+        if uid is None:
+            webhook_eventos.inc(origem="asaas", evento=evento, resultado="sem_pedido")
+            return
+        usar_tenant(uid)
+
+    r = repo()
+
+    # Procura o pedido associado
+    row = r.loja.pedido_do_pagamento(payment_id)
+    if not row:
+        webhook_eventos.inc(origem="asaas", evento=evento, resultado="sem_pedido")
+        return
+
+    r.loja.baixa_webhook(int(row["id"]), data_pagamento, valor, evento)
+    webhook_eventos.inc(origem="asaas", evento=evento, resultado="baixa")
+    if not row["pago"]:
+        # reenvio do mesmo evento não mexe de novo nos totais das telas
+        principal = float(row["valor_principal"] or 0) - float(row["valor_abatido"] or 0)
+        publicar(
+            int(row["usuario_id"]),
+            "pedido_pago",
+            pedidos=[int(row["id"])],
+            cliente_id=int(row["cliente_id"]),
+            principal=principal,
+            valor=valor if valor is not None else principal,
+            origem="asaas",
+        )
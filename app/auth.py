@@ -1,12 +1,33 @@
-"""Rotas e funções de autenticação (register/login/logout)."""
+"""Rotas e funções de autenticação (register/login/logout).
+
+O bcrypt é caro de propósito. Para não prender as threads de request num pico
+de logins (ex.: abertura de turno nas lojas), hash e verificação rodam num pool
+limitado de threads (o bcrypt libera o GIL enquanto calcula). Se o pool estiver
+lotado, o login é recusado na hora em vez de enfileirar sem limite.
+
+Variáveis de ambiente:
+- BCRYPT_ROUNDS: custo (work factor) dos hashes novos. Default 12.
+  Hashes com custo diferente são refeitos de forma transparente no login.
+- AUTH_WORKERS: threads dedicadas ao bcrypt por processo. Default 2.
+- AUTH_FILA_MAX: verificações simultâneas (rodando + aguardando, inclusive as
+  que já estouraram o AUTH_TIMEOUT e ainda não terminaram). Default 16.
+- AUTH_TIMEOUT: segundos máximos de espera por uma verificação. Default 10.
+"""
 
 from __future__ import annotations
 
-import sqlite3
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 
 import bcrypt
 from flask import (
     Blueprint,
+    current_app,
     flash,
     redirect,
     render_template,
@@ -15,44 +36,166 @@ from flask import (
     url_for,
 )
 
-from .db import get_db
-from .utils import login_required
+from .metricas import login_duracao
+from .repositorio import RegistroDuplicado, repo
+from .sessoes import regenerar_sessao, revogar_sessoes_usuario
+from .utils import current_user_id, login_required
 
 bp = Blueprint("auth", __name__)
 
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+AUTH_WORKERS = max(int(os.getenv("AUTH_WORKERS", "2")), 1)
+AUTH_FILA_MAX = max(int(os.getenv("AUTH_FILA_MAX", "16")), AUTH_WORKERS)
+AUTH_TIMEOUT = float(os.getenv("AUTH_TIMEOUT", "10"))
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_vagas = threading.BoundedSemaphore(AUTH_FILA_MAX)
+
+# Últimas latências de login (segundos), para percentis.
+_latencias: deque[float] = deque(maxlen=2048)
+_latencias_lock = threading.Lock()
+
+
+def _reiniciar_no_filho() -> None:
+    """Depois do fork (gunicorn com preload) o worker cria o próprio pool:
+    threads não sobrevivem ao fork e locks herdados podem estar presos."""
+    global _executor, _executor_lock, _vagas, _latencias_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _vagas = threading.BoundedSemaphore(AUTH_FILA_MAX)
+    _latencias_lock = threading.Lock()
+    _latencias.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_no_filho)
+
+
+class AutenticacaoOcupada(Exception):
+    """O pool de bcrypt está lotado; a tentativa deve ser refeita depois."""
+
+
+def _pool() -> ThreadPoolExecutor:
+    """Retorna (criando sob demanda) o pool de threads do bcrypt."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=AUTH_WORKERS, thread_name_prefix="bcrypt"
+                )
+    return _executor
+
+
+def _no_pool(func, *args):
+    """Executa `func` no pool do bcrypt respeitando o limite de fila.
+
+    A vaga só é devolvida quando a tarefa termina: no timeout o bcrypt que
+    já está rodando não pode ser cancelado e continua ocupando o pool.
+    """
+    vagas = _vagas
+    if not vagas.acquire(blocking=False):
+        raise AutenticacaoOcupada()
+    try:
+        futuro = _pool().submit(func, *args)
+    except BaseException:
+        vagas.release()
+        raise
+    futuro.add_done_callback(lambda _: vagas.release())
+    try:
+        return futuro.result(timeout=AUTH_TIMEOUT)
+    except FuturesTimeoutError as exc:
+        futuro.cancel()
+        raise AutenticacaoOcupada() from exc
+
+
+def _gerar_hash(senha: str) -> bytes:
+    """Gera o hash bcrypt com o custo configurado."""
+    return bcrypt.hashpw(
+        senha.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    )
+
+
+def _custo_do_hash(senha_hash: bytes) -> int | None:
+    """Extrai o custo de um hash no formato $2b$12$...."""
+    try:
+        return int(senha_hash.split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _registrar_latencia(segundos: float) -> None:
+    """Guarda a duração de uma tentativa de login."""
+    with _latencias_lock:
+        _latencias.append(segundos)
+    login_duracao.observe(segundos)
+
+
+def _percentil(ordenados: list[float], p: float) -> float:
+    """Percentil pelo método nearest-rank."""
+    if not ordenados:
+        return 0.0
+    idx = max(math.ceil(p / 100 * len(ordenados)) - 1, 0)
+    return ordenados[idx]
+
+
+def estatisticas_login() -> dict:
+    """Retorna p50/p95/p99 (ms) das últimas tentativas de login."""
+    with _latencias_lock:
+        ordenados = sorted(_latencias)
+    return {
+        "amostras": len(ordenados),
+        "p50_ms": round(_percentil(ordenados, 50) * 1000, 2),
+        "p95_ms": round(_percentil(ordenados, 95) * 1000, 2),
+        "p99_ms": round(_percentil(ordenados, 99) * 1000, 2),
+    }
+
 
 def criar_usuario(username: str, senha: str) -> None:
     """Cria um usuário com senha armazenada em hash (bcrypt)."""
-    senha_hash = bcrypt.hashpw(senha.encode("utf-8"), bcrypt.gensalt())
-    con = get_db()
-    cur = con.cursor()
-    cur.execute(
-        "INSERT INTO usuarios (username, senha_hash) VALUES (?, ?)",
-        (username, senha_hash),
-    )
-    con.commit()
+    senha_hash = _no_pool(_gerar_hash, senha)
+    repo().usuarios.criar(username, senha_hash)
 
 
 def autenticar_usuario(username: str, senha: str) -> int | None:
-    """Valida usuário/senha e retorna o id do usuário quando válido."""
-    con = get_db()
-    cur = con.cursor()
-    cur.execute(
-        "SELECT id, senha_hash FROM usuarios WHERE username = ?",
-        (username,),
-    )
-    row = cur.fetchone()
+    """Valida usuário/senha e retorna o id do usuário quando válido.
+
+    Levanta `AutenticacaoOcupada` se o pool do bcrypt estiver lotado.
+    """
+    inicio = time.perf_counter()
+    try:
+        return _autenticar(username, senha)
+    finally:
+        _registrar_latencia(time.perf_counter() - inicio)
+
+
+def _autenticar(username: str, senha: str) -> int | None:
+    """Verifica a senha no pool e refaz o hash se o custo mudou."""
+    usuarios = repo().usuarios
+    row = usuarios.por_username(username)
     if not row:
         return None
 
     user_id, senha_hash = row["id"], row["senha_hash"]
     if isinstance(senha_hash, str):
         senha_hash = senha_hash.encode("utf-8")
+    elif not isinstance(senha_hash, bytes):
+        senha_hash = bytes(senha_hash)  # BYTEA do Postgres vem como memoryview
 
-    if bcrypt.checkpw(senha.encode("utf-8"), senha_hash):
-        return int(user_id)
+    if not _no_pool(bcrypt.checkpw, senha.encode("utf-8"), senha_hash):
+        return None
+
+    # Custo mudou na configuração: refaz o hash agora que temos a senha.
+    if _custo_do_hash(senha_hash) != BCRYPT_ROUNDS:
+        try:
+            novo_hash = _no_pool(_gerar_hash, senha)
+        except AutenticacaoOcupada:
+            novo_hash = None  # tenta de novo no próximo login
+        if novo_hash is not None:
+            usuarios.trocar_hash(user_id, novo_hash)
 
-    return None
+    return int(user_id)
 
 
 @bp.route("/register", methods=["GET", "POST"])
@@ -81,9 +224,12 @@ def register():
 
     try:
         criar_usuario(username, senha)
-    except sqlite3.IntegrityError:
+    except RegistroDuplicado:
         flash("Esse usuário já existe.", "warning")
         return redirect(url_for("auth.register"))
+    except AutenticacaoOcupada:
+        flash("Sistema ocupado, tente novamente em instantes.", "warning")
+        return redirect(url_for("auth.register"))
 
     flash("Conta criada! Faça login ✅", "success")
     return redirect(url_for("auth.login"))
@@ -102,13 +248,19 @@ def login():
         flash("Preencha usuário e senha.", "warning")
         return redirect(url_for("auth.login"))
 
-    user_id = autenticar_usuario(username, senha)
+    try:
+        user_id = autenticar_usuario(username, senha)
+    except AutenticacaoOcupada:
+        flash("Muitos logins ao mesmo tempo, tente novamente.", "warning")
+        return redirect(url_for("auth.login"))
+
     if not user_id:
         flash("Usuário ou senha inválidos.", "error")
         return redirect(url_for("auth.login"))
 
+    session.clear()
+    regenerar_sessao()
     session["user_id"] = user_id
-    session["username"] = username
     flash("Login realizado ✅", "success")
     return redirect("/")
 
@@ -120,3 +272,13 @@ def logout():
     session.clear()
     flash("Você saiu da conta.", "info")
     return redirect(url_for("auth.login"))
+
+
+@bp.route("/logout/todos", methods=["POST"])
+@login_required
+def logout_todos():
+    """Encerra todas as sessões do usuário (todos os dispositivos)."""
+    revogar_sessoes_usuario(current_app, current_user_id())
+    session.clear()
+    flash("Todas as sessões foram encerradas.", "info")
+    return redirect(url_for("auth.login"))
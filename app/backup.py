@@ -0,0 +1,291 @@
+"""Backup online dos bancos SQLite (API de backup do SQLite).
+
+O job diário do worker (BACKUP_HORA) copia o banco principal e, no modo
+shard, o arquivo de cada usuário com `sqlite3.Connection.backup`, em passos
+de BACKUP_PAGINAS páginas com uma pausa entre eles. Em WAL a cópia segura
+uma transação de leitura do começo ao fim: o snapshot fica fixo e o
+escritor segue gravando (o WAL só não é truncado até a cópia terminar).
+Sem WAL não dá para segurar a leitura sem travar as escritas, então cada
+escrita no meio faz o SQLite recomeçar a cópia; depois de BACKUP_REINICIOS
+recomeços o resto vai num passo só.
+
+Cada snapshot vira `<banco>-AAAAMMDD-HHMMSS.db.gz` em BACKUP_DIR, com um
+`.sha256` ao lado (formato do `sha256sum -c`). Ficam os BACKUP_MANTER mais
+recentes de cada banco. Com DB_BACKEND=postgres, as tabelas que já estão
+no Postgres ficam com o pg_dump / backup do provedor; aqui vão os arquivos
+SQLite.
+
+- `flask --app run backup criar`: faz o backup agora.
+- `flask --app run backup listar`
+- `flask --app run backup restaurar ARQUIVO [--destino CAMINHO]`: confere o
+  sha256 e o integrity_check e grava o snapshot por cima do banco, também
+  pela API de backup (quem está lendo vê o banco antigo ou o novo, nunca um
+  meio-termo). Reinicie os workers depois, para descartar os caches.
+
+Variáveis de ambiente:
+- BACKUP_AUTOMATICO: 1 (default) liga o job diário no worker.
+- BACKUP_DIR: pasta dos snapshots. Default `backups/` ao lado do banco.
+- BACKUP_HORA: hora do job diário. Default 2.
+- BACKUP_MANTER: snapshots guardados por banco. Default 7.
+- BACKUP_PAGINAS: páginas copiadas por passo. Default 1024 (4 MB).
+- BACKUP_PAUSA: segundos de folga para o escritor entre passos. Default 0.005.
+- BACKUP_REINICIOS: recomeços tolerados antes do passo único (sem WAL).
+  Default 3.
+"""
+
+from __future__ import annotations
+
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+
+import click
+from flask import Blueprint
+
+from .db import DB_ESCRITA_TIMEOUT, caminho_db, caminho_shard, listar_tenants, shards_ativos
+
+bp = Blueprint("backup", __name__)
+
+BACKUP_AUTOMATICO = os.getenv("BACKUP_AUTOMATICO", "1") == "1"
+BACKUP_HORA = int(os.getenv("BACKUP_HORA", "2"))
+BACKUP_MANTER = int(os.getenv("BACKUP_MANTER", "7"))
+BACKUP_PAGINAS = int(os.getenv("BACKUP_PAGINAS", "1024"))
+BACKUP_PAUSA = float(os.getenv("BACKUP_PAUSA", "0.005"))
+BACKUP_REINICIOS = int(os.getenv("BACKUP_REINICIOS", "3"))
+
+_BLOCO = 1024 * 1024
+_NOME = re.compile(r"^(?P<banco>.+)-(?P<quando>\d{8}-\d{6})\.db\.gz$")
+
+log = logging.getLogger(__name__)
+
+
+def pasta_backups() -> str:
+    """Pasta dos snapshots (BACKUP_DIR sobrescreve)."""
+    pasta = os.getenv("BACKUP_DIR", "").strip()
+    return pasta or os.path.join(os.path.dirname(os.path.abspath(caminho_db())), "backups")
+
+
+def bancos() -> list[tuple[str, str]]:
+    """[(nome, caminho)] dos arquivos a copiar: o principal e os shards."""
+    lista = [("principal", caminho_db())]
+    if shards_ativos():
+        lista += [
+            (f"usuario_{uid}", caminho_shard(uid))
+            for uid in listar_tenants()
+            if os.path.exists(caminho_shard(uid))
+        ]
+    return lista
+
+
+class _Reiniciar(Exception):
+    """Escritas demais durante a cópia em passos."""
+
+
+def copiar(origem: str, destino: str) -> dict:
+    """Copia `origem` para o arquivo `destino` em passos; retorna páginas e
+    recomeços."""
+    info = {"paginas": 0, "reinicios": 0}
+    anterior = [None]
+
+    def progresso(_status, restantes, total):
+        info["paginas"] = total
+        if anterior[0] is not None and restantes > anterior[0]:
+            info["reinicios"] += 1
+            if info["reinicios"] > BACKUP_REINICIOS:
+                raise _Reiniciar
+        anterior[0] = restantes
+        if restantes and BACKUP_PAUSA:
+            time.sleep(BACKUP_PAUSA)
+
+    src = sqlite3.connect(Path(origem).absolute().as_uri() + "?mode=ro", uri=True)
+    dst = sqlite3.connect(destino)
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            # fixa o snapshot: a API de backup não recomeça com a leitura aberta
+            src.execute("BEGIN")
+            src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        try:
+            src.backup(dst, pages=BACKUP_PAGINAS, progress=progresso)
+        except _Reiniciar:
+            log.info("backup de %s: %d recomeços, copiando num passo só", origem, info["reinicios"])
+            src.backup(dst)
+        # snapshot autocontido: sem depender de -wal ao lado
+        dst.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dst.close()
+        src.close()
+    return info
+
+
+def _sha256(caminho: str) -> str:
+    h = hashlib.sha256()
+    with open(caminho, "rb") as fh:
+        for bloco in iter(lambda: fh.read(_BLOCO), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def criar(nome: str, origem: str, pasta: str | None = None) -> dict:
+    """Snapshot comprimido e com checksum de um banco; roda a rotação."""
+    pasta = pasta or pasta_backups()
+    os.makedirs(pasta, exist_ok=True)
+    inicio = time.perf_counter()
+    arquivo = os.path.join(pasta, f"{nome}-{datetime.now():%Y%m%d-%H%M%S}.db.gz")
+    copia = arquivo + ".tmp.db"
+    parcial = arquivo + ".tmp"
+    try:
+        info = copiar(origem, copia)
+        with open(copia, "rb") as entrada, gzip.open(parcial, "wb", compresslevel=6) as saida:
+            shutil.copyfileobj(entrada, saida, _BLOCO)
+        soma = _sha256(parcial)
+        with open(arquivo + ".sha256", "w", encoding="utf-8") as fh:
+            fh.write(f"{soma}  {os.path.basename(arquivo)}\n")
+        os.replace(parcial, arquivo)
+        bytes_banco = os.path.getsize(copia)
+    finally:
+        for resto in (copia, parcial):
+            if os.path.exists(resto):
+                os.remove(resto)
+    rotacionar(nome, pasta=pasta)
+    return {
+        "arquivo": arquivo,
+        "bytes_banco": bytes_banco,
+        "bytes": os.path.getsize(arquivo),
+        "sha256": soma,
+        "segundos": round(time.perf_counter() - inicio, 3),
+        **info,
+    }
+
+
+def listar(pasta: str | None = None) -> list[dict]:
+    """Snapshots da pasta, do mais novo ao mais antigo."""
+    itens = []
+    for arquivo in glob.glob(os.path.join(pasta or pasta_backups(), "*.db.gz")):
+        m = _NOME.match(os.path.basename(arquivo))
+        if m:
+            itens.append({
+                "arquivo": arquivo,
+                "banco": m["banco"],
+                "quando": datetime.strptime(m["quando"], "%Y%m%d-%H%M%S"),
+                "bytes": os.path.getsize(arquivo),
+            })
+    return sorted(itens, key=lambda i: i["quando"], reverse=True)
+
+
+def rotacionar(nome: str, manter: int = BACKUP_MANTER, pasta: str | None = None) -> list[str]:
+    """Apaga os snapshots de `nome` além dos `manter` mais recentes."""
+    apagados = []
+    for item in [i for i in listar(pasta) if i["banco"] == nome][max(manter, 1):]:
+        for arquivo in (item["arquivo"], item["arquivo"] + ".sha256"):
+            if os.path.exists(arquivo):
+                os.remove(arquivo)
+        apagados.append(item["arquivo"])
+    return apagados
+
+
+def verificar(arquivo: str) -> str:
+    """Confere o snapshot contra o `.sha256`; ValueError se não bate."""
+    try:
+        with open(arquivo + ".sha256", encoding="utf-8") as fh:
+            esperado = fh.read().split()[0]
+    except (OSError, IndexError) as exc:
+        raise ValueError(f"checksum ausente: {arquivo}.sha256") from exc
+    soma = _sha256(arquivo)
+    if soma != esperado:
+        raise ValueError(f"checksum não confere: {os.path.basename(arquivo)}")
+    return soma
+
+
+def destino_padrao(arquivo: str) -> str:
+    """Banco de onde o snapshot saiu (principal ou shard do usuário)."""
+    m = _NOME.match(os.path.basename(arquivo))
+    if not m:
+        raise ValueError(f"nome de snapshot desconhecido: {arquivo}")
+    if m["banco"].startswith("usuario_"):
+        return caminho_shard(int(m["banco"].removeprefix("usuario_")))
+    return caminho_db()
+
+
+def restaurar(arquivo: str, destino: str) -> None:
+    """Grava o snapshot (conferido) por cima do banco `destino`, online."""
+    verificar(arquivo)
+    temporario = destino + ".restaurando"
+    try:
+        with gzip.open(arquivo, "rb") as entrada, open(temporario, "wb") as saida:
+            shutil.copyfileobj(entrada, saida, _BLOCO)
+        src = sqlite3.connect(temporario)
+        try:
+            resultado = src.execute("PRAGMA integrity_check").fetchone()[0]
+            if resultado != "ok":
+                raise ValueError(f"snapshot corrompido: {resultado}")
+            # um passo só: o destino fica com o lock de escrita até o fim
+            dst = sqlite3.connect(destino, timeout=DB_ESCRITA_TIMEOUT)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def backup_tudo() -> list[dict]:
+    """Backup de todos os bancos; um erro não impede os demais."""
+    resultados = []
+    for nome, caminho in bancos():
+        try:
+            resultados.append(criar(nome, caminho))
+        except (OSError, sqlite3.Error) as exc:
+            log.error("backup de %s falhou: %s", nome, exc)
+            resultados.append({"banco": nome, "erro": str(exc)})
+    return resultados
+
+
+@bp.cli.command("criar")
+def criar_cli() -> None:
+    """Faz agora o backup do banco principal e dos shards."""
+    falhas = 0
+    for r in backup_tudo():
+        if "erro" in r:
+            falhas += 1
+            click.echo(f"{r['banco']}: ERRO {r['erro']}")
+            continue
+        click.echo(
+            f"{os.path.basename(r['arquivo'])}: {r['bytes_banco'] / 1e6:.1f} MB -> "
+            f"{r['bytes'] / 1e6:.1f} MB em {r['segundos']:.1f}s ({r['reinicios']} recomeço(s))"
+        )
+    if falhas:
+        raise click.ClickException(f"{falhas} backup(s) falharam")
+
+
+@bp.cli.command("listar")
+def listar_cli() -> None:
+    """Lista os snapshots guardados."""
+    for i in listar():
+        click.echo(f"{i['quando']:%Y-%m-%d %H:%M:%S}  {i['bytes'] / 1e6:>9.1f} MB  {i['arquivo']}")
+
+
+@bp.cli.command("restaurar")
+@click.argument("arquivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--destino", help="banco a sobrescrever (default: o de origem do snapshot)")
+@click.option("--sim", is_flag=True, help="não pede confirmação")
+def restaurar_cli(arquivo: str, destino: str | None, sim: bool) -> None:
+    """Restaura um snapshot por cima do banco."""
+    try:
+        destino = destino or destino_padrao(arquivo)
+        if not sim:
+            click.confirm(f"Sobrescrever {destino} com {os.path.basename(arquivo)}?", abort=True)
+        restaurar(arquivo, destino)
+    except (ValueError, sqlite3.Error) as exc:
+        raise click.ClickException(str(exc)) from exc
+    click.echo(f"{destino} restaurado; reinicie os workers do app")
@@ -0,0 +1,59 @@
+"""Busca de clientes e produtos (autocomplete) sobre índices FTS5.
+
+As tabelas `clientes_fts` e `produtos_fts` são mantidas por triggers (ver
+db.py). A busca é por prefixo em todas as palavras digitadas e ignora acentos:
+"jo sil" encontra "João Silva". Sem FTS5 no SQLite, cai num LIKE simples; com
+DB_BACKEND=postgres, ILIKE por palavra (sem ignorar acentos). As queries
+ficam em `repositorio.py` (`Clientes.buscar`, `Produtos.buscar`).
+"""
+
+from __future__ import annotations
+
+from flask import Blueprint, jsonify, request
+
+from .repositorio import repo
+from .utils import current_user_id, login_required
+
+bp = Blueprint("busca", __name__)
+
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+
+
+def buscar_clientes(uid: int, q: str, limite: int = LIMITE_PADRAO) -> list:
+    """Top-N clientes do usuário cujo nome/telefone casa com `q`."""
+    return repo().clientes.buscar(uid, q, limite)
+
+
+def buscar_produtos(uid: int, q: str, limite: int = LIMITE_PADRAO) -> list:
+    """Top-N produtos do usuário cujo nome casa com `q`."""
+    return repo().produtos.buscar(uid, q, limite)
+
+
+def _limite() -> int:
+    """Lê `limite` da query string, dentro de [1, LIMITE_MAXIMO]."""
+    try:
+        limite = int(request.args.get("limite", LIMITE_PADRAO))
+    except ValueError:
+        limite = LIMITE_PADRAO
+    return min(max(limite, 1), LIMITE_MAXIMO)
+
+
+@bp.route("/busca/clientes")
+@login_required
+def clientes_json():
+    """Autocomplete de clientes (JSON)."""
+    rows = buscar_clientes(current_user_id(), request.args.get("q", ""), _limite())
+    return jsonify(
+        [{"id": r["id"], "nome": r["nome"], "telefone": r["telefone"]} for r in rows]
+    )
+
+
+@bp.route("/busca/produtos")
+@login_required
+def produtos_json():
+    """Autocomplete de produtos (JSON)."""
+    rows = buscar_produtos(current_user_id(), request.args.get("q", ""), _limite())
+    return jsonify(
+        [{"id": r["id"], "nome": r["nome"], "preco": r["preco"]} for r in rows]
+    )
@@ -4,7 +4,8 @@ from __future__ import annotations
 
 from flask import Blueprint, flash, redirect, render_template, request
 
-from .db import get_db
+from .busca import buscar_clientes
+from .repositorio import repo
 from .utils import apenas_numeros, current_user_id, login_required
 
 bp = Blueprint("clientes", __name__)
@@ -15,8 +16,7 @@ bp = Blueprint("clientes", __name__)
 def clientes():
     """Lista e cria clientes."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
+    r = repo()
 
     if request.method == "POST":
         nome = request.form.get("nome", "").strip()
@@ -26,22 +26,17 @@ def clientes():
             flash("Nome inválido!", "warning")
             return redirect("/clientes")
 
-        cur.execute(
-            "INSERT INTO clientes (usuario_id, nome, telefone) "
-            "VALUES (?, ?, ?)",
-            (uid, nome, telefone),
-        )
-        con.commit()
+        r.clientes.criar(uid, nome, telefone)
+        r.commit()
         flash("Cliente cadastrado ✅", "success")
         return redirect("/clientes")
 
-    cur.execute(
-        "SELECT id, nome, telefone FROM clientes "
-        "WHERE usuario_id = ? ORDER BY nome",
-        (uid,),
-    )
-    lista = cur.fetchall()
-    return render_template("clientes.html", clientes=lista)
+    q = request.args.get("q", "").strip()
+    if q:
+        lista = buscar_clientes(uid, q, limite=200)
+    else:
+        lista = r.clientes.listar(uid)
+    return render_template("clientes.html", clientes=lista, q=q)
 
 
 @bp.route("/clientes/<int:cliente_id>/editar", methods=["GET", "POST"])
@@ -49,15 +44,9 @@ def clientes():
 def editar_cliente(cliente_id: int):
     """Edita um cliente."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
+    r = repo()
 
-    cur.execute(
-        "SELECT id, nome, telefone FROM clientes "
-        "WHERE id = ? AND usuario_id = ?",
-        (cliente_id, uid),
-    )
-    cliente = cur.fetchone()
+    cliente = r.clientes.por_id(uid, cliente_id)
 
     if not cliente:
         flash("Cliente não encontrado.", "warning")
@@ -71,12 +60,8 @@ def editar_cliente(cliente_id: int):
             flash("Informe o nome do cliente.", "warning")
             return render_template("cliente_editar.html", cliente=cliente)
 
-        cur.execute(
-            "UPDATE clientes SET nome = ?, telefone = ? "
-            "WHERE id = ? AND usuario_id = ?",
-            (nome, telefone, cliente_id, uid),
-        )
-        con.commit()
+        r.clientes.atualizar(uid, cliente_id, nome, telefone)
+        r.commit()
         flash("Cliente atualizado ✅", "success")
         return redirect("/clientes")
 
@@ -88,13 +73,9 @@ def editar_cliente(cliente_id: int):
 def excluir_cliente(cliente_id: int):
     """Exclui um cliente."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute(
-        "DELETE FROM clientes WHERE id = ? AND usuario_id = ?",
-        (cliente_id, uid),
-    )
-    con.commit()
+    r = repo()
+
+    r.clientes.excluir(uid, cliente_id)
+    r.commit()
     flash("Cliente excluído ✅", "success")
     return redirect("/clientes")
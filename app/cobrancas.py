@@ -1,8 +1,16 @@
 """Rotas de cobranças (fiado em aberto) + baixa de pagamento.
 
 Neste sistema, "cobrança automática" significa:
-- O valor exibido é sempre recalculado automaticamente (principal + juros por atraso).
+- O valor exibido é o saldo atualizado (principal + juros por atraso). O job
+  diário `acumular_juros` (worker.py) grava dias_atraso, juros e
+  total_atualizado nos pedidos em aberto; a tela e o WhatsApp leem esses
+  valores. Se o job ainda não rodou hoje, o saldo é calculado na hora.
+- A tela lista os clientes pelo saldo guardado em `clientes_saldo`, paginada
+  e ordenável (total, atraso, nome); os pedidos e o link do WhatsApp de cada
+  cliente são buscados em JSON quando o card é aberto.
 - Ao registrar o pagamento (botão "Dar baixa"), o pedido é marcado como pago e sai da lista.
+  Um valor recebido menor que o saldo quita os pedidos mais antigos e abate
+  a sobra do seguinte (`valor_abatido`): ele continua em aberto pelo resto.
 
 Para baixa 100% automática via PIX/Boleto/Cartão, é preciso integrar um provedor
 (Mercado Pago, Asaas, etc.) e receber um "webhook" de confirmação de pagamento.
@@ -12,178 +20,266 @@ from __future__ import annotations
 
 from datetime import date
 from urllib.parse import quote
+import os
 import re
 
-from flask import Blueprint, redirect, render_template, request, url_for
+import click
+from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
 
-from .db import get_db
+from .eventos import publicar
+from .repositorio import repo
 from .utils import (
+    TAXA_JUROS_DIA,
     apenas_numeros,
+    calcular_juros,
     current_user_id,
+    dias_de_atraso,
     login_required,
-    vencimento_do_pedido,
+    por_tenant,
+    vencimento_efetivo,
 )
 
 bp = Blueprint("cobrancas", __name__)
 
-TAXA_JUROS_DIA = 0.03  # 3% ao dia
-
-
-def _dias_atraso(hoje: date, vencimento: date) -> int:
-    """Retorna dias de atraso (nunca negativo)."""
-    return max((hoje - vencimento).days, 0)
-
-
-def _calcular_juros(principal: float, dias_atraso: int) -> float:
-    """Calcula juros simples por dia de atraso."""
-    if dias_atraso <= 0:
-        return 0.0
-    return float(principal) * float(TAXA_JUROS_DIA) * int(dias_atraso)
+# Clientes por página na tela de cobranças
+COBRANCAS_POR_PAGINA = int(os.getenv("COBRANCAS_POR_PAGINA", "20"))
+
+
+def _saldo(row, hoje: date, guardado: bool = True) -> tuple[float, date, int, float, float]:
+    """(principal, vencimento, dias, juros, total) de um pedido em aberto.
+
+    Com `guardado`, usa o saldo gravado pelo job quando existir; senão
+    calcula na hora.
+    """
+    venc = vencimento_efetivo(row["data_pedido"], row["vencimento"])
+    if guardado and row["total_atualizado"] is not None:
+        juros = float(row["juros"] or 0)
+        total = float(row["total_atualizado"])
+        return total - juros, venc, int(row["dias_atraso"] or 0), juros, total
+    principal = float(row["principal_atual"] or 0)
+    dias = dias_de_atraso(hoje, venc)
+    juros = calcular_juros(principal, dias)
+    return principal, venc, dias, juros, principal + juros
+
+
+def saldos_em_dia(hoje: date | None = None) -> bool:
+    """Indica se o job de juros já rodou hoje neste banco."""
+    hoje = hoje or date.today()
+    return repo().cobrancas.acumulado_em() == hoje.isoformat()
+
+
+def acumular_juros(hoje: date | None = None) -> int:
+    """Grava o saldo atualizado dos pedidos em aberto do banco atual.
+
+    Pedidos antigos sem vencimento ganham o vencimento padrão antes; depois
+    um único UPDATE atualiza só as linhas cujo saldo mudou. Retorna quantas.
+    """
+    hoje = hoje or date.today()
+    r = repo().cobrancas
+    vencimentos = []
+    for row in r.sem_vencimento():
+        try:
+            vencimentos.append((int(row["id"]), vencimento_efetivo(row["data"], None).isoformat()))
+        except (TypeError, ValueError):
+            continue  # pedido sem data: fica de fora, como na tela
+    if vencimentos:
+        r.gravar_vencimentos(vencimentos)
+    alterados = r.acumular(hoje.isoformat())
+    # os triggers já mantêm clientes_saldo; refazer aqui zera arredondamentos
+    r.recalcular_saldos()
+    r.marcar_acumulado(hoje.isoformat())
+    repo().commit()
+    return alterados
+
+
+def verificar_juros(hoje: date | None = None) -> list[dict]:
+    """Confere o saldo gravado contra o cálculo na hora; devolve divergências."""
+    hoje = hoje or date.today()
+    divergencias = []
+    for row in repo().cobrancas.abertos_saldos():
+        try:
+            principal, _venc, dias, juros, total = _saldo(row, hoje, guardado=False)
+        except (TypeError, ValueError):
+            continue
+        gravado = row["total_atualizado"]
+        if (
+            gravado is None
+            or int(row["dias_atraso"] or 0) != dias
+            or abs(float(gravado) - total) > 0.005
+        ):
+            divergencias.append(
+                {
+                    "pedido_id": int(row["pedido_id"]),
+                    "dias": (row["dias_atraso"], dias),
+                    "total": (gravado, round(total, 2)),
+                }
+            )
+    return divergencias
 
 
-def _vencimento(data_pedido_iso: str, vencimento_iso: str | None) -> date:
-    """Resolve vencimento: usa campo vencimento se existir, senão calcula pelo padrão do sistema."""
-    if vencimento_iso:
-        return date.fromisoformat(vencimento_iso)
-    return vencimento_do_pedido(date.fromisoformat(data_pedido_iso))
+def _pedidos_json(linhas, hoje: date, guardado: bool) -> list[dict]:
+    pedidos = []
+    for row in linhas:
+        principal, venc, dias, juros, total = _saldo(row, hoje, guardado)
+        pedidos.append(
+            {
+                "pedido_id": int(row["pedido_id"]),
+                "produto": row["produto_nome"] or "",
+                "qtd": int(row["quantidade"] or 0),
+                "principal": principal,
+                "abatido": float(row["valor_abatido"] or 0),
+                "vencimento": venc.isoformat(),
+                "hora_vencimento": row["hora_vencimento"] or "09:00",
+                "dias": dias,
+                "juros": juros,
+                "total": total,
+            }
+        )
+    return pedidos
+
+
+def _link_whatsapp(nome: str, telefone_raw: str, pedidos: list[dict],
+                   principal: float, juros: float) -> str | None:
+    """Link wa.me com o resumo do fiado (None sem telefone válido)."""
+    telefone = apenas_numeros(telefone_raw or "")
+    if not telefone:
+        return None
+    msg: list[str] = [
+        f"Olá {nome}! 👋",
+        "",
+        "Resumo do seu fiado (em aberto):",
+    ]
+    for it in pedidos:
+        msg.append(
+            f"- #{it['pedido_id']} {it['produto']} = R$ {it['principal']:.2f} | "
+            f"atraso: {it['dias']}d | juros: R$ {it['juros']:.2f} | "
+            f"total: R$ {it['total']:.2f}"
+        )
+    msg.extend(
+        [
+            "",
+            f"Subtotal: R$ {principal:.2f}",
+            f"Juros (3% ao dia): R$ {juros:.2f}",
+            f"Total atualizado: R$ {principal + juros:.2f}",
+            "",
+            "Quando puder, me confirma o pagamento 🙂",
+        ]
+    )
+    texto = chr(10).join(msg)
+    return f"https://wa.me/55{telefone}?text={quote(texto)}"
 
 
 @bp.route("/cobrancas")
 @login_required
 def cobrancas():
-    """Lista pedidos em aberto, calcula juros e oferece link WhatsApp + baixa manual."""
+    """Clientes com saldo em aberto, paginados; os pedidos de cada um vêm de
+    `detalhes_cliente` quando o card é aberto."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute(
-        """
-        SELECT
-            pedidos.id           AS pedido_id,
-            clientes.id          AS cliente_id,
-            clientes.nome        AS cliente_nome,
-            clientes.telefone    AS cliente_telefone,
-            pedidos.data         AS data_pedido,
-            pedidos.vencimento   AS vencimento,
-            pedidos.hora_vencimento AS hora_vencimento,
-            produtos.nome        AS produto_nome,
-            produtos.preco       AS produto_preco,
-            pedidos.quantidade   AS quantidade
-        FROM pedidos
-        JOIN clientes ON clientes.id = pedidos.cliente_id
-        JOIN produtos ON produtos.id = pedidos.produto_id
-        WHERE pedidos.pago = 0 AND pedidos.usuario_id = ?
-        ORDER BY clientes.nome, pedidos.data
-        """,
-        (uid,),
-    )
-    linhas = cur.fetchall()
-
+    r = repo().cobrancas
     hoje = date.today()
+    guardado = saldos_em_dia(hoje)
 
-    por_cliente: dict[int, dict] = {}
+    ordem = request.args.get("ordem", "total")
+    if ordem not in r.ORDENS:
+        ordem = "total"
+    busca = (request.args.get("q") or "").strip()
+    atrasados = request.args.get("atrasados") == "1"
+    try:
+        pagina = max(int(request.args.get("pagina", "1")), 1)
+    except ValueError:
+        pagina = 1
+
+    linhas = r.clientes_em_aberto(
+        uid,
+        ordem=ordem,
+        busca=busca,
+        atrasados_ate=hoje.isoformat() if atrasados else None,
+        limite=COBRANCAS_POR_PAGINA,
+        offset=(pagina - 1) * COBRANCAS_POR_PAGINA,
+    )
+    if not linhas and pagina > 1:
+        # página além do fim (ex.: depois de dar baixa no último cliente)
+        args = {**request.args.to_dict(), "pagina": 1}
+        return redirect(url_for("cobrancas.cobrancas", **args))
+    total_linhas = int(linhas[0]["total_linhas"]) if linhas else 0
 
+    clientes: list[dict] = []
     for row in linhas:
-        pedido_id = int(row["pedido_id"])
-        cliente_id = int(row["cliente_id"])
-        nome = row["cliente_nome"]
-        telefone_raw = row["cliente_telefone"] or ""
-        data_pedido = row["data_pedido"]
-        vencimento_raw = row["vencimento"]
-        hora_vencimento = row["hora_vencimento"] or "09:00"
-        produto = row["produto_nome"]
-        preco = float(row["produto_preco"])
-        qtd = int(row["quantidade"])
-
-        if cliente_id not in por_cliente:
-            por_cliente[cliente_id] = {
-                "cliente_id": cliente_id,
-                "nome": nome,
-                "telefone": telefone_raw,
-                "pedidos": [],
-                "principal": 0.0,
-                "juros": 0.0,
-            }
-
-        principal_item = preco * qtd
-        venc = _vencimento(data_pedido, vencimento_raw)
-        dias = _dias_atraso(hoje, venc)
-        juros_item = _calcular_juros(principal_item, dias)
-        total_item = principal_item + juros_item
-
-        por_cliente[cliente_id]["principal"] += principal_item
-        por_cliente[cliente_id]["juros"] += juros_item
-        por_cliente[cliente_id]["pedidos"].append(
+        venc = row["vencimento"]
+        clientes.append(
             {
-                "pedido_id": pedido_id,
-                "produto": produto,
-                "qtd": qtd,
-                "preco": preco,
-                "principal": principal_item,
-                "vencimento": venc.isoformat(),
-                "dias": dias,
-                "juros": juros_item,
-                "total": total_item,
+                "cliente_id": int(row["cliente_id"]),
+                "nome": row["nome"],
+                "principal": float(row["principal"]),
+                "juros": float(row["juros"]),
+                "pedidos": int(row["pedidos_abertos"]),
+                "dias": dias_de_atraso(hoje, date.fromisoformat(venc)) if venc else 0,
             }
         )
 
-    clientes: list[dict] = []
+    if clientes and not guardado:
+        # juros do último acúmulo estão defasados: recalcula só esta página
+        por_cliente = {c["cliente_id"]: c for c in clientes}
+        for c in clientes:
+            c["principal"] = c["juros"] = 0.0
+        for row in r.abertos(uid, list(por_cliente)):
+            principal, _venc, _dias, juros, _total = _saldo(row, hoje, guardado=False)
+            c = por_cliente[int(row["cliente_id"])]
+            c["principal"] += principal
+            c["juros"] += juros
 
-    for info in por_cliente.values():
-        telefone = apenas_numeros(info["telefone"])
-        principal = float(info["principal"])
-        juros = float(info["juros"])
-        total_final = principal + juros
-
-        # Link WhatsApp só se existir telefone válido
-        link = None
-        if telefone:
-            msg: list[str] = [
-                f"Olá {info['nome']}! 👋",
-                "",
-                "Resumo do seu fiado (em aberto):",
-            ]
-            for it in info["pedidos"]:
-                linha = (
-                    f"- {it['produto']} x{it['qtd']} = R$ {it['principal']:.2f} | "
-                    f"atraso: {it['dias']}d | juros: R$ {it['juros']:.2f} | "
-                    f"total: R$ {it['total']:.2f}"
-                )
-                msg.append(linha)
-
-            msg.extend(
-                [
-                    "",
-                    f"Subtotal: R$ {principal:.2f}",
-                    f"Juros (3% ao dia): R$ {juros:.2f}",
-                    f"Total atualizado: R$ {total_final:.2f}",
-                    "",
-                    "Quando puder, me confirma o pagamento 🙂",
-                ]
-            )
-            texto = chr(10).join(msg)
-            link = f"https://wa.me/55{telefone}?text={quote(texto)}"
-
-        clientes.append(
-            {
-                "cliente_id": info["cliente_id"],
-                "nome": info["nome"],
-                "total": total_final,
-                "principal": principal,
-                "juros": juros,
-                "link_whatsapp": link,
-                "pedidos": info["pedidos"],
-            }
-        )
+    for c in clientes:
+        c["total"] = c["principal"] + c["juros"]
 
     return render_template(
         "cobrancas.html",
         clientes=clientes,
         hoje=hoje.isoformat(),
         taxa_juros_dia=TAXA_JUROS_DIA,
+        ordem=ordem,
+        ordens={"total": "Maior total", "atraso": "Mais atrasados", "nome": "Nome"},
+        busca=busca,
+        atrasados=atrasados,
+        pagina=pagina,
+        paginas=max(-(-total_linhas // COBRANCAS_POR_PAGINA), 1),
+        total_linhas=total_linhas,
     )
 
 
+@bp.route("/cobrancas/cliente/<int:cliente_id>")
+@login_required
+def detalhes_cliente(cliente_id: int):
+    """Pedidos em aberto de um cliente e o link do WhatsApp (JSON)."""
+    linhas = repo().cobrancas.abertos(current_user_id(), [cliente_id])
+    if not linhas:
+        return jsonify({"ok": False, "error": "sem pedidos em aberto"}), 404
+
+    hoje = date.today()
+    guardado = saldos_em_dia(hoje)
+    pedidos = _pedidos_json(linhas, hoje, guardado)
+    primeira = linhas[0]
+    if guardado and primeira["saldo_principal"] is not None:
+        principal = float(primeira["saldo_principal"])
+        juros = float(primeira["saldo_juros"] or 0)
+    else:
+        principal = sum(p["principal"] for p in pedidos)
+        juros = sum(p["juros"] for p in pedidos)
+
+    return jsonify(
+        {
+            "ok": True,
+            "cliente_id": cliente_id,
+            "nome": primeira["cliente_nome"],
+            "principal": principal,
+            "juros": juros,
+            "total": principal + juros,
+            "pedidos": pedidos,
+            "link_whatsapp": _link_whatsapp(
+                primeira["cliente_nome"], primeira["cliente_telefone"], pedidos, principal, juros
+            ),
+        }
+    )
+
 
 @bp.route("/cobrancas/editar/<int:pedido_id>", methods=["POST"])
 @login_required
@@ -203,69 +299,140 @@ def editar_cobranca(pedido_id: int):
     if not re.match(r"^\d{2}:\d{2}$", nova_hora):
         nova_hora = "09:00"
 
-    con = get_db()
-    cur = con.cursor()
-    cur.execute(
-        """
-        UPDATE pedidos
-        SET vencimento = ?, hora_vencimento = ?
-        WHERE id = ? AND usuario_id = ? AND pago = 0
-        """,
-        (nova_data, nova_hora, pedido_id, uid),
-    )
-    con.commit()
+    repo().cobrancas.alterar_vencimento(uid, pedido_id, nova_data, nova_hora)
     return redirect(url_for("cobrancas.cobrancas"))
 
 
+def _baixas(linhas, hoje: date, valor: float | None = None) -> tuple[list[dict], dict | None, float]:
+    """Calcula juros e total de cada pedido, do vencimento mais antigo ao
+    mais novo, e monta as baixas.
+
+    Com `valor` (pagamento parcial), quita os pedidos que o valor cobre por
+    inteiro, nessa ordem, e o que sobrar abate do pedido seguinte. Retorna
+    (baixas, abatimento ou None, troco acima de todo o saldo).
+    """
+    itens = []
+    for row in linhas:
+        _principal, venc, _dias, juros, total = _saldo(row, hoje, guardado=False)
+        itens.append((venc, row["data_pedido"] or "", int(row["pedido_id"]), juros, total))
+    itens.sort()
+
+    baixas, parcial, restante = [], None, valor
+    for _venc, _data, pedido_id, juros, total in itens:
+        if restante is not None:
+            if total > restante + 0.005:
+                if restante > 0.005:
+                    parcial = {"id": pedido_id, "valor": restante, "data": hoje.isoformat()}
+                    restante = 0.0
+                break
+            restante -= total
+        baixas.append({"id": pedido_id, "juros": juros, "data": hoje.isoformat(), "valor": total})
+    return baixas, parcial, max(restante or 0.0, 0.0)
+
+
+def _publicar_baixa(uid: int, linhas, baixas: list[dict], parcial: dict | None = None) -> None:
+    """Avisa as telas ao vivo (um evento por baixa, sempre de um cliente).
+
+    `principal` é o que saiu do principal em aberto: o resto dos pedidos
+    quitados mais o abatimento.
+    """
+    pagos = {b["id"] for b in baixas}
+    baixados = [row for row in linhas if int(row["pedido_id"]) in pagos]
+    abatido = parcial["valor"] if parcial else 0.0
+    publicar(
+        uid,
+        "pedido_pago",
+        pedidos=sorted(pagos),
+        cliente_id=int(linhas[0]["cliente_id"]),
+        principal=round(
+            sum(float(row["valor_principal"] or 0) - float(row["valor_abatido"] or 0)
+                for row in baixados) + abatido,
+            2,
+        ),
+        valor=round(sum(b["valor"] for b in baixas) + abatido, 2),
+        origem="baixa",
+    )
+
+
 @bp.route("/cobrancas/pagar/<int:pedido_id>", methods=["POST"])
 @login_required
 def pagar_pedido(pedido_id: int):
     """Dá baixa em um pedido: marca como pago e registra valor + data."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute(
-        """
-        SELECT
-            pedidos.id         AS pedido_id,
-            pedidos.data       AS data_pedido,
-            pedidos.vencimento AS vencimento,
-            pedidos.quantidade AS quantidade,
-            produtos.preco     AS preco
-        FROM pedidos
-        JOIN produtos ON produtos.id = pedidos.produto_id
-        WHERE pedidos.id = ? AND pedidos.usuario_id = ? AND pedidos.pago = 0
-        """,
-        (pedido_id, uid),
-    )
-    row = cur.fetchone()
+    r = repo().cobrancas
+
+    row = r.aberto(uid, pedido_id)
     if row is None:
         return redirect(url_for("cobrancas.cobrancas"))
 
-    hoje = date.today()
-    data_pedido = row["data_pedido"]
-    vencimento_raw = row["vencimento"]
-    qtd = int(row["quantidade"])
-    preco = float(row["preco"])
-
-    principal = preco * qtd
-    venc = _vencimento(data_pedido, vencimento_raw)
-    dias = _dias_atraso(hoje, venc)
-    juros = _calcular_juros(principal, dias)
-    total = principal + juros
-
-    cur.execute(
-        """
-        UPDATE pedidos
-        SET pago = 1,
-            juros = ?,
-            data_pagamento = ?,
-            valor_pago = ?
-        WHERE id = ? AND usuario_id = ?
-        """,
-        (juros, hoje.isoformat(), total, pedido_id, uid),
-    )
-    con.commit()
+    baixas, _parcial, _troco = _baixas([row], date.today())
+    r.dar_baixa_lote(uid, baixas)
+    _publicar_baixa(uid, [row], baixas)
 
     return redirect(url_for("cobrancas.cobrancas"))
+
+
+@bp.route("/cobrancas/cliente/<int:cliente_id>/pagar", methods=["POST"])
+@login_required
+def pagar_cliente(cliente_id: int):
+    """Baixa em lote: todos os pedidos em aberto do cliente ou os marcados.
+
+    Com "valor", o pagamento parcial quita os pedidos mais antigos primeiro.
+    """
+    uid = current_user_id()
+    r = repo().cobrancas
+
+    linhas = r.abertos(uid, [cliente_id])
+    if request.form.get("escopo") == "marcados":
+        marcados = {int(p) for p in request.form.getlist("pedidos") if p.isdigit()}
+        if not marcados:
+            flash("Marque ao menos um pedido.", "warning")
+            return redirect(url_for("cobrancas.cobrancas"))
+        linhas = [row for row in linhas if int(row["pedido_id"]) in marcados]
+
+    valor = None
+    valor_raw = (request.form.get("valor") or "").strip().replace(",", ".")
+    if valor_raw:
+        try:
+            valor = float(valor_raw)
+            if valor <= 0:
+                raise ValueError
+        except ValueError:
+            flash("Valor inválido.", "warning")
+            return redirect(url_for("cobrancas.cobrancas"))
+
+    baixas, parcial, troco = _baixas(linhas, date.today(), valor)
+    if not baixas and parcial is None:
+        flash("Nenhum pedido em aberto para dar baixa.", "warning")
+        return redirect(url_for("cobrancas.cobrancas"))
+
+    r.dar_baixa_lote(uid, baixas, parcial)
+    _publicar_baixa(uid, linhas, baixas, parcial)
+    recebido = sum(b["valor"] for b in baixas)
+    msg = f"{len(baixas)} pedido(s) baixado(s): R$ {recebido:.2f} ✅"
+    if parcial is not None:
+        msg += f" R$ {parcial['valor']:.2f} abatido(s) do pedido #{parcial['id']}."
+    if troco > 0.005:
+        msg += f" Troco de R$ {troco:.2f} (acima do saldo em aberto)."
+    flash(msg, "success")
+    return redirect(url_for("cobrancas.cobrancas"))
+
+
+@bp.cli.command("acumular-juros")
+def acumular_juros_cli() -> None:
+    """Grava dias de atraso, juros e total dos pedidos em aberto."""
+    for uid, alterados in por_tenant(acumular_juros).items():
+        click.echo(f"{'banco' if uid is None else f'usuario {uid}'}: {alterados} pedido(s) atualizado(s)")
+
+
+@bp.cli.command("verificar-juros")
+def verificar_juros_cli() -> None:
+    """Compara o saldo gravado com o cálculo na hora."""
+    total = 0
+    for uid, divergencias in por_tenant(verificar_juros).items():
+        for d in divergencias:
+            click.echo(f"pedido {d['pedido_id']}: dias {d['dias']} total {d['total']}")
+        total += len(divergencias)
+    if total:
+        raise click.ClickException(f"{total} divergência(s)")
+    click.echo("saldos conferem")
@@ -1,30 +1,428 @@
-"""Camada de banco: conexão SQLite e inicialização/migração simples."""
+"""Camada de banco: conexão SQLite e inicialização/migração simples.
+
+Modo shard (opcional, DB_SHARDS_DIR definido): cada usuário tem seu próprio
+arquivo `usuario_<id>.db` nesse diretório, com os dados do tenant (clientes,
+produtos, pedidos, ...). O banco principal vira o catálogo global: usuários,
+sessões e o roteamento de pagamentos do webhook. Assim a escrita pesada de um
+tenant não segura o lock de escrita dos outros.
+
+- `get_db()`: banco do tenant da request (usuário logado ou `usar_tenant`).
+- `get_catalogo()`: banco global. Sem shards, é a mesma conexão do get_db().
+
+Leitores e escritor: o banco roda em WAL e as duas funções acima devolvem uma
+`ConexaoRoteada`. SELECTs fora de transação vão para um pool de conexões só
+leitura (`mode=ro` + `query_only`), que não esperam nem bloqueiam a escrita;
+por isso os GETs (dashboard, pedidos, cobranças, financeiro) nunca seguram o
+lock. O primeiro statement de escrita entra na fila do escritor: uma única
+conexão de escrita por arquivo e processo, uma transação por vez, até o
+commit/rollback. Relatórios longos não seguram a criação de pedidos.
+
+- DB_LEITORES: leitores ociosos guardados por arquivo. Default 8; 0 desliga
+  o roteamento (uma conexão de leitura e escrita por request, como antes).
+- DB_ESCRITA_TIMEOUT: espera máxima (s) pela vez de escrever. Default 30.
+- DB_WAL: 1 (default) liga o journal_mode=WAL.
+"""
 
 from __future__ import annotations
 
 import os
+import re
 import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+
+from flask import g, has_request_context, session
 
-from flask import g
+from .instrumentacao import ConexaoInstrumentada
+from .metricas import db_espera_escrita
 
 DB_NAME = "database.db"
 
+# Versão do schema gravada em PRAGMA user_version. Suba ao mudar o init_db():
+# bancos já na versão atual pulam todas as checagens no boot.
+SCHEMA_VERSAO = 11
+
+DB_LEITORES = int(os.getenv("DB_LEITORES", "8"))
+DB_ESCRITA_TIMEOUT = float(os.getenv("DB_ESCRITA_TIMEOUT", "30"))
+DB_WAL = os.getenv("DB_WAL", "1") == "1"
+
+
+def caminho_db() -> str:
+    """Caminho do arquivo SQLite principal (DATABASE_PATH sobrescreve)."""
+    caminho = os.getenv("DATABASE_PATH", "").strip()
+    if caminho:
+        return caminho
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, DB_NAME)
+
+
+def dir_shards() -> str:
+    """Diretório dos shards por usuário (vazio = modo shard desligado)."""
+    return os.getenv("DB_SHARDS_DIR", "").strip()
+
+
+def shards_ativos() -> bool:
+    """Indica se cada usuário tem seu próprio arquivo de banco."""
+    return bool(dir_shards())
+
+
+def caminho_shard(usuario_id: int) -> str:
+    """Arquivo do shard de um usuário."""
+    return os.path.join(dir_shards(), f"usuario_{int(usuario_id)}.db")
+
+
+# Shards cujo schema já foi conferido neste processo
+_shards_prontos: set[str] = set()
+_shards_lock = threading.Lock()
+
+
+# Arquivos já colocados em WAL neste processo
+_wal_prontos: set[str] = set()
+
+
+def conectar(usuario_id: int | None = None, leitura: bool = False) -> sqlite3.Connection:
+    """Abre uma conexão nova (fora do ciclo da request, ex.: jobs).
+
+    Com shards ativos e `usuario_id` informado, abre o shard do usuário
+    (criando o arquivo e o schema na primeira vez); senão, o banco principal.
+    Com `leitura=True` a conexão é só leitura (`mode=ro` + `query_only`).
+    """
+    shard = shards_ativos() and usuario_id is not None
+    caminho = caminho_shard(usuario_id) if shard else caminho_db()
+    if leitura:
+        if shard and caminho not in _shards_prontos:
+            conectar(usuario_id).close()  # cria o shard antes de abrir só leitura
+        con = sqlite3.connect(
+            Path(caminho).absolute().as_uri() + "?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            factory=ConexaoInstrumentada,
+        )
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA query_only = ON")
+        return con
+
+    if shard and caminho not in _shards_prontos:
+        os.makedirs(dir_shards(), exist_ok=True)
+    novo = caminho not in _wal_prontos and not os.path.exists(caminho)
+    con = sqlite3.connect(
+        caminho, check_same_thread=False, factory=ConexaoInstrumentada
+    )
+    con.row_factory = sqlite3.Row
+    if novo:
+        # o arquivamento devolve as páginas livres aos poucos (ver
+        # arquivo.py); só vale antes do WAL e da primeira tabela
+        con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    if DB_WAL and caminho not in _wal_prontos:
+        try:
+            con.execute("PRAGMA journal_mode = WAL")  # persistente no arquivo
+            _wal_prontos.add(caminho)
+        except sqlite3.OperationalError:
+            pass  # outro processo no meio de uma escrita: tenta na próxima
+    if shard and caminho not in _shards_prontos:
+        with _shards_lock:
+            _aplicar_schema(con)
+            _shards_prontos.add(caminho)
+    return con
+
+
+# ---------------------------------------------------------------------------
+# Pool de leitores e fila do escritor (por arquivo, por processo)
+# ---------------------------------------------------------------------------
+class _Escritor:
+    """A conexão de escrita de um arquivo e a fila de quem quer escrever."""
+
+    def __init__(self, con: sqlite3.Connection):
+        self.con = con
+        # RLock: dois contextos aninhados na mesma thread não se travam
+        self.lock = threading.RLock()
+
+
+_pools_lock = threading.Lock()
+_leitores: dict[str, list[sqlite3.Connection]] = {}
+_escritores: dict[str, _Escritor] = {}
+# Conexões herdadas do processo pai: nunca fechadas no filho (o close no
+# filho mexeria no WAL que o pai ainda usa), só mantidas vivas.
+_herdadas: list = []
+
+
+def _reiniciar_no_filho() -> None:
+    """Conexões não atravessam o fork: cada worker abre as suas."""
+    global _pools_lock
+    _herdadas.extend(_escritores.values())
+    _herdadas.extend(_leitores.values())
+    _pools_lock = threading.Lock()
+    _escritores.clear()
+    _leitores.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_no_filho)
+
+
+def _escritor(caminho: str, usuario_id: int | None) -> _Escritor:
+    esc = _escritores.get(caminho)
+    if esc is None:
+        with _pools_lock:
+            esc = _escritores.get(caminho)
+            if esc is None:
+                esc = _Escritor(conectar(usuario_id))
+                _escritores[caminho] = esc
+    return esc
+
+
+def _pegar_leitor(caminho: str, usuario_id: int | None) -> sqlite3.Connection:
+    # o escritor cria o arquivo/schema e mantém o -wal/-shm do WAL abertos
+    _escritor(caminho, usuario_id)
+    with _pools_lock:
+        livres = _leitores.get(caminho)
+        if livres:
+            return livres.pop()
+    return conectar(usuario_id, leitura=True)
+
+
+def _devolver_leitor(caminho: str, con: sqlite3.Connection) -> None:
+    with _pools_lock:
+        livres = _leitores.setdefault(caminho, [])
+        if len(livres) < DB_LEITORES:
+            livres.append(con)
+            return
+    con.close()
+
+
+_RE_LEITURA = re.compile(r"^\s*(SELECT|WITH|EXPLAIN)\b", re.IGNORECASE)
+_RE_DML = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def _eh_leitura(sql: str) -> bool:
+    """SELECT/WITH sem DML: pode ir para um leitor."""
+    return bool(_RE_LEITURA.match(sql)) and not _RE_DML.search(sql)
+
+
+class ConexaoRoteada:
+    """Conexão da request: leitura no pool, escrita na fila do escritor.
+
+    Fora de transação, SELECTs vão para um leitor. O primeiro statement de
+    escrita espera a vez na fila do escritor do arquivo; daí até o commit ou
+    rollback tudo (inclusive SELECT) roda na conexão de escrita, que enxerga
+    o que a própria transação já escreveu.
+    """
+
+    def __init__(self, caminho: str, usuario_id: int | None):
+        self._caminho = caminho
+        self._usuario_id = usuario_id
+        self._leitor: sqlite3.Connection | None = None
+        # cursores abertos no leitor: um SELECT não esgotado prende o
+        # snapshot do WAL, então são fechados antes de voltar ao pool
+        self._cursores: weakref.WeakSet = weakref.WeakSet()
+        self._vez: _Escritor | None = None  # escritor enquanto for a nossa vez
+
+    def _para_leitura(self) -> sqlite3.Connection:
+        if self._vez is not None:
+            return self._vez.con
+        if self._leitor is None:
+            self._leitor = _pegar_leitor(self._caminho, self._usuario_id)
+        return self._leitor
+
+    def _para_escrita(self) -> sqlite3.Connection:
+        if self._vez is None:
+            esc = _escritor(self._caminho, self._usuario_id)
+            inicio = time.perf_counter()
+            if not esc.lock.acquire(timeout=DB_ESCRITA_TIMEOUT):
+                raise sqlite3.OperationalError("database is locked (fila de escrita)")
+            db_espera_escrita.observe(time.perf_counter() - inicio)
+            self._vez = esc
+        return self._vez.con
+
+    def _conexao(self, sql: str) -> sqlite3.Connection:
+        return self._para_leitura() if _eh_leitura(sql) else self._para_escrita()
+
+    def _cursor(self, sql: str) -> sqlite3.Cursor:
+        cur = self._conexao(sql).cursor()
+        if self._vez is None:
+            self._cursores.add(cur)
+        return cur
+
+    def _liberar(self) -> None:
+        esc, self._vez = self._vez, None
+        if esc is not None:
+            esc.lock.release()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._vez is not None and self._vez.con.in_transaction
+
+    def execute(self, sql, params=()):
+        return self._cursor(sql).execute(sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self._para_escrita().executemany(sql, seq_params)
+
+    def cursor(self) -> "CursorRoteado":
+        return CursorRoteado(self)
+
+    def commit(self) -> None:
+        if self._vez is None:
+            return
+        try:
+            self._vez.con.commit()
+        except sqlite3.Error:
+            self._vez.con.rollback()  # não passa a transação para o próximo
+            raise
+        finally:
+            self._liberar()
+
+    def rollback(self) -> None:
+        if self._vez is None:
+            return
+        try:
+            self._vez.con.rollback()
+        finally:
+            self._liberar()
+
+    def close(self) -> None:
+        """Descarta o que não foi commitado e devolve o leitor ao pool."""
+        self.rollback()
+        leitor, self._leitor = self._leitor, None
+        if leitor is not None:
+            for cur in list(self._cursores):
+                cur.close()
+            self._cursores.clear()
+            _devolver_leitor(self._caminho, leitor)
+
+
+class CursorRoteado:
+    """Cursor da `ConexaoRoteada`: cada execute escolhe a conexão."""
+
+    def __init__(self, con: ConexaoRoteada):
+        self._con = con
+        self._cur: sqlite3.Cursor | None = None
+
+    def execute(self, sql, params=()):
+        self._cur = self._con._cursor(sql)
+        self._cur.execute(sql, params)
+        return self
+
+    def executemany(self, sql, seq_params):
+        self._cur = self._con._para_escrita().cursor()
+        self._cur.executemany(sql, seq_params)
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        return self._cur.fetchmany(size)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self) -> None:
+        if self._cur is not None:
+            self._cur.close()
+
+
+def _abrir(usuario_id: int | None):
+    """Conexão de request para o banco do tenant (ou o principal)."""
+    if DB_LEITORES <= 0:
+        return conectar(usuario_id)
+    shard = shards_ativos() and usuario_id is not None
+    if not shard:
+        return ConexaoRoteada(caminho_db(), None)
+    return ConexaoRoteada(caminho_shard(usuario_id), usuario_id)
+
+
+def tenant_atual() -> int | None:
+    """Usuário dono dos dados da request (só importa no modo shard)."""
+    if "tenant_id" in g:
+        return g.tenant_id
+    if has_request_context():
+        user_id = session.get("user_id")
+        return int(user_id) if user_id is not None else None
+    return None
+
+
+def usar_tenant(usuario_id: int) -> None:
+    """Aponta o `get_db()` deste contexto para o tenant informado.
+
+    Para rotas sem login (loja, webhook), jobs e comandos CLI.
+    """
+    g.tenant_id = int(usuario_id)
+    if shards_ativos():
+        db = g.pop("db", None)
+        if db is not None:
+            db.close()
+
 
 def get_db() -> sqlite3.Connection:
     """Retorna a conexão SQLite para a request atual."""
     if "db" not in g:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        db_path = os.path.join(base_dir, DB_NAME)
-        g.db = sqlite3.connect(db_path, check_same_thread=False)
-        g.db.row_factory = sqlite3.Row
+        g.db = _abrir(tenant_atual() if shards_ativos() else None)
     return g.db
 
 
+def get_catalogo() -> sqlite3.Connection:
+    """Conexão com o banco global (usuários, sessões, roteamento)."""
+    if not shards_ativos():
+        return get_db()
+    if "catalogo" not in g:
+        g.catalogo = _abrir(None)
+    return g.catalogo
+
+
+def listar_tenants() -> list[int]:
+    """Ids de todos os usuários (um shard cada, no modo shard)."""
+    return [
+        int(r["id"])
+        for r in get_catalogo().execute("SELECT id FROM usuarios ORDER BY id")
+    ]
+
+
+def registrar_pagamento(payment_id: str, usuario_id: int) -> None:
+    """Guarda no catálogo de qual tenant é a cobrança (para o webhook)."""
+    if not shards_ativos() or not payment_id:
+        return
+    cat = get_catalogo()
+    cat.execute(
+        "INSERT OR REPLACE INTO pagamentos_tenant (asaas_payment_id, usuario_id) "
+        "VALUES (?, ?)",
+        (payment_id, int(usuario_id)),
+    )
+    cat.commit()
+
+
+def tenant_do_pagamento(payment_id: str) -> int | None:
+    """Tenant dono de uma cobrança do Asaas (None se desconhecida)."""
+    row = get_catalogo().execute(
+        "SELECT usuario_id FROM pagamentos_tenant WHERE asaas_payment_id = ?",
+        (payment_id,),
+    ).fetchone()
+    return int(row["usuario_id"]) if row else None
+
+
 def close_db(_exception=None) -> None:
-    """Fecha a conexão do banco ao final da request."""
-    db = g.pop("db", None)
-    if db is not None:
-        db.close()
+    """Fecha as conexões do banco ao final da request."""
+    for chave in ("db", "catalogo"):
+        db = g.pop(chave, None)
+        if db is not None:
+            db.close()
 
 
 def coluna_existe(cursor: sqlite3.Cursor, tabela: str, coluna: str) -> bool:
@@ -34,11 +432,544 @@ def coluna_existe(cursor: sqlite3.Cursor, tabela: str, coluna: str) -> bool:
     return coluna in cols
 
 
+def tabela_existe(cursor: sqlite3.Cursor, tabela: str) -> bool:
+    """Verifica se uma tabela (ou tabela virtual) existe."""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (tabela,),
+    )
+    return cursor.fetchone() is not None
+
+
+# Índices de busca (FTS5) espelhando clientes/produtos. O `usuario_id` entra
+# como coluna indexada para o MATCH já filtrar pelo dono; `remove_diacritics`
+# faz "joao" achar "João".
+_FTS = {
+    "clientes": ("usuario_id", "nome", "telefone"),
+    "produtos": ("usuario_id", "nome"),
+}
+
+
+def _criar_busca(cur: sqlite3.Cursor) -> None:
+    """Cria as tabelas FTS5 e os triggers que as mantêm sincronizadas."""
+    for tabela, colunas in _FTS.items():
+        fts = f"{tabela}_fts"
+        cols = ", ".join(colunas)
+        novos = ", ".join(f"new.{c}" for c in colunas)
+        velhos = ", ".join(f"old.{c}" for c in colunas)
+        nova_tabela = not tabela_existe(cur, fts)
+
+        cur.execute(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols},
+                content='{tabela}',
+                content_rowid='id',
+                tokenize="unicode61 remove_diacritics 2",
+                prefix='2 3'
+            )
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabela} BEGIN
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {novos});
+            END
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabela} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols})
+                VALUES ('delete', old.id, {velhos});
+            END
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {tabela} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols})
+                VALUES ('delete', old.id, {velhos});
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {novos});
+            END
+            """
+        )
+        if nova_tabela:
+            cur.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+# Rollup diário do financeiro, mantido por triggers em `pedidos`: por
+# (usuário, dia do pagamento) guarda recebido, juros, quantidade de
+# pagamentos e a soma dos dias entre pedido e pagamento. A
+# `financeiro_versao` do usuário sobe a cada pedido criado, pago, estornado
+# ou apagado e invalida o cache do painel em todos os processos.
+def _sql_rollup(linha: str, sinal: str) -> str:
+    return f"""
+        INSERT INTO financeiro_diario
+            (usuario_id, dia, recebido, juros, pagamentos, dias_para_pagar)
+        SELECT
+            {linha}.usuario_id,
+            substr({linha}.data_pagamento, 1, 10),
+            {sinal} COALESCE({linha}.valor_pago, 0),
+            {sinal} COALESCE({linha}.juros, 0),
+            {sinal} 1,
+            {sinal} COALESCE(CAST(
+                julianday(substr({linha}.data_pagamento, 1, 10))
+                - julianday(substr({linha}.data, 1, 10)) AS INTEGER), 0)
+        WHERE {linha}.pago = 1
+          AND {linha}.data_pagamento IS NOT NULL
+          AND {linha}.usuario_id IS NOT NULL
+        ON CONFLICT (usuario_id, dia) DO UPDATE SET
+            recebido = recebido + excluded.recebido,
+            juros = juros + excluded.juros,
+            pagamentos = pagamentos + excluded.pagamentos,
+            dias_para_pagar = dias_para_pagar + excluded.dias_para_pagar;
+    """
+
+
+def _sql_versao(linha: str) -> str:
+    return f"""
+        INSERT INTO financeiro_versao (usuario_id, versao)
+        SELECT {linha}.usuario_id, 1 WHERE {linha}.usuario_id IS NOT NULL
+        ON CONFLICT (usuario_id) DO UPDATE SET versao = versao + 1;
+    """
+
+
+def recalcular_financeiro(con, usuario_id: int | None = None) -> None:
+    """Refaz o rollup a partir dos pedidos, arquivo incluso (um usuário ou todos)."""
+    filtro, params = ("AND usuario_id = ?", (usuario_id,)) if usuario_id else ("", ())
+    con.execute(f"DELETE FROM financeiro_diario WHERE 1 = 1 {filtro}", params)
+    con.execute(
+        f"""
+        INSERT INTO financeiro_diario
+            (usuario_id, dia, recebido, juros, pagamentos, dias_para_pagar)
+        SELECT
+            usuario_id,
+            substr(data_pagamento, 1, 10),
+            SUM(COALESCE(valor_pago, 0)),
+            SUM(COALESCE(juros, 0)),
+            COUNT(*),
+            SUM(COALESCE(CAST(
+                julianday(substr(data_pagamento, 1, 10))
+                - julianday(substr(data, 1, 10)) AS INTEGER), 0))
+        FROM pedidos_todos
+        WHERE pago = 1 AND data_pagamento IS NOT NULL AND usuario_id IS NOT NULL
+          {filtro}
+        GROUP BY usuario_id, substr(data_pagamento, 1, 10)
+        """,
+        params,
+    )
+    con.execute(
+        f"""
+        INSERT INTO financeiro_versao (usuario_id, versao)
+        SELECT DISTINCT usuario_id, 1 FROM pedidos_todos
+        WHERE usuario_id IS NOT NULL {filtro}
+        ON CONFLICT (usuario_id) DO UPDATE SET versao = versao + 1
+        """,
+        params,
+    )
+
+
+def _criar_financeiro(cur: sqlite3.Cursor) -> None:
+    """Tabelas do rollup do financeiro e os triggers que o mantêm."""
+    nova_tabela = not tabela_existe(cur, "financeiro_diario")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS financeiro_diario (
+            usuario_id INTEGER NOT NULL,
+            dia TEXT NOT NULL,
+            recebido REAL NOT NULL DEFAULT 0,
+            juros REAL NOT NULL DEFAULT 0,
+            pagamentos INTEGER NOT NULL DEFAULT 0,
+            dias_para_pagar INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (usuario_id, dia)
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS financeiro_versao (
+            usuario_id INTEGER PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS financeiro_ai AFTER INSERT ON pedidos BEGIN
+            {_sql_rollup("new", "+")}
+            {_sql_versao("new")}
+        END
+        """
+    )
+    # O pedido arquivado já foi copiado para `pedidos_arquivo`: sair da
+    # tabela quente não mexe no histórico do rollup
+    cur.execute("DROP TRIGGER IF EXISTS financeiro_ad")
+    cur.execute(
+        f"""
+        CREATE TRIGGER financeiro_ad AFTER DELETE ON pedidos
+        WHEN NOT EXISTS (SELECT 1 FROM pedidos_arquivo WHERE id = old.id)
+        BEGIN
+            {_sql_rollup("old", "-")}
+            {_sql_versao("old")}
+        END
+        """
+    )
+    # Juros recalculados em pedidos em aberto não mexem no rollup
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS financeiro_au
+        AFTER UPDATE OF usuario_id, data, pago, valor_pago, juros, data_pagamento
+        ON pedidos
+        WHEN old.pago = 1 OR new.pago = 1 OR old.usuario_id IS NOT new.usuario_id
+        BEGIN
+            {_sql_rollup("old", "-")}
+            {_sql_rollup("new", "+")}
+            {_sql_versao("old")}
+            {_sql_versao("new")}
+        END
+        """
+    )
+    if nova_tabela:
+        recalcular_financeiro(cur)
+
+
+# Saldo em aberto por cliente ("quanto eu devo"), mantido pelos triggers
+# abaixo na mesma transação que cria, paga, abate, estorna ou reacumula o
+# pedido (loja, webhook, baixa manual, job de juros). O principal é o do
+# pedido menos o que já foi abatido por pagamentos parciais. O job de juros
+# também o reconstrói por inteiro (`SQL_SALDOS_*`), zerando arredondamentos.
+def _sql_saldo(linha: str, sinal: str) -> str:
+    return f"""
+        INSERT INTO clientes_saldo
+            (cliente_id, usuario_id, principal, juros, total, pedidos_abertos)
+        SELECT
+            {linha}.cliente_id,
+            {linha}.usuario_id,
+            {sinal} v.principal,
+            {sinal} v.juros,
+            {sinal} (v.principal + v.juros),
+            {sinal} 1
+        FROM (
+            SELECT
+                COALESCE(
+                    {linha}.valor_principal,
+                    (SELECT preco FROM produtos WHERE id = {linha}.produto_id)
+                        * COALESCE({linha}.quantidade, 0),
+                    0
+                ) - COALESCE({linha}.valor_abatido, 0) AS principal,
+                COALESCE({linha}.juros, 0) AS juros
+        ) AS v
+        WHERE {linha}.pago = 0
+          AND EXISTS (SELECT 1 FROM clientes WHERE id = {linha}.cliente_id)
+        ON CONFLICT (cliente_id) DO UPDATE SET
+            principal = clientes_saldo.principal + excluded.principal,
+            juros = clientes_saldo.juros + excluded.juros,
+            total = clientes_saldo.total + excluded.total,
+            pedidos_abertos = clientes_saldo.pedidos_abertos + excluded.pedidos_abertos;
+    """
+
+
+# Reconstrução (portável: SQLite e Postgres; `{filtro}` = "" ou por usuário)
+SQL_SALDOS_APAGAR = "DELETE FROM clientes_saldo WHERE 1 = 1{filtro}"
+SQL_SALDOS_INSERIR = """
+    INSERT INTO clientes_saldo
+        (cliente_id, usuario_id, principal, juros, total, pedidos_abertos)
+    SELECT cliente_id, MAX(usuario_id), SUM(principal), SUM(juros),
+           SUM(principal + juros), COUNT(*)
+    FROM (
+        SELECT
+            p.cliente_id AS cliente_id,
+            p.usuario_id AS usuario_id,
+            COALESCE(p.valor_principal, pr.preco * COALESCE(p.quantidade, 0), 0)
+                - COALESCE(p.valor_abatido, 0) AS principal,
+            COALESCE(p.juros, 0) AS juros
+        FROM pedidos p
+        JOIN clientes c ON c.id = p.cliente_id
+        LEFT JOIN produtos pr ON pr.id = p.produto_id
+        WHERE p.pago = 0{filtro}
+    ) AS abertos
+    GROUP BY cliente_id
+"""
+
+
+def _criar_saldos(cur: sqlite3.Cursor) -> None:
+    """Tabela `clientes_saldo` e os triggers que a mantêm."""
+    nova_tabela = not tabela_existe(cur, "clientes_saldo")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS clientes_saldo (
+            cliente_id INTEGER PRIMARY KEY,
+            usuario_id INTEGER,
+            principal REAL NOT NULL DEFAULT 0,
+            juros REAL NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            pedidos_abertos INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    # top devedores e ordem da lista de cobranças
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_clientes_saldo_usuario_total "
+        "ON clientes_saldo (usuario_id, total DESC)"
+    )
+    # recriados: a versão 11 passou a descontar `valor_abatido`
+    for gatilho in ("saldo_ai", "saldo_ad", "saldo_au"):
+        cur.execute(f"DROP TRIGGER IF EXISTS {gatilho}")
+    cur.execute(
+        f"""
+        CREATE TRIGGER saldo_ai AFTER INSERT ON pedidos BEGIN
+            {_sql_saldo("new", "+")}
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER saldo_ad AFTER DELETE ON pedidos BEGIN
+            {_sql_saldo("old", "-")}
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER saldo_au
+        AFTER UPDATE OF usuario_id, cliente_id, produto_id, quantidade, pago,
+                        valor_principal, valor_abatido, juros
+        ON pedidos
+        WHEN old.pago = 0 OR new.pago = 0
+        BEGIN
+            {_sql_saldo("old", "-")}
+            {_sql_saldo("new", "+")}
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS saldo_clientes_ad AFTER DELETE ON clientes BEGIN
+            DELETE FROM clientes_saldo WHERE cliente_id = old.id;
+        END
+        """
+    )
+    if nova_tabela:
+        cur.execute(SQL_SALDOS_INSERIR.format(filtro=""))
+
+
+def _criar_itens(cur: sqlite3.Cursor) -> None:
+    """Itens dos pedidos (um pedido = um carrinho).
+
+    Pedidos antigos guardavam um produto por linha (`produto_id` e
+    `quantidade` em `pedidos`): na criação da tabela cada um ganha o seu
+    item e o principal gravado. Para juntar os carrinhos antigos num pedido
+    só: `flask --app run pedidos agrupar`.
+    """
+    nova_tabela = not tabela_existe(cur, "pedido_itens")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pedido_itens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pedido_id INTEGER NOT NULL,
+            usuario_id INTEGER,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pedido_itens_pedido ON pedido_itens (pedido_id)"
+    )
+    if nova_tabela:
+        cur.execute(
+            """
+            INSERT INTO pedido_itens (pedido_id, usuario_id, produto_id, quantidade)
+            SELECT id, usuario_id, produto_id, COALESCE(quantidade, 0)
+            FROM pedidos
+            WHERE produto_id IS NOT NULL
+            """
+        )
+        cur.execute(
+            """
+            UPDATE pedidos
+            SET valor_principal = (SELECT preco FROM produtos WHERE id = pedidos.produto_id)
+                                  * COALESCE(quantidade, 0)
+            WHERE valor_principal IS NULL AND produto_id IS NOT NULL
+            """
+        )
+
+
+# Colunas de `pedidos`, na ordem de `pedidos_arquivo` (cópia e views)
+COLUNAS_PEDIDOS = (
+    "id", "usuario_id", "cliente_id", "produto_id", "quantidade", "data",
+    "vencimento", "hora_vencimento", "pago", "juros", "data_pagamento",
+    "valor_pago", "asaas_customer_id", "asaas_payment_id", "asaas_invoice_url",
+    "pix_payload", "pix_qr_code", "asaas_status", "whatsapp_enviado",
+    "whatsapp_enviado_em", "valor_principal", "dias_atraso", "total_atualizado",
+    "valor_abatido",
+)
+COLUNAS_ITENS = ("id", "pedido_id", "usuario_id", "produto_id", "quantidade")
+
+
+def _criar_arquivo(cur: sqlite3.Cursor) -> None:
+    """Partição fria: pedidos pagos há muito tempo (ver arquivo.py).
+
+    As views `pedidos_todos` e `pedido_itens_todos` juntam as duas partes
+    para relatórios de histórico; o resto do sistema lê só a tabela quente.
+    """
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pedidos_arquivo (
+            id INTEGER PRIMARY KEY,
+            usuario_id INTEGER,
+            cliente_id INTEGER,
+            produto_id INTEGER,
+            quantidade INTEGER,
+            data TEXT,
+            vencimento TEXT,
+            hora_vencimento TEXT,
+            pago INTEGER,
+            juros REAL,
+            data_pagamento TEXT,
+            valor_pago REAL,
+            asaas_customer_id TEXT,
+            asaas_payment_id TEXT,
+            asaas_invoice_url TEXT,
+            pix_payload TEXT,
+            pix_qr_code TEXT,
+            asaas_status TEXT,
+            whatsapp_enviado INTEGER,
+            whatsapp_enviado_em TEXT,
+            valor_principal REAL,
+            dias_atraso INTEGER,
+            total_atualizado REAL,
+            arquivado_em TEXT,
+            valor_abatido REAL
+        )
+        """
+    )
+    if not coluna_existe(cur, "pedidos_arquivo", "valor_abatido"):
+        cur.execute("ALTER TABLE pedidos_arquivo ADD COLUMN valor_abatido REAL")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pedido_itens_arquivo (
+            id INTEGER PRIMARY KEY,
+            pedido_id INTEGER NOT NULL,
+            usuario_id INTEGER,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL
+        )
+        """
+    )
+    # exportações por período e totais do dashboard (cobrindo o principal)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_arquivo_usuario_data "
+        "ON pedidos_arquivo (usuario_id, data, valor_principal)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_arquivo_usuario_pagamento "
+        "ON pedidos_arquivo (usuario_id, data_pagamento)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pedido_itens_arquivo_pedido "
+        "ON pedido_itens_arquivo (pedido_id)"
+    )
+    for view, tabela, colunas in (
+        ("pedidos_todos", "pedidos", COLUNAS_PEDIDOS),
+        ("pedido_itens_todos", "pedido_itens", COLUNAS_ITENS),
+    ):
+        cols = ", ".join(colunas)
+        cur.execute(f"DROP VIEW IF EXISTS {view}")
+        cur.execute(
+            f"CREATE VIEW {view} AS SELECT {cols} FROM {tabela} "
+            f"UNION ALL SELECT {cols} FROM {tabela}_arquivo"
+        )
+
+
+def _criar_fila(cur: sqlite3.Cursor) -> None:
+    """Fila de jobs do worker (ver fila.py); só o banco principal usa."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fila_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tarefa TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            prioridade INTEGER NOT NULL DEFAULT 0,
+            executar_em REAL NOT NULL,
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            max_tentativas INTEGER NOT NULL,
+            trabalhador TEXT,
+            ultimo_erro TEXT,
+            criado_em REAL NOT NULL
+        )
+        """
+    )
+    # pronto = executar_em no passado (inclui lease vencido)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_fila_jobs_executar_em ON fila_jobs (executar_em)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_fila_jobs_tarefa ON fila_jobs (tarefa)"
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fila_mortos (
+            id INTEGER PRIMARY KEY,
+            tarefa TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            prioridade INTEGER NOT NULL,
+            tentativas INTEGER NOT NULL,
+            max_tentativas INTEGER NOT NULL,
+            ultimo_erro TEXT,
+            criado_em REAL NOT NULL,
+            morto_em REAL NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fila_agenda (
+            nome TEXT PRIMARY KEY,
+            proxima REAL NOT NULL
+        )
+        """
+    )
+
+
+def _criar_eventos(cur: sqlite3.Cursor) -> None:
+    """Mudanças para as telas ao vivo (ver eventos.py); só o banco principal."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            dados TEXT NOT NULL DEFAULT '{}',
+            criado_em REAL NOT NULL
+        )
+        """
+    )
+    # a leitura é por id (AUTOINCREMENT: nunca reaproveitado); este é da limpeza
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_eventos_criado_em ON eventos (criado_em)"
+    )
+
+
 def init_db() -> None:
-    """Cria tabelas e aplica migrações simples."""
-    con = get_db()
+    """Cria tabelas e aplica migrações simples no banco principal."""
+    # Conexão avulsa: no master do gunicorn nada fica aberto para o fork
+    con = conectar()
+    try:
+        _aplicar_schema(con)
+    finally:
+        con.close()
+
+
+def _aplicar_schema(con: sqlite3.Connection) -> None:
+    """Schema completo (banco principal e shards usam o mesmo)."""
     cur = con.cursor()
 
+    cur.execute("PRAGMA user_version")
+    if cur.fetchone()[0] >= SCHEMA_VERSAO:
+        return
+
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS usuarios (
@@ -93,7 +1024,49 @@ def init_db() -> None:
             pix_qr_code TEXT,
             asaas_status TEXT,
             whatsapp_enviado INTEGER DEFAULT 0,
-            whatsapp_enviado_em TEXT
+            whatsapp_enviado_em TEXT,
+            valor_principal REAL,
+            dias_atraso INTEGER,
+            total_atualizado REAL,
+            valor_abatido REAL
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sessoes (
+            id TEXT PRIMARY KEY,
+            usuario_id INTEGER,
+            dados TEXT NOT NULL,
+            criado_em REAL NOT NULL,
+            expira_em REAL NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sessoes_usuario ON sessoes (usuario_id)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sessoes_expira ON sessoes (expira_em)"
+    )
+
+    # Marcas de controle dos jobs (ex.: último acúmulo de juros)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS controle (
+            chave TEXT PRIMARY KEY,
+            valor TEXT
+        )
+        """
+    )
+
+    # Catálogo (modo shard): de qual tenant é cada cobrança do Asaas
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pagamentos_tenant (
+            asaas_payment_id TEXT PRIMARY KEY,
+            usuario_id INTEGER NOT NULL
         )
         """
     )
@@ -114,7 +1087,7 @@ def init_db() -> None:
     migracoes = [
         ("clientes", ["usuario_id"]),
         ("produtos", ["usuario_id"]),
-        ("pedidos", ["usuario_id", "vencimento", "hora_vencimento", "juros", "data_pagamento", "valor_pago", "asaas_customer_id", "asaas_payment_id", "asaas_invoice_url", "pix_payload", "pix_qr_code", "asaas_status", "whatsapp_enviado", "whatsapp_enviado_em"]),
+        ("pedidos", ["usuario_id", "vencimento", "hora_vencimento", "juros", "data_pagamento", "valor_pago", "asaas_customer_id", "asaas_payment_id", "asaas_invoice_url", "pix_payload", "pix_qr_code", "asaas_status", "whatsapp_enviado", "whatsapp_enviado_em", "valor_principal", "dias_atraso", "total_atualizado", "valor_abatido"]),
         ("estoque", ["usuario_id", "produto_id", "quantidade", "minimo"]),
     ]
 
@@ -128,12 +1101,13 @@ def init_db() -> None:
                     cur.execute(
                         f"ALTER TABLE {tabela} ADD COLUMN {col} TEXT"
                     )
-                elif col in ("juros", "valor_pago"):
+                elif col in ("juros", "valor_pago", "valor_principal", "total_atualizado", "valor_abatido"):
                     cur.execute(
                         f"ALTER TABLE {tabela} ADD COLUMN {col} REAL"
                     )
                 elif col in (
-                    "quantidade", "minimo", "usuario_id", "produto_id", "whatsapp_enviado"
+                    "quantidade", "minimo", "usuario_id", "produto_id", "whatsapp_enviado",
+                    "dias_atraso",
                 ):
                     cur.execute(
                         f"ALTER TABLE {tabela} ADD COLUMN {col} INTEGER"
@@ -146,4 +1120,50 @@ def init_db() -> None:
             # Se algo não existir (banco antigo), seguimos sem quebrar.
             pass
 
-    con.commit()
\ No newline at end of file
+    # Índices (depois das migrações: bancos antigos ganham as colunas antes)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_usuario_data "
+        "ON pedidos (usuario_id, data)"
+    )
+
+    # Deduplicação da importação em massa (e busca por telefone na loja)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_clientes_usuario_telefone "
+        "ON clientes (usuario_id, telefone)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_produtos_usuario_nome "
+        "ON produtos (usuario_id, nome)"
+    )
+
+    # Painel financeiro: pagos por usuário em ordem de data_pagamento
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_usuario_pago_pagamento "
+        "ON pedidos (usuario_id, pago, data_pagamento)"
+    )
+    _criar_itens(cur)
+    _criar_arquivo(cur)
+    _criar_financeiro(cur)
+    _criar_saldos(cur)
+    _criar_fila(cur)
+    _criar_eventos(cur)
+
+    # Job de juros e de WhatsApp: só os pedidos em aberto
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_abertos_vencimento "
+        "ON pedidos (vencimento) WHERE pago = 0"
+    )
+    # Cobranças: atraso por cliente e pedidos do card aberto
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_cliente_abertos "
+        "ON pedidos (cliente_id, vencimento) WHERE pago = 0"
+    )
+
+    try:
+        _criar_busca(cur)
+    except sqlite3.OperationalError:
+        # SQLite sem FTS5: a busca cai no LIKE (ver busca.py).
+        pass
+
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSAO}")
+    con.commit()
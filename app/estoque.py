@@ -4,7 +4,8 @@ from __future__ import annotations
 
 from flask import Blueprint, flash, redirect, render_template, request
 
-from .db import get_db
+from .eventos import publicar
+from .repositorio import repo
 from .utils import current_user_id, login_required
 
 bp = Blueprint("estoque", __name__)
@@ -15,26 +16,11 @@ bp = Blueprint("estoque", __name__)
 def estoque():
     """Mostra e atualiza o estoque por produto."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
+    r = repo()
 
     # Garante linha de estoque para todos os produtos do usuário
-    cur.execute("SELECT id FROM produtos WHERE usuario_id = ?", (uid,))
-    produtos_ids = [r[0] for r in cur.fetchall()]
-    for pid in produtos_ids:
-        cur.execute(
-            """
-            INSERT OR IGNORE INTO estoque (
-                usuario_id,
-                produto_id,
-                quantidade,
-                minimo
-            )
-            VALUES (?, ?, 0, 0)
-            """,
-            (uid, pid),
-        )
-    con.commit()
+    r.estoque.garantir_linhas(uid)
+    r.commit()
 
     if request.method == "POST":
         try:
@@ -50,20 +36,12 @@ def estoque():
             flash("Dados inválidos.", "error")
             return redirect("/estoque")
 
-        cur.execute(
-            "SELECT 1 FROM produtos WHERE id = ? AND usuario_id = ?",
-            (produto_id, uid),
-        )
-        if not cur.fetchone():
+        produto = r.produtos.por_id(uid, produto_id)
+        if not produto:
             flash("Produto inválido.", "error")
             return redirect("/estoque")
 
-        cur.execute(
-            "SELECT quantidade, minimo FROM estoque "
-            "WHERE usuario_id = ? AND produto_id = ?",
-            (uid, produto_id),
-        )
-        row = cur.fetchone()
+        row = r.estoque.do_produto(uid, produto_id)
         atual_qtd = row[0] if row else 0
         atual_min = row[1] if row else 0
 
@@ -73,29 +51,24 @@ def estoque():
         if minimo_val is None:
             minimo_val = atual_min
 
-        cur.execute(
-            """
-            UPDATE estoque
-            SET quantidade = ?, minimo = ?
-            WHERE usuario_id = ? AND produto_id = ?
-            """,
-            (nova_qtd, minimo_val, uid, produto_id),
-        )
-        con.commit()
+        r.estoque.atualizar(uid, produto_id, nova_qtd, minimo_val)
+        r.commit()
+
+        # Mesma regra do selo "Baixo" da tela: avisa só quando o produto cruza
+        baixo = 0 < minimo_val and nova_qtd <= minimo_val
+        if baixo != (0 < atual_min and atual_qtd <= atual_min):
+            publicar(
+                uid,
+                "estoque",
+                produto_id=produto_id,
+                nome=produto["nome"],
+                quantidade=nova_qtd,
+                minimo=minimo_val,
+                baixo=baixo,
+            )
 
         flash("Estoque atualizado ✅", "success")
         return redirect("/estoque")
 
-    cur.execute(
-        """
-        SELECT p.id, p.nome, p.preco, e.quantidade, e.minimo
-        FROM produtos p
-        LEFT JOIN estoque e
-          ON e.produto_id = p.id AND e.usuario_id = p.usuario_id
-        WHERE p.usuario_id = ?
-        ORDER BY p.nome
-        """,
-        (uid,),
-    )
-    itens = cur.fetchall()
+    itens = r.estoque.listar(uid)
     return render_template("estoque.html", itens=itens)
@@ -0,0 +1,301 @@
+"""Telas ao vivo (Server-Sent Events): dashboard, cobranças e estoque.
+
+Quem muda algo que essas telas mostram chama `publicar(uid, "tipo", **delta)`
+depois do commit. O evento vira uma linha em `eventos` no banco principal,
+então vale também para o worker.py (a baixa do webhook do Asaas roda lá, em
+outro processo).
+
+Em cada processo do app uma única thread (`Difusor`) lê as linhas novas a
+cada EVENTOS_INTERVALO segundos e entrega o delta a todas as conexões abertas
+do usuário: uma query por processo, não importa quantas abas estejam
+abertas. Sem ninguém conectado a thread termina.
+
+`GET /eventos` (text/event-stream, exige login). O `id:` de cada evento é o
+da linha: ao reconectar, o navegador manda `Last-Event-ID` e recebe o que
+perdeu. Cada conexão dura até EVENTOS_DURACAO segundos (a reconexão confere
+o login de novo); com EVENTOS_CONEXOES abertas no processo, a resposta só
+pede para tentar mais tarde.
+
+Eventos (o `data:` é o JSON do delta):
+- pedido_criado: pedido_id, cliente_id, principal, mes (AAAA-MM).
+- pedido_pago: pedidos, cliente_id, principal, valor, origem.
+- estoque: produto_id, nome, quantidade, minimo, baixo (só quando o produto
+  cruza o mínimo, nos dois sentidos).
+
+No perfil gthread do gunicorn cada conexão aberta ocupa uma thread do
+worker: por isso o limite padrão fica 2 abaixo de GUNICORN_THREADS (sobram
+threads para as outras requests). Para muitas abas, use o gevent.
+Como a fila, a tabela fica no SQLite principal também com
+DB_BACKEND=postgres e no modo shard.
+
+Variáveis de ambiente:
+- EVENTOS_INTERVALO: segundos entre as leituras do difusor. Default 1.
+- EVENTOS_PING: segundos entre os keep-alives da conexão. Default 15.
+- EVENTOS_DURACAO: duração máxima de uma conexão, em segundos. Default 300.
+- EVENTOS_CONEXOES: conexões abertas por processo. Default: 50 com o gevent
+  ativo, GUNICORN_THREADS - 2 com threads e 0 (desligado) no perfil sync.
+- EVENTOS_RETENCAO: segundos que um evento fica na tabela. Default 3600.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from flask import Blueprint, Response, request
+
+from .db import conectar, get_catalogo
+from .metricas import eventos_conexoes, eventos_publicados
+from .utils import current_user_id, login_required
+
+bp = Blueprint("eventos", __name__)
+
+EVENTOS_INTERVALO = float(os.getenv("EVENTOS_INTERVALO", "1"))
+EVENTOS_PING = float(os.getenv("EVENTOS_PING", "15"))
+EVENTOS_DURACAO = float(os.getenv("EVENTOS_DURACAO", "300"))
+
+
+def _conexoes_padrao() -> int:
+    """Limite de conexões quando EVENTOS_CONEXOES não está definido."""
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is not None and monkey.is_module_patched("threading"):
+        return 50  # cada conexão é só um greenlet
+    perfil = os.getenv("GUNICORN_PERFIL", "gthread").strip().lower()
+    if perfil == "sync":
+        return 0  # uma conexão prenderia o worker inteiro
+    return max(int(os.getenv("GUNICORN_THREADS", "8")) - 2, 1)
+
+
+EVENTOS_CONEXOES = int(os.getenv("EVENTOS_CONEXOES") or _conexoes_padrao())
+EVENTOS_RETENCAO = float(os.getenv("EVENTOS_RETENCAO", "3600"))
+
+# Eventos guardados por conexão; além disso ela reconecta e lê do banco
+_BUFFER = 100
+# Linhas por leitura (difusor e reconexão)
+_LOTE = 500
+# Espera (ms) do navegador antes de reconectar: normal e com o processo cheio
+_RETRY_MS = 3000
+_RETRY_CHEIO_MS = 30000
+
+log = logging.getLogger(__name__)
+
+
+def publicar(usuario_id: int, tipo: str, /, **dados) -> int:
+    """Grava o evento para as telas do usuário e retorna o id.
+
+    Usa a conexão do catálogo e faz commit, como o `fila.enfileirar`:
+    chame depois de commitar a mudança.
+    """
+    cat = get_catalogo()
+    cur = cat.execute(
+        "INSERT INTO eventos (usuario_id, tipo, dados, criado_em) VALUES (?, ?, ?, ?)",
+        (int(usuario_id), tipo, json.dumps(dados, ensure_ascii=False), time.time()),
+    )
+    cat.commit()
+    eventos_publicados.inc(tipo=tipo)
+    return int(cur.lastrowid)
+
+
+def ultimo_id() -> int:
+    """Id do evento mais recente (0 com a tabela vazia)."""
+    return int(get_catalogo().execute("SELECT COALESCE(MAX(id), 0) FROM eventos").fetchone()[0])
+
+
+def pendentes(usuario_id: int, desde: int, limite: int = _LOTE) -> list[tuple[int, str, str]]:
+    """[(id, tipo, dados)] do usuário depois de `desde` (reconexão)."""
+    return [
+        (int(r[0]), r[1], r[2])
+        for r in get_catalogo().execute(
+            "SELECT id, tipo, dados FROM eventos WHERE id > ? AND usuario_id = ? "
+            "ORDER BY id LIMIT ?",
+            (desde, usuario_id, limite),
+        )
+    ]
+
+
+def limpar(retencao: float = EVENTOS_RETENCAO) -> int:
+    """Apaga os eventos mais velhos que `retencao` segundos; retorna quantos."""
+    cat = get_catalogo()
+    apagados = cat.execute(
+        "DELETE FROM eventos WHERE criado_em < ?", (time.time() - retencao,)
+    ).rowcount
+    cat.commit()
+    return apagados
+
+
+class _Assinante:
+    """Uma conexão SSE aberta e os eventos ainda não enviados a ela."""
+
+    def __init__(self, usuario_id: int):
+        self.usuario_id = usuario_id
+        self.fila: queue.Queue = queue.Queue(maxsize=_BUFFER)
+        # cliente lento demais: a conexão fecha e a reconexão lê do banco
+        self.atrasado = False
+
+
+class Difusor:
+    """Lê `eventos` numa thread e distribui às conexões abertas do processo."""
+
+    def __init__(self, intervalo: float = EVENTOS_INTERVALO):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._assinantes: dict[int, set[_Assinante]] = {}
+        # último id lido; None = ninguém conectado
+        self._ultimo: int | None = None
+        self._thread: threading.Thread | None = None
+
+    def conexoes(self) -> int:
+        with self._lock:
+            return sum(len(grupo) for grupo in self._assinantes.values())
+
+    def assinar(self, usuario_id: int, desde: int) -> _Assinante:
+        """Registra uma conexão; ela recebe os eventos lidos a partir daqui.
+
+        `desde` é onde a leitura recomeça se ninguém estava conectado; o
+        que a conexão perdeu antes disso vem de `pendentes`.
+        """
+        assinante = _Assinante(usuario_id)
+        with self._lock:
+            if self._ultimo is None:
+                self._ultimo = desde
+            self._assinantes.setdefault(usuario_id, set()).add(assinante)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._rodar, name="eventos-difusor", daemon=True
+                )
+                self._thread.start()
+        eventos_conexoes.inc()
+        return assinante
+
+    def cancelar(self, assinante: _Assinante) -> None:
+        with self._lock:
+            grupo = self._assinantes.get(assinante.usuario_id)
+            if grupo is not None:
+                grupo.discard(assinante)
+                if not grupo:
+                    del self._assinantes[assinante.usuario_id]
+            if not self._assinantes:
+                self._ultimo = None
+        eventos_conexoes.dec()
+
+    def _entregar(self, linhas: list) -> None:
+        with self._lock:
+            for id_, usuario_id, tipo, dados in linhas:
+                for assinante in self._assinantes.get(usuario_id, ()):
+                    if assinante.atrasado:
+                        continue
+                    try:
+                        assinante.fila.put_nowait((id_, tipo, dados))
+                    except queue.Full:
+                        assinante.atrasado = True
+            if self._ultimo is not None:
+                self._ultimo = max(self._ultimo, linhas[-1][0])
+
+    def _rodar(self) -> None:
+        con = None
+        try:
+            while True:
+                with self._lock:
+                    desde = self._ultimo
+                    if desde is None:
+                        self._thread = None
+                        return
+                try:
+                    if con is None:
+                        con = conectar(leitura=True)
+                    linhas = con.execute(
+                        "SELECT id, usuario_id, tipo, dados FROM eventos WHERE id > ? "
+                        "ORDER BY id LIMIT ?",
+                        (desde, _LOTE),
+                    ).fetchall()
+                except sqlite3.Error as exc:
+                    log.warning("leitura dos eventos falhou: %s", exc)
+                    linhas = []
+                if linhas:
+                    self._entregar(linhas)
+                if len(linhas) < _LOTE:
+                    time.sleep(self.intervalo)
+        finally:
+            if con is not None:
+                con.close()
+
+
+difusor = Difusor()
+
+
+def _reiniciar_no_filho() -> None:
+    """A thread e as conexões do pai não atravessam o fork."""
+    global difusor
+    difusor = Difusor()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_no_filho)
+
+
+def _mensagem(id_: int, tipo: str, dados: str) -> str:
+    return f"id: {id_}\nevent: {tipo}\ndata: {dados}\n\n"
+
+
+def _transmitir(d: Difusor, assinante: _Assinante, desde: int, atrasados: list):
+    """Corpo da resposta SSE (roda depois da request: não toca no banco)."""
+    fim = time.monotonic() + EVENTOS_DURACAO
+    try:
+        yield f"retry: {_RETRY_MS}\n\n"
+        for id_, tipo, dados in atrasados:
+            desde = id_
+            yield _mensagem(id_, tipo, dados)
+        if len(atrasados) >= _LOTE:
+            return  # tem mais: o navegador reconecta a partir do último
+        while not assinante.atrasado:
+            restante = fim - time.monotonic()
+            if restante <= 0:
+                return
+            try:
+                id_, tipo, dados = assinante.fila.get(timeout=min(EVENTOS_PING, restante))
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            if id_ > desde:
+                desde = id_
+                yield _mensagem(id_, tipo, dados)
+    finally:
+        d.cancelar(assinante)
+
+
+@bp.route("/eventos")
+@login_required
+def stream():
+    """Stream SSE com as mudanças do usuário logado."""
+    d = difusor
+    if d.conexoes() >= EVENTOS_CONEXOES:
+        # processo cheio: o navegador tenta de novo (talvez em outro worker)
+        return Response(f"retry: {_RETRY_CHEIO_MS}\n\n", mimetype="text/event-stream")
+
+    uid = current_user_id()
+    atual = ultimo_id()
+    try:
+        desde = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        desde = atual
+    # id de um banco restaurado ou recriado: recomeça do fim
+    desde = min(max(desde, 0), atual)
+
+    assinante = d.assinar(uid, desde)
+    try:
+        # o que chegou antes de o difusor incluir esta conexão
+        atrasados = pendentes(uid, desde)
+    except BaseException:
+        d.cancelar(assinante)
+        raise
+    return Response(
+        _transmitir(d, assinante, desde, atrasados),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,349 @@
+"""Exportação de pedidos, cobranças em aberto e pagamentos (CSV/XLSX).
+
+As linhas saem do banco em lotes (`fetchmany`) direto para a resposta, sem
+montar a lista inteira em memória: um tenant com milhões de pedidos exporta
+com uso de memória constante. Filtros de data e status viram WHERE no SQL.
+
+Parâmetros (query string), todos opcionais:
+- formato: csv (default) ou xlsx
+- de / ate: datas YYYY-MM-DD (inclusive)
+- status: aberto | pago (só em /exportar/pedidos)
+- gzip=1: comprime o CSV (.csv.gz)
+
+Pedidos e pagamentos incluem o arquivo (`pedidos_arquivo`) quando o período
+alcança pedidos arquivados (ver arquivo.py).
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import zipfile
+import zlib
+from datetime import date, timedelta
+from typing import Callable, Iterable, Iterator
+from xml.sax.saxutils import escape
+
+from flask import Blueprint, Response, abort, request, stream_with_context
+
+from .db import conectar, get_db, tenant_atual
+from .repositorio import ARQUIVO_CORTE, apenas_sqlite, fontes_pedidos, sql_itens
+from .utils import (
+    calcular_juros,
+    current_user_id,
+    data_param,
+    dias_de_atraso,
+    login_required,
+    vencimento_efetivo,
+)
+
+bp = Blueprint("exportacao", __name__)
+bp.before_request(apenas_sqlite)
+
+LOTE = 1000
+
+
+def _filtro_periodo(coluna: str, where: list[str], params: list) -> None:
+    """Acrescenta o filtro de/ate sobre `coluna` (texto ISO)."""
+    de = data_param("de")
+    ate = data_param("ate")
+    if de:
+        where.append(f"{coluna} >= ?")
+        params.append(de)
+    if ate:
+        # `< dia seguinte` cobre colunas com hora (ISO com 'T') e usa índice
+        where.append(f"{coluna} < ?")
+        params.append((date.fromisoformat(ate) + timedelta(days=1)).isoformat())
+
+
+def _fontes() -> tuple[str, str]:
+    """(pedidos, itens) para o período da query string (ver `fontes_pedidos`)."""
+    row = get_db().execute(
+        "SELECT valor FROM controle WHERE chave = ?", (ARQUIVO_CORTE,)
+    ).fetchone()
+    return fontes_pedidos(row[0] if row else None, data_param("de"))
+
+
+def _linhas(sql: str, params: Iterable, transformar: Callable | None = None) -> Iterator[tuple]:
+    """Itera o resultado em lotes numa conexão própria (vive com o stream)."""
+    con = conectar(tenant_atual(), leitura=True)
+    try:
+        cur = con.execute(sql, tuple(params))
+        while True:
+            lote = cur.fetchmany(LOTE)
+            if not lote:
+                break
+            for row in lote:
+                yield transformar(row) if transformar else tuple(row)
+    finally:
+        con.close()
+
+
+def _csv_stream(cabecalho: list[str], linhas: Iterator[tuple]) -> Iterator[bytes]:
+    """Gera o CSV em blocos de bytes (UTF-8 com BOM, abre certo no Excel)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(cabecalho)
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+    buf.seek(0)
+    buf.truncate()
+
+    for i, linha in enumerate(linhas, 1):
+        writer.writerow(linha)
+        if i % LOTE == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+
+    resto = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    if resto:
+        yield resto.encode("utf-8")
+
+
+def _gzip_stream(blocos: Iterator[bytes]) -> Iterator[bytes]:
+    """Comprime um stream de bytes no formato gzip."""
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloco in blocos:
+        saida = comp.compress(bloco)
+        if saida:
+            yield saida
+    yield comp.flush()
+
+
+class _BufferZip(io.RawIOBase):
+    """Destino não-seekable para o zipfile: acumula e é drenado pelo stream."""
+
+    def __init__(self):
+        super().__init__()
+        self._partes: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, dados) -> int:
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def drenar(self) -> bytes:
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+_XLSX_ESTATICOS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Dados" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+
+def _xlsx_celula(valor) -> str:
+    if valor is None:
+        return "<c/>"
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c t="n"><v>{valor}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(valor))}</t></is></c>'
+
+
+def _xlsx_linha(valores) -> str:
+    return "<row>" + "".join(_xlsx_celula(v) for v in valores) + "</row>"
+
+
+def _xlsx_stream(cabecalho: list[str], linhas: Iterator[tuple]) -> Iterator[bytes]:
+    """Gera um XLSX mínimo (uma planilha) em streaming, só com stdlib."""
+    buf = _BufferZip()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, conteudo in _XLSX_ESTATICOS.items():
+            zf.writestr(nome, conteudo)
+        yield buf.drenar()
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as planilha:
+            planilha.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>"
+            )
+            planilha.write(_xlsx_linha(cabecalho).encode("utf-8"))
+            for i, linha in enumerate(linhas, 1):
+                planilha.write(_xlsx_linha(linha).encode("utf-8"))
+                if i % LOTE == 0:
+                    dados = buf.drenar()
+                    if dados:
+                        yield dados
+            planilha.write(b"</sheetData></worksheet>")
+    yield buf.drenar()
+
+
+def _resposta(nome: str, cabecalho: list[str], linhas: Iterator[tuple]) -> Response:
+    """Monta a resposta em streaming no formato pedido."""
+    formato = (request.args.get("formato") or "csv").lower()
+    if formato == "xlsx":
+        corpo = _xlsx_stream(cabecalho, linhas)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        arquivo = f"{nome}.xlsx"
+    elif formato == "csv":
+        corpo = _csv_stream(cabecalho, linhas)
+        mimetype = "text/csv"
+        arquivo = f"{nome}.csv"
+        if request.args.get("gzip") == "1":
+            corpo = _gzip_stream(corpo)
+            mimetype = "application/gzip"
+            arquivo += ".gz"
+    else:
+        abort(400)
+
+    return Response(
+        stream_with_context(corpo),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{arquivo}"'},
+    )
+
+
+@bp.route("/exportar/pedidos")
+@login_required
+def exportar_pedidos():
+    """Exporta pedidos do usuário (filtros: de/ate sobre a data, status)."""
+    uid = current_user_id()
+    where = ["pedidos.usuario_id = ?"]
+    params: list = [uid]
+    _filtro_periodo("pedidos.data", where, params)
+
+    status = (request.args.get("status") or "").lower()
+    if status == "aberto":
+        where.append("pedidos.pago = 0")
+    elif status == "pago":
+        where.append("pedidos.pago = 1")
+
+    pedidos, itens = _fontes()
+    sql = f"""
+        SELECT id, data, cliente, telefone, produto_nome, quantidade,
+               COALESCE(valor_principal, principal_atual), vencimento, status,
+               data_pagamento, valor_pago
+        FROM (
+            SELECT
+                pedidos.id,
+                pedidos.data,
+                clientes.nome AS cliente,
+                clientes.telefone,
+                pedidos.valor_principal,
+                pedidos.vencimento,
+                CASE WHEN pedidos.pago = 1 THEN 'pago' ELSE 'aberto' END AS status,
+                pedidos.data_pagamento,
+                pedidos.valor_pago,
+                {sql_itens("pedidos", itens=itens)}
+            FROM {pedidos} AS pedidos
+            JOIN clientes ON clientes.id = pedidos.cliente_id
+            WHERE {" AND ".join(where)}
+        ) AS t
+        ORDER BY id
+    """
+    cabecalho = [
+        "pedido_id", "data", "cliente", "telefone", "produtos",
+        "quantidade", "total", "vencimento", "status", "data_pagamento",
+        "valor_pago",
+    ]
+    return _resposta("pedidos", cabecalho, _linhas(sql, params))
+
+
+@bp.route("/exportar/cobrancas")
+@login_required
+def exportar_cobrancas():
+    """Exporta cobranças em aberto com juros calculados até hoje."""
+    uid = current_user_id()
+    where = ["pedidos.usuario_id = ?", "pedidos.pago = 0"]
+    params: list = [uid]
+    _filtro_periodo("pedidos.data", where, params)
+
+    hoje = date.today()
+
+    def transformar(row) -> tuple:
+        principal = float(row["principal_atual"] or 0)
+        venc = vencimento_efetivo(row["data"], row["vencimento"])
+        dias = dias_de_atraso(hoje, venc)
+        juros = calcular_juros(principal, dias)
+        return (
+            row["id"], row["data"], row["cliente"], row["telefone"],
+            row["produto_nome"], int(row["quantidade"] or 0), round(principal, 2),
+            venc.isoformat(), dias, round(juros, 2), round(principal + juros, 2),
+        )
+
+    sql = f"""
+        SELECT
+            pedidos.id          AS id,
+            pedidos.data        AS data,
+            pedidos.vencimento  AS vencimento,
+            clientes.nome       AS cliente,
+            clientes.telefone   AS telefone,
+            {sql_itens("pedidos")}
+        FROM pedidos
+        JOIN clientes ON clientes.id = pedidos.cliente_id
+        WHERE {" AND ".join(where)}
+        ORDER BY clientes.nome, pedidos.data
+    """
+    cabecalho = [
+        "pedido_id", "data", "cliente", "telefone", "produtos", "quantidade",
+        "principal", "vencimento", "dias_atraso", "juros", "total_atualizado",
+    ]
+    return _resposta("cobrancas", cabecalho, _linhas(sql, params, transformar))
+
+
+@bp.route("/exportar/pagamentos")
+@login_required
+def exportar_pagamentos():
+    """Exporta pagamentos recebidos (filtros de/ate sobre data_pagamento)."""
+    uid = current_user_id()
+    where = ["p.usuario_id = ?", "p.pago = 1"]
+    params: list = [uid]
+    _filtro_periodo("p.data_pagamento", where, params)
+
+    pedidos, itens = _fontes()
+    sql = f"""
+        SELECT id, data_pagamento, cliente, produto_nome, quantidade, juros,
+               valor_pago, asaas_payment_id
+        FROM (
+            SELECT
+                p.id,
+                p.data_pagamento,
+                c.nome AS cliente,
+                p.juros,
+                p.valor_pago,
+                p.asaas_payment_id,
+                {sql_itens("p", itens=itens)}
+            FROM {pedidos} p
+            JOIN clientes c ON c.id = p.cliente_id
+            WHERE {" AND ".join(where)}
+        ) AS t
+        ORDER BY data_pagamento
+    """
+    cabecalho = [
+        "pedido_id", "data_pagamento", "cliente", "produtos", "quantidade",
+        "juros", "valor_pago", "asaas_payment_id",
+    ]
+    return _resposta("pagamentos", cabecalho, _linhas(sql, params))
@@ -0,0 +1,594 @@
+"""Fila de jobs no SQLite (banco principal) e o runtime do worker.py.
+
+- `enfileirar("tarefa", prioridade=..., atraso=..., **payload)` grava o job
+  em `fila_jobs`; o payload vai como JSON e volta como kwargs da tarefa.
+- `@tarefa("nome", tentativas=..., visibilidade=..., prioridade=...)`
+  registra a função que roda o job (dentro de um app context).
+- Quem pega um job empurra `executar_em` para daqui a `visibilidade`
+  segundos (lease): se o processo morrer, o job volta a ficar pronto sozinho.
+  Enquanto roda, o lease é renovado; o ack confere a tentativa, então um
+  executor atrasado não apaga o job que outro já pegou de novo.
+- Falhou: nova tentativa com espera exponencial (FILA_BACKOFF * 2^n, até
+  1 h). Esgotou as tentativas: o job vai para `fila_mortos`
+  (`flask --app run fila mortos` / `fila reprocessar`).
+- `agendar("tarefa", a_cada=... | hora=..., minuto=...)`: jobs periódicos.
+  A próxima execução fica em `fila_agenda` e só um processo consegue
+  avançá-la, então vários workers não duplicam o job; um horário perdido
+  (worker fora do ar) roda assim que ele volta. Se o job anterior ainda está
+  na fila, a rodada é pulada.
+
+Runtime (`rodar`): FILA_PROCESSOS processos com FILA_THREADS threads cada.
+O processo principal cuida da agenda e do gauge `fila_pendentes`; cada
+executor mede `fila_jobs_total`, `fila_execucao_seconds` e
+`fila_espera_seconds` (com vários processos, defina METRICS_DIR para vê-los
+no /metrics do app).
+
+A fila fica sempre no SQLite principal, também com DB_BACKEND=postgres e no
+modo shard (o job diz o tenant no payload).
+
+Variáveis de ambiente:
+- FILA_PROCESSOS: processos executores. Default 1.
+- FILA_THREADS: threads por processo. Default 4.
+- FILA_TENTATIVAS: tentativas por job (default das tarefas). Default 5.
+- FILA_VISIBILIDADE: segundos de lease (default das tarefas). Default 300.
+- FILA_BACKOFF: espera base entre tentativas, em segundos. Default 10.
+- FILA_ESPERA: intervalo de consulta com a fila vazia. Default 1.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+import click
+from flask import Blueprint, Flask, current_app
+
+from .db import DB_ESCRITA_TIMEOUT, caminho_db, get_catalogo
+from .metricas import fila_duracao, fila_espera, fila_jobs, fila_pendentes, flush
+
+bp = Blueprint("fila", __name__)
+
+FILA_PROCESSOS = int(os.getenv("FILA_PROCESSOS", "1"))
+FILA_THREADS = int(os.getenv("FILA_THREADS", "4"))
+FILA_TENTATIVAS = int(os.getenv("FILA_TENTATIVAS", "5"))
+FILA_VISIBILIDADE = float(os.getenv("FILA_VISIBILIDADE", "300"))
+FILA_BACKOFF = float(os.getenv("FILA_BACKOFF", "10"))
+FILA_ESPERA = float(os.getenv("FILA_ESPERA", "1"))
+
+_BACKOFF_MAX = 3600.0
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Tarefa:
+    """Função registrada para um tipo de job."""
+
+    func: Callable
+    tentativas: int
+    visibilidade: float
+    prioridade: int
+
+
+@dataclass
+class Agendamento:
+    """Job periódico: a cada `a_cada` segundos ou todo dia às hora:minuto."""
+
+    tarefa: str
+    a_cada: float | None
+    hora: int | None
+    minuto: int
+    ao_subir: bool
+
+    def proxima(self, agora: datetime) -> datetime:
+        if self.a_cada:
+            return agora + timedelta(seconds=self.a_cada)
+        alvo = agora.replace(hour=self.hora, minute=self.minuto, second=0, microsecond=0)
+        return alvo if alvo > agora else alvo + timedelta(days=1)
+
+
+_TAREFAS: dict[str, Tarefa] = {}
+_AGENDA: dict[str, Agendamento] = {}
+
+
+def tarefa(nome: str, tentativas: int | None = None, visibilidade: float | None = None,
+           prioridade: int = 0):
+    """Decorator: registra `func(**payload)` como executora de `nome`."""
+
+    def registrar(func: Callable) -> Callable:
+        _TAREFAS[nome] = Tarefa(
+            func,
+            tentativas or FILA_TENTATIVAS,
+            visibilidade or FILA_VISIBILIDADE,
+            prioridade,
+        )
+        return func
+
+    return registrar
+
+
+def agendar(nome: str, a_cada: float | None = None, hora: int | None = None,
+            minuto: int = 0, ao_subir: bool = False) -> None:
+    """Registra `nome` como periódica (só vale no processo do worker).
+
+    Com `ao_subir`, a primeira execução (agenda ainda vazia) é imediata.
+    """
+    if (a_cada is None) == (hora is None):
+        raise ValueError("informe a_cada ou hora")
+    _AGENDA[nome] = Agendamento(nome, a_cada, hora, minuto, ao_subir)
+
+
+def enfileirar(nome: str, /, prioridade: int | None = None, atraso: float = 0,
+               tentativas: int | None = None, **payload) -> int:
+    """Põe um job na fila e retorna o id.
+
+    Usa a conexão do catálogo do contexto atual e faz commit (sem shards,
+    é a mesma conexão da request: commite o que vem antes).
+    """
+    registrada = _TAREFAS.get(nome)
+    agora = time.time()
+    cat = get_catalogo()
+    cur = cat.execute(
+        """
+        INSERT INTO fila_jobs
+            (tarefa, payload, prioridade, executar_em, max_tentativas, criado_em)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (
+            nome,
+            json.dumps(payload, ensure_ascii=False),
+            prioridade if prioridade is not None else (registrada.prioridade if registrada else 0),
+            agora + atraso,
+            tentativas or (registrada.tentativas if registrada else FILA_TENTATIVAS),
+            agora,
+        ),
+    )
+    cat.commit()
+    return int(cur.lastrowid)
+
+
+def _conexao() -> sqlite3.Connection:
+    """Conexão própria do executor (autocommit: as transações são explícitas)."""
+    con = sqlite3.connect(
+        caminho_db(), timeout=DB_ESCRITA_TIMEOUT, isolation_level=None,
+        check_same_thread=False,
+    )
+    con.row_factory = sqlite3.Row
+    return con
+
+
+def _backoff(tentativa: int) -> float:
+    return min(FILA_BACKOFF * 2 ** max(tentativa - 1, 0), _BACKOFF_MAX)
+
+
+# ---------------------------------------------------------------------------
+# Operações da fila (conexão do executor)
+# ---------------------------------------------------------------------------
+_SQL_PRONTO = """
+    SELECT id, tarefa, payload, tentativas, max_tentativas, executar_em
+    FROM fila_jobs
+    WHERE executar_em <= ?
+    ORDER BY prioridade DESC, executar_em, id
+    LIMIT 1
+"""
+
+
+def _pegar(con: sqlite3.Connection, trabalhador: str) -> dict | None:
+    """Pega o próximo job pronto (lease); None com a fila vazia."""
+    # leitura antes: com a fila vazia, nada de lock de escrita a cada volta
+    if con.execute(_SQL_PRONTO, (time.time(),)).fetchone() is None:
+        return None
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        agora = time.time()
+        row = con.execute(_SQL_PRONTO, (agora,)).fetchone()
+        if row is None:
+            con.execute("COMMIT")
+            return None
+        registrada = _TAREFAS.get(row["tarefa"])
+        visibilidade = registrada.visibilidade if registrada else FILA_VISIBILIDADE
+        con.execute(
+            "UPDATE fila_jobs SET executar_em = ?, tentativas = tentativas + 1, "
+            "trabalhador = ? WHERE id = ?",
+            (agora + visibilidade, trabalhador, row["id"]),
+        )
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    job = dict(row)
+    job["tentativas"] += 1
+    job["visibilidade"] = visibilidade
+    job["lease_ate"] = agora + visibilidade
+    return job
+
+
+def _concluir(con: sqlite3.Connection, job: dict) -> None:
+    con.execute(
+        "DELETE FROM fila_jobs WHERE id = ? AND tentativas = ?",
+        (job["id"], job["tentativas"]),
+    )
+
+
+def _falhar(con: sqlite3.Connection, job: dict, erro: str) -> bool:
+    """Agenda nova tentativa ou manda para `fila_mortos`; True se morreu."""
+    agora = time.time()
+    if job["tentativas"] < job["max_tentativas"]:
+        con.execute(
+            "UPDATE fila_jobs SET executar_em = ?, trabalhador = NULL, ultimo_erro = ? "
+            "WHERE id = ? AND tentativas = ?",
+            (agora + _backoff(job["tentativas"]), erro, job["id"], job["tentativas"]),
+        )
+        return False
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        cur = con.execute(
+            """
+            INSERT INTO fila_mortos
+                (id, tarefa, payload, prioridade, tentativas, max_tentativas,
+                 ultimo_erro, criado_em, morto_em)
+            SELECT id, tarefa, payload, prioridade, tentativas, max_tentativas,
+                   ?, criado_em, ?
+            FROM fila_jobs WHERE id = ? AND tentativas = ?
+            """,
+            (erro, agora, job["id"], job["tentativas"]),
+        )
+        if cur.rowcount:
+            con.execute("DELETE FROM fila_jobs WHERE id = ?", (job["id"],))
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    return True
+
+
+def _renovar(con: sqlite3.Connection, job: dict) -> None:
+    agora = time.time()
+    con.execute(
+        "UPDATE fila_jobs SET executar_em = ? WHERE id = ? AND tentativas = ?",
+        (agora + job["visibilidade"], job["id"], job["tentativas"]),
+    )
+    job["lease_ate"] = agora + job["visibilidade"]
+
+
+def _rodar_agenda(con: sqlite3.Connection) -> int:
+    """Enfileira os periódicos vencidos; retorna quantos."""
+    enfileirados = 0
+    for nome, ag in _AGENDA.items():
+        agora = datetime.now()
+        inicial = agora if (ag.a_cada or ag.ao_subir) else ag.proxima(agora)
+        con.execute(
+            "INSERT OR IGNORE INTO fila_agenda (nome, proxima) VALUES (?, ?)",
+            (nome, inicial.timestamp()),
+        )
+        row = con.execute("SELECT proxima FROM fila_agenda WHERE nome = ?", (nome,)).fetchone()
+        if row["proxima"] > agora.timestamp():
+            continue
+        registrada = _TAREFAS.get(ag.tarefa)
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # só um processo avança a agenda; o job anterior ainda na fila
+            # (atrasado ou rodando) faz pular esta rodada
+            avancou = con.execute(
+                "UPDATE fila_agenda SET proxima = ? WHERE nome = ? AND proxima <= ?",
+                (ag.proxima(agora).timestamp(), nome, agora.timestamp()),
+            ).rowcount
+            if avancou and not con.execute(
+                "SELECT 1 FROM fila_jobs WHERE tarefa = ? LIMIT 1", (ag.tarefa,)
+            ).fetchone():
+                con.execute(
+                    """
+                    INSERT INTO fila_jobs
+                        (tarefa, payload, prioridade, executar_em, max_tentativas, criado_em)
+                    VALUES (?, '{}', ?, ?, ?, ?)
+                    """,
+                    (
+                        ag.tarefa,
+                        registrada.prioridade if registrada else 0,
+                        agora.timestamp(),
+                        registrada.tentativas if registrada else FILA_TENTATIVAS,
+                        agora.timestamp(),
+                    ),
+                )
+                enfileirados += 1
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+    return enfileirados
+
+
+def _medir_pendentes(con: sqlite3.Connection) -> None:
+    contagem = {
+        r["tarefa"]: r["n"]
+        for r in con.execute(
+            "SELECT tarefa, COUNT(*) AS n FROM fila_jobs WHERE executar_em <= ? GROUP BY tarefa",
+            (time.time(),),
+        )
+    }
+    for nome in set(_TAREFAS) | set(contagem):
+        fila_pendentes.set(contagem.get(nome, 0), tarefa=nome)
+
+
+# ---------------------------------------------------------------------------
+# Executores
+# ---------------------------------------------------------------------------
+class Trabalhador:
+    """Executores (threads) de um processo, mais o laço de leases/agenda."""
+
+    def __init__(self, app: Flask, threads: int = FILA_THREADS,
+                 parar: threading.Event | None = None):
+        self.app = app
+        self.threads = threads
+        self.parar = parar or threading.Event()
+        self.nome = f"{socket.gethostname()}:{os.getpid()}"
+        self._em_curso: dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._executores: list[threading.Thread] = []
+
+    def executar(self, con: sqlite3.Connection, job: dict) -> bool:
+        """Roda um job já pego; True se deu certo."""
+        nome = job["tarefa"]
+        fila_espera.observe(max(time.time() - job["executar_em"], 0.0), tarefa=nome)
+        with self._lock:
+            self._em_curso[job["id"]] = job
+        inicio = time.perf_counter()
+        try:
+            registrada = _TAREFAS.get(nome)
+            if registrada is None:
+                raise LookupError(f"tarefa desconhecida: {nome}")
+            with self.app.app_context():
+                registrada.func(**json.loads(job["payload"]))
+        except Exception as exc:
+            log.exception("job %s (%s) falhou na tentativa %d", job["id"], nome, job["tentativas"])
+            with self._lock:
+                self._em_curso.pop(job["id"], None)
+            try:
+                morto = _falhar(con, job, f"{type(exc).__name__}: {exc}"[:2000])
+            except sqlite3.Error:
+                # sem renovação o lease vence e o job volta para a fila
+                log.exception("fila: erro ao registrar a falha do job %s", job["id"])
+                return False
+            fila_jobs.inc(tarefa=nome, resultado="morto" if morto else "erro")
+            return False
+        finally:
+            fila_duracao.observe(time.perf_counter() - inicio, tarefa=nome)
+        with self._lock:
+            self._em_curso.pop(job["id"], None)
+        try:
+            _concluir(con, job)
+        except sqlite3.Error:
+            # o job roda de novo quando o lease vencer (entrega "ao menos uma vez")
+            log.exception("fila: erro ao concluir o job %s", job["id"])
+        fila_jobs.inc(tarefa=nome, resultado="ok")
+        return True
+
+    def _executor(self) -> None:
+        con = _conexao()
+        try:
+            while not self.parar.is_set():
+                try:
+                    job = _pegar(con, self.nome)
+                except sqlite3.Error:
+                    log.exception("fila: erro ao pegar job")
+                    job = None
+                if job is None:
+                    self.parar.wait(FILA_ESPERA)
+                    continue
+                try:
+                    self.executar(con, job)
+                except Exception:
+                    # a thread não pode morrer: o job volta quando o lease vencer
+                    log.exception("fila: erro no executor (job %s)", job["id"])
+        finally:
+            con.close()
+
+    def _renovar_leases(self, con: sqlite3.Connection) -> None:
+        agora = time.time()
+        with self._lock:
+            jobs = list(self._em_curso.values())
+        for job in jobs:
+            # renova quando passou da metade do lease
+            if job["lease_ate"] - agora < job["visibilidade"] / 2:
+                _renovar(con, job)
+
+    def iniciar(self) -> None:
+        """Sobe as threads executoras (daemon)."""
+        for n in range(self.threads):
+            t = threading.Thread(target=self._executor, name=f"fila-{n}", daemon=True)
+            t.start()
+            self._executores.append(t)
+
+    def rodar(self, agenda: bool = True) -> None:
+        """Bloqueia até `parar`: executores + leases (+ agenda)."""
+        self.iniciar()
+        con = _conexao()
+        try:
+            while not self.parar.is_set():
+                try:
+                    self._renovar_leases(con)
+                    if agenda:
+                        _rodar_agenda(con)
+                        _medir_pendentes(con)
+                except sqlite3.Error:
+                    log.exception("fila: erro no laço principal")
+                self.parar.wait(FILA_ESPERA)
+        finally:
+            con.close()
+        for t in self._executores:
+            t.join()
+        # o flush das métricas é espaçado: grava o que ficou antes de sair
+        flush()
+
+    def iniciar_em_thread(self) -> threading.Thread:
+        """`rodar()` em background (servidor de desenvolvimento)."""
+        t = threading.Thread(target=self.rodar, name="fila", daemon=True)
+        t.start()
+        return t
+
+
+def processar(app: Flask, limite: int | None = None) -> int:
+    """Roda agora, nesta thread, os jobs prontos; retorna quantos rodaram."""
+    trabalhador = Trabalhador(app, threads=0)
+    con = _conexao()
+    feitos = 0
+    try:
+        while limite is None or feitos < limite:
+            job = _pegar(con, trabalhador.nome)
+            if job is None:
+                break
+            trabalhador.executar(con, job)
+            feitos += 1
+    finally:
+        con.close()
+    return feitos
+
+
+def rodar(app: Flask, processos: int = FILA_PROCESSOS, threads: int = FILA_THREADS) -> None:
+    """Laço do worker.py; SIGTERM/SIGINT terminam os jobs em curso e saem."""
+    parar = threading.Event()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sinal, lambda *_: parar.set())
+
+    if processos <= 1:
+        Trabalhador(app, threads, parar).rodar()
+        return
+
+    filhos: set[int] = set()
+    con = _conexao()
+    try:
+        while not parar.is_set():
+            while len(filhos) < processos:
+                pid = os.fork()
+                if pid == 0:
+                    # a conexão herdada do pai fica aberta (ver db._herdadas)
+                    codigo = 0
+                    try:
+                        Trabalhador(app, threads, parar).rodar(agenda=False)
+                    except BaseException:
+                        log.exception("fila: executor %d caiu", os.getpid())
+                        codigo = 1
+                    finally:
+                        os._exit(codigo)
+                filhos.add(pid)
+            try:
+                _rodar_agenda(con)
+                _medir_pendentes(con)
+            except sqlite3.Error:
+                log.exception("fila: erro na agenda")
+            # recolhe quem morreu (o laço de cima sobe outro)
+            while filhos:
+                pid, _status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                filhos.discard(pid)
+            parar.wait(FILA_ESPERA)
+    finally:
+        con.close()
+        flush()
+        for pid in filhos:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in filhos:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def _carregar_tarefas() -> None:
+    # as periódicas ficam em scheduler.py (importado só pelo worker)
+    from . import scheduler  # noqa: F401
+
+
+@bp.cli.command("status")
+def status_cli() -> None:
+    """Jobs na fila (prontos, agendados, em execução) e mortos por tarefa."""
+    con = _conexao()
+    try:
+        agora = time.time()
+        linhas = con.execute(
+            """
+            SELECT tarefa,
+                   SUM(executar_em <= :agora) AS prontos,
+                   SUM(executar_em > :agora AND trabalhador IS NULL) AS agendados,
+                   SUM(executar_em > :agora AND trabalhador IS NOT NULL) AS rodando
+            FROM fila_jobs GROUP BY tarefa ORDER BY tarefa
+            """,
+            {"agora": agora},
+        ).fetchall()
+        mortos = dict(con.execute("SELECT tarefa, COUNT(*) FROM fila_mortos GROUP BY tarefa"))
+    finally:
+        con.close()
+    for r in linhas:
+        click.echo(
+            f"{r['tarefa']:<22} prontos={r['prontos']} agendados={r['agendados']} "
+            f"rodando={r['rodando']} mortos={mortos.pop(r['tarefa'], 0)}"
+        )
+    for nome, n in sorted(mortos.items()):
+        click.echo(f"{nome:<22} prontos=0 agendados=0 rodando=0 mortos={n}")
+
+
+@bp.cli.command("processar")
+@click.option("--limite", type=int, help="no máximo N jobs")
+def processar_cli(limite: int | None) -> None:
+    """Roda agora os jobs prontos (sem worker)."""
+    _carregar_tarefas()
+    click.echo(f"{processar(current_app._get_current_object(), limite)} job(s) processado(s)")
+
+
+@bp.cli.command("mortos")
+def mortos_cli() -> None:
+    """Lista os jobs que esgotaram as tentativas."""
+    con = _conexao()
+    try:
+        linhas = con.execute(
+            "SELECT id, tarefa, tentativas, morto_em, ultimo_erro FROM fila_mortos ORDER BY morto_em"
+        ).fetchall()
+    finally:
+        con.close()
+    for r in linhas:
+        quando = datetime.fromtimestamp(r["morto_em"]).strftime("%Y-%m-%d %H:%M:%S")
+        click.echo(f"{r['id']:>6} {quando} {r['tarefa']:<22} x{r['tentativas']} {r['ultimo_erro']}")
+
+
+@bp.cli.command("reprocessar")
+@click.argument("ids", nargs=-1, type=int)
+@click.option("--todos", is_flag=True, help="todos os jobs mortos")
+def reprocessar_cli(ids: tuple[int, ...], todos: bool) -> None:
+    """Devolve jobs mortos à fila (tentativas zeradas)."""
+    if not ids and not todos:
+        raise click.ClickException("informe os ids ou --todos")
+    filtro = "" if todos else f" WHERE id IN ({', '.join('?' * len(ids))})"
+    params = () if todos else ids
+    con = _conexao()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        cur = con.execute(
+            f"""
+            INSERT INTO fila_jobs
+                (tarefa, payload, prioridade, executar_em, max_tentativas, criado_em)
+            SELECT tarefa, payload, prioridade, ?, max_tentativas, criado_em
+            FROM fila_mortos{filtro}
+            """,
+            (time.time(), *params),
+        )
+        con.execute(f"DELETE FROM fila_mortos{filtro}", params)
+        con.execute("COMMIT")
+    finally:
+        con.close()
+    click.echo(f"{cur.rowcount} job(s) de volta à fila")
@@ -1,44 +1,98 @@
-"""Painel financeiro simples."""
+"""Painel financeiro do usuário logado.
+
+Os totais (recebido, juros, prazo médio) vêm do rollup diário
+`financeiro_diario`, mantido por triggers em `pedidos` (ver db.py), com
+filtro de período (de/ate). O resultado fica num cache por processo,
+chaveado por usuário e período e validado pela `financeiro_versao` do
+usuário, que os triggers sobem a cada pagamento/pedido novo: um webhook
+atendido por outro worker também invalida o cache deste.
+
+- FINANCEIRO_CACHE_MAX: painéis guardados por processo. Default 256.
+"""
 
 from __future__ import annotations
 
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import click
 from flask import Blueprint, render_template
+
 from .auth import login_required
-from .db import get_db
+from .db import get_db, listar_tenants, recalcular_financeiro, shards_ativos, usar_tenant
+from .repositorio import repo
+from .utils import current_user_id, data_param
 
 bp = Blueprint("financeiro", __name__)
 
+FINANCEIRO_CACHE_MAX = int(os.getenv("FINANCEIRO_CACHE_MAX", "256"))
+
+_cache: OrderedDict[tuple, tuple[int, dict]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _reiniciar_no_filho() -> None:
+    global _cache_lock
+    _cache_lock = threading.Lock()
+    _cache.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_no_filho)
+
+
+def painel(uid: int, de: str | None = None, ate: str | None = None) -> dict:
+    """Dados do painel, do cache quando a versão do usuário não mudou."""
+    r = repo().financeiro
+    versao = r.versao(uid)
+    chave = (uid, de, ate)
+    with _cache_lock:
+        item = _cache.get(chave)
+        if item is not None and item[0] == versao:
+            _cache.move_to_end(chave)
+            return item[1]
+
+    dados = {
+        **r.resumo(uid, de, ate),
+        "qtd_abertos": r.qtd_abertos(uid),
+        "por_dia": r.por_dia(uid, de, ate),
+        "ultimos": r.ultimos_pagamentos(uid, de, ate, 20),
+    }
+    with _cache_lock:
+        _cache[chave] = (versao, dados)
+        _cache.move_to_end(chave)
+        while len(_cache) > FINANCEIRO_CACHE_MAX:
+            _cache.popitem(last=False)
+    return dados
+
+
 @bp.route("/financeiro")
 @login_required
 def financeiro():
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute("SELECT COALESCE(SUM(valor_pago),0) AS total_recebido FROM pedidos WHERE pago = 1")
-    total_recebido = float(cur.fetchone()["total_recebido"] or 0)
-
-    cur.execute("SELECT COUNT(*) AS qtd_abertos FROM pedidos WHERE pago = 0")
-    qtd_abertos = int(cur.fetchone()["qtd_abertos"] or 0)
-
-    cur.execute("""
-        SELECT
-            p.id,
-            p.data_pagamento,
-            p.valor_pago,
-            c.nome AS cliente,
-            pr.nome AS produto
-        FROM pedidos p
-        JOIN clientes c ON c.id = p.cliente_id
-        JOIN produtos pr ON pr.id = p.produto_id
-        WHERE p.pago = 1
-        ORDER BY p.data_pagamento DESC
-        LIMIT 20
-    """)
-    ultimos = cur.fetchall()
-
+    de = data_param("de")
+    ate = data_param("ate")
+    hoje = date.today()
     return render_template(
         "financeiro.html",
-        total_recebido=total_recebido,
-        qtd_abertos=qtd_abertos,
-        ultimos=ultimos,
+        de=de,
+        ate=ate,
+        atalhos={
+            "Últimos 30 dias": ((hoje - timedelta(days=29)).isoformat(), hoje.isoformat()),
+            "Este mês": (hoje.replace(day=1).isoformat(), hoje.isoformat()),
+        },
+        **painel(current_user_id(), de, ate),
     )
+
+
+@bp.cli.command("recalcular")
+def recalcular_cli() -> None:
+    """Refaz o rollup do financeiro a partir dos pedidos."""
+    for uid in listar_tenants() if shards_ativos() else [None]:
+        if uid is not None:
+            usar_tenant(uid)
+        con = get_db()
+        recalcular_financeiro(con, uid)
+        con.commit()
+    click.echo("rollup do financeiro recalculado")
@@ -0,0 +1,107 @@
+"""Cliente HTTP assíncrono (httpx) compartilhado pelos provedores.
+
+As chamadas ao Asaas e ao Twilio são `async` e rodam num event loop próprio
+do processo, numa thread em background. Assim:
+
+- código síncrono (os jobs da fila) chama `executar(coro)` e só a thread
+  dele espera; o loop multiplexa todas as chamadas em voo sobre um pool de
+  conexões keep-alive;
+- jobs disparam vários envios de uma vez com `reunir(coros, limite)`;
+- as corrotinas dos provedores (`*_async`) usam `cliente()` direto.
+
+Variáveis de ambiente:
+- HTTP_MAX_CONEXOES: conexões simultâneas por processo. Default 100.
+- HTTP_KEEPALIVE: conexões ociosas mantidas abertas. Default 20.
+- HTTP_TIMEOUT: timeout (s) de cada chamada. Default 30.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import httpx
+
+HTTP_MAX_CONEXOES = int(os.getenv("HTTP_MAX_CONEXOES", "100"))
+HTTP_KEEPALIVE = int(os.getenv("HTTP_KEEPALIVE", "20"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+
+_lock = threading.Lock()
+_loop: asyncio.AbstractEventLoop | None = None
+# Um AsyncClient por event loop (o pool de conexões pertence ao loop)
+_clientes: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _reiniciar_no_filho() -> None:
+    """A thread do loop não sobrevive ao fork: o worker cria a sua."""
+    global _lock, _loop
+    _lock = threading.Lock()
+    _loop = None
+    _clientes.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_no_filho)
+
+
+def _loop_fundo() -> asyncio.AbstractEventLoop:
+    """Retorna (criando sob demanda) o loop em background deste processo."""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, daemon=True, name="http-async"
+                ).start()
+                _loop = loop
+    return _loop
+
+
+def cliente() -> "httpx.AsyncClient":
+    """AsyncClient do loop atual (deve ser chamado dentro de uma corrotina)."""
+    loop = asyncio.get_running_loop()
+    c = _clientes.get(loop)
+    if c is None:
+        # import tardio: o boot do app não paga o httpx
+        import httpx
+
+        c = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONEXOES,
+                max_keepalive_connections=HTTP_KEEPALIVE,
+            ),
+            timeout=HTTP_TIMEOUT,
+        )
+        _clientes[loop] = c
+    return c
+
+
+def executar(coro, timeout: float | None = None):
+    """Roda a corrotina no loop em background e espera o resultado."""
+    futuro = asyncio.run_coroutine_threadsafe(coro, _loop_fundo())
+    return futuro.result(timeout)
+
+
+async def _limitado(sem: asyncio.Semaphore, coro):
+    async with sem:
+        return await coro
+
+
+def reunir(coros, limite: int = 20, timeout: float | None = None) -> list:
+    """Roda várias corrotinas em paralelo (no máximo `limite` em voo).
+
+    Devolve os resultados na ordem de entrada; exceções vêm como valores.
+    """
+
+    async def _todas():
+        sem = asyncio.Semaphore(max(limite, 1))
+        return await asyncio.gather(
+            *(_limitado(sem, c) for c in coros), return_exceptions=True
+        )
+
+    return executar(_todas(), timeout)
@@ -0,0 +1,300 @@
+"""Importação em massa de clientes e produtos via CSV.
+
+O arquivo é lido em streaming (linha a linha) e gravado em lotes com
+`executemany`, um lote por transação. Registros que já existem são pulados
+(clientes por telefone, ou nome quando não há telefone; produtos por nome),
+consultando o banco pelos índices de (usuario_id, telefone/nome). Cada produto
+novo já ganha sua linha em `estoque`.
+
+Colunas aceitas (cabeçalho obrigatório, separador `,` ou `;`):
+- clientes: nome, telefone
+- produtos: nome, preco, quantidade (opcional), minimo (opcional)
+
+Uso pela linha de comando:
+    flask --app run importacao clientes clientes.csv --usuario admin
+    flask --app run importacao produtos produtos.csv --usuario admin
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+import click
+from flask import Blueprint, flash, redirect, render_template, request, url_for
+
+from .db import get_catalogo, get_db, usar_tenant
+from .repositorio import DB_BACKEND, apenas_sqlite
+from .utils import apenas_numeros, current_user_id, login_required
+
+bp = Blueprint("importacao", __name__)
+bp.before_request(apenas_sqlite)
+
+TAMANHO_LOTE = 5000
+MAX_ERROS_EXIBIDOS = 200
+
+
+@dataclass
+class RelatorioImportacao:
+    """Resultado de uma importação (erros por número de linha do CSV)."""
+
+    inseridos: int = 0
+    duplicados: int = 0
+    erros: list[tuple[int, str]] = field(default_factory=list)
+
+
+def _ler_csv(linhas: Iterable[str]) -> Iterator[tuple[int, dict]]:
+    """Lê o CSV em streaming, detectando `,` ou `;` pelo cabeçalho.
+
+    Gera (numero_da_linha, {coluna: valor}) com colunas em minúsculas.
+    """
+    it = iter(linhas)
+    cabecalho = next(it, "")
+    delimitador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+    colunas = [
+        c.strip().lower()
+        for c in next(csv.reader([cabecalho], delimiter=delimitador), [])
+    ]
+    for numero, valores in enumerate(csv.reader(it, delimiter=delimitador), 2):
+        if not any(v.strip() for v in valores):
+            continue
+        yield numero, dict(zip(colunas, (v.strip() for v in valores)))
+
+
+def _parse_preco(texto: str) -> float:
+    """Aceita 9.90, 9,90 e 1.234,56."""
+    texto = (texto or "").strip().replace("R$", "").strip()
+    if "," in texto and "." in texto:
+        texto = texto.replace(".", "")
+    return float(texto.replace(",", "."))
+
+
+def _parse_inteiro(texto: str | None) -> int:
+    """Inteiro opcional (vazio = 0)."""
+    texto = (texto or "").strip()
+    return int(texto) if texto else 0
+
+
+def _lotes(itens: Iterable, tamanho: int) -> Iterator[list]:
+    """Agrupa um iterável em listas de até `tamanho` itens."""
+    lote: list = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def importar_clientes(
+    con: sqlite3.Connection, uid: int, linhas: Iterable[str]
+) -> RelatorioImportacao:
+    """Importa clientes (nome, telefone) para o usuário `uid`."""
+    rel = RelatorioImportacao()
+
+    telefones: set[str] = set()
+    nomes_sem_tel: set[str] = set()
+    for row in con.execute(
+        "SELECT telefone, nome FROM clientes WHERE usuario_id = ?", (uid,)
+    ):
+        if row["telefone"]:
+            telefones.add(row["telefone"])
+        else:
+            nomes_sem_tel.add((row["nome"] or "").lower())
+
+    def validos() -> Iterator[tuple]:
+        for numero, reg in _ler_csv(linhas):
+            nome = reg.get("nome", "")
+            telefone = apenas_numeros(reg.get("telefone", ""))
+            if not nome:
+                rel.erros.append((numero, "nome vazio"))
+                continue
+            if telefone and not 10 <= len(telefone) <= 13:
+                rel.erros.append((numero, f"telefone inválido: {reg.get('telefone')}"))
+                continue
+            if telefone:
+                if telefone in telefones:
+                    rel.duplicados += 1
+                    continue
+                telefones.add(telefone)
+            else:
+                chave = nome.lower()
+                if chave in nomes_sem_tel:
+                    rel.duplicados += 1
+                    continue
+                nomes_sem_tel.add(chave)
+            yield (uid, nome, telefone)
+
+    for lote in _lotes(validos(), TAMANHO_LOTE):
+        with con:
+            con.executemany(
+                "INSERT INTO clientes (usuario_id, nome, telefone) VALUES (?, ?, ?)",
+                lote,
+            )
+        rel.inseridos += len(lote)
+
+    return rel
+
+
+def importar_produtos(
+    con: sqlite3.Connection, uid: int, linhas: Iterable[str]
+) -> RelatorioImportacao:
+    """Importa produtos (nome, preco, quantidade, minimo) e cria o estoque."""
+    rel = RelatorioImportacao()
+
+    nomes = {
+        (row["nome"] or "").lower()
+        for row in con.execute(
+            "SELECT nome FROM produtos WHERE usuario_id = ?", (uid,)
+        )
+    }
+
+    def validos() -> Iterator[tuple]:
+        for numero, reg in _ler_csv(linhas):
+            nome = reg.get("nome", "")
+            if not nome:
+                rel.erros.append((numero, "nome vazio"))
+                continue
+            try:
+                preco = _parse_preco(reg.get("preco", ""))
+                if preco <= 0:
+                    raise ValueError
+            except ValueError:
+                rel.erros.append((numero, f"preço inválido: {reg.get('preco')}"))
+                continue
+            try:
+                quantidade = _parse_inteiro(reg.get("quantidade"))
+                minimo = _parse_inteiro(reg.get("minimo"))
+                if quantidade < 0 or minimo < 0:
+                    raise ValueError
+            except ValueError:
+                rel.erros.append((numero, "quantidade/mínimo inválido"))
+                continue
+            chave = nome.lower()
+            if chave in nomes:
+                rel.duplicados += 1
+                continue
+            nomes.add(chave)
+            yield (nome, preco, quantidade, minimo)
+
+    for lote in _lotes(validos(), TAMANHO_LOTE):
+        # BEGIN IMMEDIATE: ninguém insere produtos entre o INSERT e a leitura
+        # dos ids novos, que são casados pelo nome.
+        if con.in_transaction:
+            con.commit()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            ultimo_id = con.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM produtos"
+            ).fetchone()[0]
+            con.executemany(
+                "INSERT INTO produtos (usuario_id, nome, preco) VALUES (?, ?, ?)",
+                [(uid, nome, preco) for nome, preco, _, _ in lote],
+            )
+            ids = {
+                row["nome"]: row["id"]
+                for row in con.execute(
+                    "SELECT id, nome FROM produtos WHERE usuario_id = ? AND id > ?",
+                    (uid, ultimo_id),
+                )
+            }
+            con.executemany(
+                """
+                INSERT OR IGNORE INTO estoque (
+                    usuario_id,
+                    produto_id,
+                    quantidade,
+                    minimo
+                )
+                VALUES (?, ?, ?, ?)
+                """,
+                [(uid, ids[nome], qtd, minimo) for nome, _, qtd, minimo in lote],
+            )
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        rel.inseridos += len(lote)
+
+    return rel
+
+
+IMPORTADORES = {
+    "clientes": importar_clientes,
+    "produtos": importar_produtos,
+}
+
+
+@bp.route("/importar", methods=["GET", "POST"])
+@login_required
+def importar():
+    """Tela de upload do CSV e relatório da importação."""
+    if request.method != "POST":
+        return render_template("importar.html", relatorio=None)
+
+    tipo = request.form.get("tipo", "")
+    arquivo = request.files.get("arquivo")
+    if tipo not in IMPORTADORES or not arquivo or not arquivo.filename:
+        flash("Escolha o tipo e o arquivo CSV.", "warning")
+        return redirect(url_for("importacao.importar"))
+
+    texto = io.TextIOWrapper(arquivo.stream, encoding="utf-8-sig", newline="")
+    try:
+        rel = IMPORTADORES[tipo](get_db(), current_user_id(), texto)
+    except UnicodeDecodeError:
+        flash("O arquivo precisa estar em UTF-8.", "error")
+        return redirect(url_for("importacao.importar"))
+
+    flash(
+        f"Importação concluída: {rel.inseridos} inserido(s), "
+        f"{rel.duplicados} já existente(s), {len(rel.erros)} erro(s).",
+        "success" if not rel.erros else "warning",
+    )
+    return render_template(
+        "importar.html",
+        tipo=tipo,
+        relatorio=rel,
+        erros=rel.erros[:MAX_ERROS_EXIBIDOS],
+    )
+
+
+@bp.cli.command("clientes")
+@click.argument("arquivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--usuario", required=True, help="username dono dos registros")
+def importar_clientes_cli(arquivo: str, usuario: str) -> None:
+    """Importa clientes de um CSV."""
+    _importar_cli("clientes", arquivo, usuario)
+
+
+@bp.cli.command("produtos")
+@click.argument("arquivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--usuario", required=True, help="username dono dos registros")
+def importar_produtos_cli(arquivo: str, usuario: str) -> None:
+    """Importa produtos de um CSV."""
+    _importar_cli("produtos", arquivo, usuario)
+
+
+def _importar_cli(tipo: str, arquivo: str, usuario: str) -> None:
+    """Executa a importação para o usuário informado e imprime o relatório."""
+    if DB_BACKEND != "sqlite":
+        raise click.ClickException("a importação ainda não funciona com DB_BACKEND=postgres")
+    row = get_catalogo().execute(
+        "SELECT id FROM usuarios WHERE username = ?", (usuario,)
+    ).fetchone()
+    if not row:
+        raise click.ClickException(f"usuário não encontrado: {usuario}")
+
+    usar_tenant(int(row["id"]))
+    with open(arquivo, encoding="utf-8-sig", newline="") as fh:
+        rel = IMPORTADORES[tipo](get_db(), int(row["id"]), fh)
+
+    click.echo(
+        f"{rel.inseridos} inserido(s), {rel.duplicados} já existente(s), "
+        f"{len(rel.erros)} erro(s)"
+    )
+    for numero, erro in rel.erros:
+        click.echo(f"linha {numero}: {erro}", err=True)
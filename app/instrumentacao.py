@@ -0,0 +1,165 @@
+"""Instrumentação de SQL: contagem por request, tempo e log de queries lentas.
+
+Toda conexão aberta por `db.conectar()` usa `ConexaoInstrumentada`, que mede
+cada execute/executemany. Por request acumulamos quantidade e tempo total e
+devolvemos no header `Server-Timing` (aparece no DevTools do navegador):
+
+    Server-Timing: db;dur=12.4;desc="7 queries", app;dur=30.1
+
+Queries acima do limite vão para o logger `app.sql` com a rota e o "formato"
+dos parâmetros (tipos, nunca os valores).
+
+Variáveis de ambiente:
+- SQL_INSTRUMENTACAO: 1 (default) liga; 0 desliga.
+- SQL_LENTA_MS: limite para log de query lenta. Default 100.
+
+Em runtime: `ativar(True/False)` e `definir_limite_lenta(ms)`.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import Flask, has_request_context, request
+
+from .metricas import db_conexoes, db_queries, db_tempo
+
+log = logging.getLogger("app.sql")
+
+_ativo = os.getenv("SQL_INSTRUMENTACAO", "1") == "1"
+_limite_lenta = float(os.getenv("SQL_LENTA_MS", "100")) / 1000
+
+_estado = threading.local()
+
+
+def ativar(ligado: bool = True) -> None:
+    """Liga/desliga a instrumentação neste processo."""
+    global _ativo
+    _ativo = bool(ligado)
+
+
+def ativo() -> bool:
+    """Indica se a instrumentação está ligada."""
+    return _ativo
+
+
+def definir_limite_lenta(ms: float) -> None:
+    """Altera o limite (ms) do log de queries lentas."""
+    global _limite_lenta
+    _limite_lenta = float(ms) / 1000
+
+
+def _formato_params(params) -> str:
+    """Descreve os parâmetros só pelos tipos: (int, str, NoneType)."""
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    try:
+        return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    except TypeError:
+        return type(params).__name__
+
+
+def _registrar(sql: str, params, duracao: float, lote: int | None = None) -> None:
+    """Soma a query no contador da thread e loga se passou do limite."""
+    _estado.queries = getattr(_estado, "queries", 0) + 1
+    _estado.tempo = getattr(_estado, "tempo", 0.0) + duracao
+    db_queries.inc()
+    db_tempo.inc(duracao)
+
+    if duracao < _limite_lenta:
+        return
+    rota = request.endpoint if has_request_context() else "-"
+    texto = re.sub(r"\s+", " ", sql).strip()[:300]
+    formato = f"{lote}x " if lote is not None else ""
+    log.warning(
+        "query lenta %.1fms rota=%s params=%s%s sql=%s",
+        duracao * 1000, rota, formato, _formato_params(params), texto,
+    )
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que mede execute/executemany."""
+
+    def execute(self, sql, params=()):
+        if not _ativo:
+            return super().execute(sql, params)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            _registrar(sql, params, time.perf_counter() - inicio)
+
+    def executemany(self, sql, seq_params):
+        if not _ativo:
+            return super().executemany(sql, seq_params)
+        if not isinstance(seq_params, (list, tuple)):
+            seq_params = list(seq_params)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_params)
+        finally:
+            exemplo = seq_params[0] if seq_params else None
+            _registrar(sql, exemplo, time.perf_counter() - inicio, lote=len(seq_params))
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de `con.execute`) são medidos."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._aberta = True
+        db_conexoes.inc()
+
+    def close(self):
+        if getattr(self, "_aberta", False):
+            self._aberta = False
+            db_conexoes.dec()
+        super().close()
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self.cursor().executemany(sql, seq_params)
+
+
+def zerar() -> None:
+    """Zera os contadores da thread atual (início de request/job)."""
+    _estado.queries = 0
+    _estado.tempo = 0.0
+
+
+def totais() -> tuple[int, float]:
+    """(quantidade de queries, segundos em SQL) desde o último `zerar()`."""
+    return getattr(_estado, "queries", 0), getattr(_estado, "tempo", 0.0)
+
+
+def instalar(app: Flask) -> None:
+    """Zera por request e devolve os totais no header Server-Timing."""
+
+    @app.before_request
+    def _inicio_request():
+        zerar()
+        _estado.inicio_request = time.perf_counter()
+
+    @app.after_request
+    def _server_timing(response):
+        if not _ativo:
+            return response
+        queries, tempo = totais()
+        total = time.perf_counter() - getattr(_estado, "inicio_request", time.perf_counter())
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={tempo * 1000:.1f};desc="{queries} queries", app;dur={total * 1000:.1f}',
+        )
+        return response
@@ -0,0 +1,459 @@
+"""Métricas operacionais no formato texto do Prometheus (`/metrics`).
+
+Registro em memória, sem dependências: contadores, gauges e histogramas com
+labels. Com vários workers do gunicorn, defina METRICS_DIR: cada processo
+grava seu estado num arquivo `<pid>.json` nesse diretório (no máximo a cada
+METRICS_FLUSH_S segundos) e o `/metrics` de qualquer worker soma todos.
+Gauges de processos que já morreram são descartados; contadores e
+histogramas deles vão para `mortos.json` e o arquivo do pid é apagado,
+para o total não "voltar no tempo" nem o diretório crescer sem fim. Um
+processo novo que herde o pid de um morto recolhe o arquivo antigo antes
+de gravar o seu.
+
+Variáveis de ambiente:
+- METRICS_DIR: diretório do modo multiprocesso (vazio = só este processo).
+- METRICS_FLUSH_S: intervalo mínimo entre gravações. Default 5.
+- METRICS_TOKEN: se definido, exige `Authorization: Bearer <token>`. Sem
+  ele, `/metrics` só responde a requests da própria máquina (loopback) que
+  não passaram por um proxy reverso (sem X-Forwarded-For/Forwarded); as
+  demais recebem 403.
+"""
+
+from __future__ import annotations
+
+import hmac
+import ipaddress
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem o modo multiprocesso do gunicorn
+    fcntl = None
+
+from flask import Blueprint, Flask, Response, abort, g, request
+
+bp = Blueprint("metricas", __name__)
+
+METRICS_DIR = os.getenv("METRICS_DIR", "").strip()
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+# nome -> (tipo, ajuda, nomes_labels, buckets)
+_definicoes: dict[str, tuple[str, str, tuple[str, ...], tuple[float, ...]]] = {}
+# (nome, valores_labels) -> float | [contagens_por_bucket..., soma, total]
+_valores: dict[tuple[str, tuple[str, ...]], object] = {}
+_ultimo_flush = 0.0
+# este processo já gravou o seu <pid>.json?
+_gravou = False
+
+# Contadores e histogramas dos processos mortos (modo multiprocesso)
+_ACUMULADO = "mortos.json"
+
+
+def _reiniciar_no_filho() -> None:
+    """Depois do fork o worker começa zerado (não herda o estado do master)."""
+    global _lock, _ultimo_flush, _gravou
+    _lock = threading.Lock()
+    _valores.clear()
+    _ultimo_flush = 0.0
+    _gravou = False
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_no_filho)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, labels: tuple[str, ...] = (), buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.labels_nomes = tuple(labels)
+        _definicoes[nome] = (self.tipo, ajuda, self.labels_nomes, tuple(buckets))
+
+    def _chave(self, labels: dict) -> tuple[str, tuple[str, ...]]:
+        return self.nome, tuple(str(labels.get(n, "")) for n in self.labels_nomes)
+
+
+class Contador(_Metrica):
+    """Valor que só cresce (ex.: requests, erros)."""
+
+    tipo = "counter"
+
+    def inc(self, valor: float = 1.0, **labels) -> None:
+        chave = self._chave(labels)
+        with _lock:
+            _valores[chave] = _valores.get(chave, 0.0) + valor
+        _talvez_flush()
+
+
+class Gauge(_Metrica):
+    """Valor que sobe e desce (ex.: conexões abertas, fila pendente)."""
+
+    tipo = "gauge"
+
+    def set(self, valor: float, **labels) -> None:
+        with _lock:
+            _valores[self._chave(labels)] = float(valor)
+        _talvez_flush()
+
+    def inc(self, valor: float = 1.0, **labels) -> None:
+        chave = self._chave(labels)
+        with _lock:
+            _valores[chave] = _valores.get(chave, 0.0) + valor
+        _talvez_flush()
+
+    def dec(self, valor: float = 1.0, **labels) -> None:
+        self.inc(-valor, **labels)
+
+
+class Histograma(_Metrica):
+    """Distribuição em buckets cumulativos (ex.: latência)."""
+
+    tipo = "histogram"
+
+    def observe(self, valor: float, **labels) -> None:
+        buckets = _definicoes[self.nome][3]
+        chave = self._chave(labels)
+        with _lock:
+            dados = _valores.get(chave)
+            if dados is None:
+                dados = [0.0] * (len(buckets) + 2)
+                _valores[chave] = dados
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    dados[i] += 1
+            dados[-2] += valor
+            dados[-1] += 1
+        _talvez_flush()
+
+    @contextmanager
+    def medir(self, **labels):
+        """Mede a duração do bloco `with`."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+
+# ---------------------------------------------------------------------------
+# Métricas do sistema
+# ---------------------------------------------------------------------------
+http_requests = Contador(
+    "http_requests_total", "Requests atendidos.", ("blueprint", "metodo", "status")
+)
+http_duracao = Histograma(
+    "http_request_duration_seconds", "Latência dos requests.", ("blueprint", "metodo")
+)
+db_conexoes = Gauge("db_conexoes_abertas", "Conexões SQLite abertas.")
+db_queries = Contador("db_queries_total", "Statements SQL executados.")
+db_tempo = Contador("db_query_seconds_total", "Tempo total gasto em SQL.")
+db_espera_escrita = Histograma(
+    "db_escrita_espera_seconds", "Espera pela vez na fila do escritor SQLite.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+login_duracao = Histograma(
+    "login_duration_seconds", "Duração da verificação de login (bcrypt).",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0),
+)
+fila_jobs = Contador(
+    "fila_jobs_total", "Jobs da fila finalizados.", ("tarefa", "resultado")
+)
+fila_duracao = Histograma(
+    "fila_execucao_seconds", "Duração de cada execução de job.", ("tarefa",)
+)
+fila_espera = Histograma(
+    "fila_espera_seconds", "Tempo entre o job ficar pronto e começar a rodar.", ("tarefa",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+fila_pendentes = Gauge(
+    "fila_pendentes", "Jobs prontos aguardando um executor.", ("tarefa",)
+)
+scheduler_pendentes = Gauge(
+    "scheduler_pendentes", "Itens vencidos aguardando o job.", ("job",)
+)
+scheduler_itens = Contador(
+    "scheduler_itens_total", "Itens processados pelos jobs.", ("job", "resultado")
+)
+provedor_duracao = Histograma(
+    "provedor_request_duration_seconds", "Latência das chamadas externas.",
+    ("provedor", "operacao"),
+)
+provedor_erros = Contador(
+    "provedor_erros_total", "Falhas nas chamadas externas.", ("provedor", "operacao")
+)
+webhook_eventos = Contador(
+    "webhook_eventos_total", "Eventos recebidos por webhook.", ("origem", "evento", "resultado")
+)
+eventos_publicados = Contador(
+    "eventos_publicados_total", "Eventos das telas ao vivo publicados.", ("tipo",)
+)
+eventos_conexoes = Gauge("eventos_conexoes", "Conexões SSE (/eventos) abertas.")
+
+
+@contextmanager
+def medir_provedor(provedor: str, operacao: str):
+    """Mede uma chamada externa e conta exceções como erro."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        provedor_erros.inc(provedor=provedor, operacao=operacao)
+        raise
+    finally:
+        provedor_duracao.observe(
+            time.perf_counter() - inicio, provedor=provedor, operacao=operacao
+        )
+
+
+# ---------------------------------------------------------------------------
+# Multiprocesso (arquivos por pid)
+# ---------------------------------------------------------------------------
+def _serializar() -> dict:
+    with _lock:
+        return {
+            "pid": os.getpid(),
+            "valores": [[n, list(lbl), v] for (n, lbl), v in _valores.items()],
+        }
+
+
+def _gravar_json(destino: str, estado: dict) -> None:
+    tmp = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(estado, fh)
+    os.replace(tmp, destino)
+
+
+def _ler_json(caminho: str) -> dict | None:
+    try:
+        with open(caminho, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _trava_diretorio():
+    """Lock entre processos para mexer nos arquivos dos mortos."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(METRICS_DIR, ".lock"), "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _somar(total: dict, estado: dict, com_gauges: bool) -> None:
+    """Acrescenta os valores de um arquivo de estado em `total`."""
+    for nome, labels, valor in estado.get("valores", []):
+        definicao = _definicoes.get(nome)
+        if definicao is None:
+            continue
+        if definicao[0] == "gauge" and not com_gauges:
+            continue
+        chave = (nome, tuple(labels))
+        atual = total.get(chave)
+        if isinstance(valor, list):
+            total[chave] = valor if atual is None else [a + b for a, b in zip(atual, valor)]
+        else:
+            total[chave] = valor if atual is None else atual + valor
+
+
+def _recolher(caminhos: list[str]) -> None:
+    """Soma os arquivos de processos mortos em `mortos.json` e os apaga.
+
+    Chamar com a trava do diretório.
+    """
+    acumulado_path = os.path.join(METRICS_DIR, _ACUMULADO)
+    acumulado = _ler_json(acumulado_path) or {}
+    total = {
+        (nome, tuple(labels)): valor
+        for nome, labels, valor in acumulado.get("valores", [])
+    }
+    recolhidos = []
+    for caminho in caminhos:
+        estado = _ler_json(caminho)
+        if estado is None:
+            continue  # outro processo recolheu antes
+        _somar(total, estado, com_gauges=False)
+        recolhidos.append(caminho)
+    if not recolhidos:
+        return
+    _gravar_json(
+        acumulado_path,
+        {"pid": None, "valores": [[n, list(lbl), v] for (n, lbl), v in total.items()]},
+    )
+    for caminho in recolhidos:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+def flush() -> None:
+    """Grava o estado deste processo em METRICS_DIR (escrita atômica)."""
+    global _ultimo_flush, _gravou
+    if not METRICS_DIR:
+        return
+    _ultimo_flush = time.monotonic()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    destino = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    if not _gravou:
+        # um arquivo com o nosso pid antes da 1ª gravação é de um processo
+        # morto que teve o mesmo pid: recolhe antes de sobrescrever
+        if os.path.exists(destino):
+            with _trava_diretorio():
+                _recolher([destino])
+        _gravou = True
+    _gravar_json(destino, _serializar())
+
+
+def _talvez_flush() -> None:
+    if METRICS_DIR and time.monotonic() - _ultimo_flush >= METRICS_FLUSH_S:
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _pid_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _coletar() -> dict[tuple[str, tuple[str, ...]], object]:
+    """Estado agregado: só este processo ou todos os de METRICS_DIR."""
+    if not METRICS_DIR:
+        with _lock:
+            return {k: (list(v) if isinstance(v, list) else v) for k, v in _valores.items()}
+
+    flush()
+    total: dict[tuple[str, tuple[str, ...]], object] = {}
+    # a leitura também fica sob a trava: um arquivo no meio do recolhimento
+    # (já somado em mortos.json, ainda não apagado) contaria duas vezes
+    with _trava_diretorio():
+        mortos = []
+        for arquivo in os.listdir(METRICS_DIR):
+            if not arquivo.endswith(".json") or arquivo == _ACUMULADO:
+                continue
+            pid = arquivo[: -len(".json")]
+            if pid.isdigit() and not _pid_vivo(int(pid)):
+                mortos.append(os.path.join(METRICS_DIR, arquivo))
+        if mortos:
+            _recolher(mortos)
+
+        for arquivo in os.listdir(METRICS_DIR):
+            if not arquivo.endswith(".json"):
+                continue
+            estado = _ler_json(os.path.join(METRICS_DIR, arquivo))
+            if estado is None:
+                continue
+            _somar(total, estado, com_gauges=arquivo != _ACUMULADO)
+    return total
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(nomes: tuple[str, ...], valores: tuple[str, ...], extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _fmt_num(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf"
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+
+def exposicao() -> str:
+    """Texto no formato de exposição do Prometheus (0.0.4)."""
+    valores = _coletar()
+    linhas: list[str] = []
+    for nome, (tipo, ajuda, labels_nomes, buckets) in sorted(_definicoes.items()):
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        for (n, lbl), valor in sorted(valores.items()):
+            if n != nome:
+                continue
+            if tipo == "histogram":
+                for limite, qtd in zip(buckets, valor):
+                    le = f'le="{_fmt_num(limite)}"'
+                    linhas.append(f"{nome}_bucket{_fmt_labels(labels_nomes, lbl, le)} {_fmt_num(qtd)}")
+                inf = _fmt_labels(labels_nomes, lbl, 'le="+Inf"')
+                linhas.append(f"{nome}_bucket{inf} {_fmt_num(valor[-1])}")
+                linhas.append(f"{nome}_sum{_fmt_labels(labels_nomes, lbl)} {_fmt_num(valor[-2])}")
+                linhas.append(f"{nome}_count{_fmt_labels(labels_nomes, lbl)} {_fmt_num(valor[-1])}")
+            else:
+                linhas.append(f"{nome}{_fmt_labels(labels_nomes, lbl)} {_fmt_num(valor)}")
+    return "\n".join(linhas) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Flask
+# ---------------------------------------------------------------------------
+def instalar(app: Flask) -> None:
+    """Mede latência e status de todo request, por blueprint."""
+
+    @app.before_request
+    def _inicio_metricas():
+        g.metricas_inicio = time.perf_counter()
+
+    @app.after_request
+    def _fim_metricas(response):
+        inicio = g.pop("metricas_inicio", None)
+        if inicio is not None and request.endpoint != "metricas.metrics":
+            blueprint = request.blueprint or "-"
+            http_duracao.observe(
+                time.perf_counter() - inicio, blueprint=blueprint, metodo=request.method
+            )
+            http_requests.inc(
+                blueprint=blueprint, metodo=request.method, status=response.status_code
+            )
+        return response
+
+
+def _local() -> bool:
+    """Request da própria máquina, sem passar por proxy reverso.
+
+    Um proxy na mesma máquina conecta de 127.0.0.1: os cabeçalhos que ele
+    acrescenta denunciam que a request veio de fora.
+    """
+    if request.headers.get("X-Forwarded-For") or request.headers.get("Forwarded"):
+        return False
+    try:
+        return ipaddress.ip_address(request.remote_addr or "").is_loopback
+    except ValueError:
+        return False
+
+
+@bp.route("/metrics")
+def metrics():
+    """Exposição das métricas (Prometheus)."""
+    token = os.getenv("METRICS_TOKEN", "").strip()
+    if token:
+        enviado = request.headers.get("Authorization", "").encode()
+        if not hmac.compare_digest(enviado, f"Bearer {token}".encode()):
+            abort(401)
+    elif not _local():
+        abort(403)
+    return Response(exposicao(), mimetype="text/plain; version=0.0.4")
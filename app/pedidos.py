@@ -1,13 +1,27 @@
-"""Rotas de pedidos (criar, listar e marcar como pago)."""
+"""Rotas de pedidos (criar, listar e marcar como pago).
+
+Um pedido tem vários itens (`pedido_itens`): cobrança, lembrete e juros são
+por pedido. `flask --app run pedidos agrupar` junta os pedidos antigos (um
+produto por linha) de um mesmo carrinho.
+"""
 
 from __future__ import annotations
 
 from datetime import date
 
+import click
 from flask import Blueprint, flash, redirect, render_template, request
 
-from .db import get_db
-from .utils import current_user_id, login_required, vencimento_do_pedido
+from .eventos import publicar
+from .repositorio import repo
+from .utils import (
+    PEDIDO_MAX_ITENS,
+    current_user_id,
+    itens_do_formulario,
+    login_required,
+    por_tenant,
+    vencimento_do_pedido,
+)
 
 bp = Blueprint("pedidos", __name__)
 
@@ -15,136 +29,108 @@ bp = Blueprint("pedidos", __name__)
 @bp.route("/pedidos", methods=["GET", "POST"])
 @login_required
 def pedidos():
-    """Tela de criação de pedidos."""
+    """Tela de criação de pedidos (um cliente, vários produtos)."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute(
-        "SELECT id, nome, telefone FROM clientes "
-        "WHERE usuario_id = ? ORDER BY nome",
-        (uid,),
-    )
-    clientes = cur.fetchall()
-
-    cur.execute(
-        "SELECT id, nome, preco FROM produtos "
-        "WHERE usuario_id = ? ORDER BY nome",
-        (uid,),
-    )
-    produtos = cur.fetchall()
+    r = repo().pedidos
 
     if request.method == "POST":
         try:
             cliente_id = int(request.form["cliente_id"])
-            produto_id = int(request.form["produto_id"])
-            quantidade = int(request.form["quantidade"])
-            if quantidade < 1:
+            carrinho = itens_do_formulario(request.form)
+            if not carrinho:
                 raise ValueError
         except (KeyError, ValueError):
             flash("Dados inválidos!", "error")
             return redirect("/pedidos")
 
-        cur.execute(
-            "SELECT 1 FROM clientes WHERE id = ? AND usuario_id = ?",
-            (cliente_id, uid),
-        )
-        if not cur.fetchone():
+        if not r.cliente_existe(uid, cliente_id):
             flash("Cliente inválido!", "error")
             return redirect("/pedidos")
 
-        cur.execute(
-            "SELECT 1 FROM produtos WHERE id = ? AND usuario_id = ?",
-            (produto_id, uid),
-        )
-        if not cur.fetchone():
+        produtos = r.produtos(uid, [pid for pid, _ in carrinho])
+        if len(produtos) != len(carrinho):
             flash("Produto inválido!", "error")
             return redirect("/pedidos")
 
         hoje = date.today()
         venc = vencimento_do_pedido(hoje)
 
-        cur.execute(
-            """
-            INSERT INTO pedidos (
-                usuario_id,
-                cliente_id,
-                produto_id,
-                quantidade,
-                data,
-                vencimento,
-                hora_vencimento,
-                pago
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
-            """,
-            (
-                uid,
-                cliente_id,
-                produto_id,
-                quantidade,
-                hoje.isoformat(),
-                venc.isoformat(),
-                '09:00',
-            ),
+        itens = [(pid, qtd, float(produtos[pid]["preco"])) for pid, qtd in carrinho]
+        pedido_id = r.criar(
+            uid,
+            cliente_id,
+            itens,
+            hoje.isoformat(),
+            venc.isoformat(),
+            "09:00",
+        )
+        repo().commit()
+        publicar(
+            uid,
+            "pedido_criado",
+            pedido_id=pedido_id,
+            cliente_id=cliente_id,
+            principal=round(sum(preco * qtd for _pid, qtd, preco in itens), 2),
+            mes=hoje.isoformat()[:7],
         )
-        con.commit()
 
         flash("Pedido criado ✅", "success")
         return redirect("/listar_pedidos")
 
+    # O formulário busca cliente/produto sob demanda (/busca/...); aqui só
+    # precisamos saber se existe pelo menos um de cada.
     return render_template(
         "pedidos.html",
-        clientes=clientes,
-        produtos=produtos,
+        tem_clientes=r.tem_clientes(uid),
+        tem_produtos=r.tem_produtos(uid),
+        max_itens=PEDIDO_MAX_ITENS,
     )
 
 
 @bp.route("/listar_pedidos")
 @login_required
 def listar_pedidos():
-    """Lista pedidos do usuário."""
-    uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute(
-        """
-        SELECT
-            pedidos.id,
-            pedidos.data,
-            clientes.nome,
-            produtos.nome,
-            produtos.preco,
-            pedidos.quantidade,
-            (produtos.preco * pedidos.quantidade) AS total,
-            pedidos.pago
-        FROM pedidos
-        JOIN clientes ON clientes.id = pedidos.cliente_id
-        JOIN produtos ON produtos.id = pedidos.produto_id
-        WHERE pedidos.usuario_id = ?
-        ORDER BY pedidos.id DESC
-        """,
-        (uid,),
+    """Lista pedidos do usuário (os arquivados só saem na exportação)."""
+    r = repo()
+    lista = r.pedidos.listar(current_user_id())
+    return render_template(
+        "listar_pedidos.html", pedidos=lista, arquivados_ate=r.arquivo.corte()
     )
 
-    lista = cur.fetchall()
-    return render_template("listar_pedidos.html", pedidos=lista)
-
 
 @bp.route("/marcar_pago/<int:pedido_id>", methods=["POST"])
 @login_required
 def marcar_pago(pedido_id: int):
     """Marca um pedido como pago."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute(
-        "UPDATE pedidos SET pago = 1 WHERE id = ? AND usuario_id = ?",
-        (pedido_id, uid),
-    )
-    con.commit()
+    row = repo().pedidos.marcar_pago(uid, pedido_id)
+    if row is not None:
+        principal = float(row["valor_principal"] or 0) - float(row["valor_abatido"] or 0)
+        publicar(
+            uid,
+            "pedido_pago",
+            pedidos=[pedido_id],
+            cliente_id=int(row["cliente_id"]),
+            principal=principal,
+            valor=principal,
+            origem="manual",
+        )
 
     flash("Pedido marcado como pago ✅", "success")
     return redirect("/listar_pedidos")
+
+
+def agrupar_legados() -> int:
+    """Junta os carrinhos antigos do banco atual e refaz o saldo deles."""
+    r = repo()
+    apagados = r.pedidos.agrupar_legados()
+    r.cobrancas.acumular(date.today().isoformat())
+    r.commit()
+    return apagados
+
+
+@bp.cli.command("agrupar")
+def agrupar_cli() -> None:
+    """Junta em um pedido os pedidos antigos de um mesmo carrinho."""
+    total = sum(por_tenant(agrupar_legados).values())
+    click.echo(f"{total} pedido(s) antigo(s) agrupado(s)")
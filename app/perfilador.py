@@ -0,0 +1,193 @@
+"""Profiler por amostragem para requests em produção (opt-in).
+
+Uma fração dos requests (PROFILE_SAMPLE_RATE) ou os que trazem o header
+`X-Profile` assinado é acompanhada por uma thread que, a cada
+PROFILE_INTERVALO_MS, lê a pilha da thread do request (`sys._current_frames`).
+O custo fica só nos requests amostrados; os demais pagam um `random()`.
+
+Ao final, as pilhas vão para um arquivo no formato "collapsed stack"
+(compatível com flamegraph.pl / speedscope) em PROFILE_DIR, que funciona como
+buffer circular: passando de PROFILE_MAX_ARQUIVOS, os mais antigos são
+apagados. A página /admin/perfis lista os mais lentos.
+
+Gerar um token para o header (vale 1 hora):
+    flask --app run perfil token
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import click
+from flask import Blueprint, Flask, abort, current_app, g, render_template, request, send_from_directory
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from .utils import admin_required
+
+bp = Blueprint("perfil", __name__)
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVALO_MS = float(os.getenv("PROFILE_INTERVALO_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "").strip() or os.path.join(
+    tempfile.gettempdir(), "sistema-vendas-perfis"
+)
+PROFILE_MAX_ARQUIVOS = int(os.getenv("PROFILE_MAX_ARQUIVOS", "200"))
+TOKEN_VALIDADE_S = 3600
+
+# <epoch_ms>-<duracao_ms>-<endpoint>.folded
+_NOME_ARQUIVO = re.compile(r"^(\d+)-(\d+)-([\w.\-]+)\.folded$")
+_lock_disco = threading.Lock()
+
+
+class Amostrador(threading.Thread):
+    """Thread que amostra a pilha de outra thread em intervalo fixo."""
+
+    def __init__(self, alvo: int, intervalo: float):
+        super().__init__(daemon=True, name="perfilador")
+        self.alvo = alvo
+        self.intervalo = intervalo
+        self.pilhas: Counter[str] = Counter()
+        self._parar = threading.Event()
+
+    def run(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.alvo)
+            if frame is None:
+                continue
+            quadros = []
+            while frame is not None:
+                codigo = frame.f_code
+                arquivo = os.path.basename(codigo.co_filename)
+                quadros.append(f"{codigo.co_name} ({arquivo}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.pilhas[";".join(reversed(quadros))] += 1
+
+    def parar(self) -> Counter[str]:
+        self._parar.set()
+        self.join(timeout=1)
+        return self.pilhas
+
+
+def _serializer(app: Flask) -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(app.secret_key, salt="perfil")
+
+
+def gerar_token(app: Flask) -> str:
+    """Token para o header X-Profile (assinado com a SECRET_KEY)."""
+    return _serializer(app).dumps("perfil")
+
+
+def _token_valido(token: str) -> bool:
+    try:
+        _serializer(current_app).loads(token, max_age=TOKEN_VALIDADE_S)
+    except BadSignature:
+        return False
+    return True
+
+
+def _deve_amostrar() -> bool:
+    token = request.headers.get("X-Profile")
+    if token:
+        return _token_valido(token)
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _gravar(endpoint: str, duracao: float, pilhas: Counter[str]) -> None:
+    """Grava o perfil e mantém só os PROFILE_MAX_ARQUIVOS mais recentes."""
+    if not pilhas:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    seguro = re.sub(r"[^\w.\-]", "_", endpoint or "desconhecido")
+    nome = f"{int(time.time() * 1000)}-{int(duracao * 1000)}-{seguro}.folded"
+    with open(os.path.join(PROFILE_DIR, nome), "w", encoding="utf-8") as fh:
+        for pilha, qtd in pilhas.most_common():
+            fh.write(f"{pilha} {qtd}\n")
+
+    with _lock_disco:
+        arquivos = sorted(f for f in os.listdir(PROFILE_DIR) if _NOME_ARQUIVO.match(f))
+        for antigo in arquivos[: max(len(arquivos) - PROFILE_MAX_ARQUIVOS, 0)]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, antigo))
+            except OSError:
+                pass
+
+
+def listar_perfis(limite: int = 50) -> list[dict]:
+    """Perfis em disco, do mais lento para o mais rápido."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    perfis = []
+    for arquivo in os.listdir(PROFILE_DIR):
+        m = _NOME_ARQUIVO.match(arquivo)
+        if not m:
+            continue
+        perfis.append(
+            {
+                "arquivo": arquivo,
+                "quando": time.strftime(
+                    "%Y-%m-%d %H:%M:%S", time.localtime(int(m.group(1)) / 1000)
+                ),
+                "duracao_ms": int(m.group(2)),
+                "endpoint": m.group(3),
+            }
+        )
+    perfis.sort(key=lambda p: p["duracao_ms"], reverse=True)
+    return perfis[:limite]
+
+
+def instalar(app: Flask) -> None:
+    """Liga a amostragem por request (before/teardown)."""
+
+    @app.before_request
+    def _iniciar_perfil():
+        if not _deve_amostrar():
+            return
+        amostrador = Amostrador(threading.get_ident(), PROFILE_INTERVALO_MS / 1000)
+        g.perfil = (amostrador, time.perf_counter())
+        amostrador.start()
+
+    @app.teardown_request
+    def _finalizar_perfil(_exc=None):
+        perfil = g.pop("perfil", None)
+        if perfil is None:
+            return
+        amostrador, inicio = perfil
+        pilhas = amostrador.parar()
+        try:
+            _gravar(request.endpoint or request.path, time.perf_counter() - inicio, pilhas)
+        except OSError:
+            pass
+
+
+@bp.route("/admin/perfis")
+@admin_required
+def perfis():
+    """Lista os perfis mais lentos gravados recentemente."""
+    return render_template(
+        "perfis.html",
+        perfis=listar_perfis(),
+        taxa=PROFILE_SAMPLE_RATE,
+        diretorio=PROFILE_DIR,
+    )
+
+
+@bp.route("/admin/perfis/<nome>")
+@admin_required
+def baixar_perfil(nome: str):
+    """Download de um perfil (collapsed stacks)."""
+    if not _NOME_ARQUIVO.match(nome):
+        abort(404)
+    return send_from_directory(PROFILE_DIR, nome, mimetype="text/plain", as_attachment=True)
+
+
+@bp.cli.command("token")
+def token_cli() -> None:
+    """Imprime um token válido para o header X-Profile."""
+    click.echo(gerar_token(current_app))
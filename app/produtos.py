@@ -2,9 +2,12 @@
 
 from __future__ import annotations
 
+from datetime import date
+
 from flask import Blueprint, flash, redirect, render_template, request
 
-from .db import get_db
+from .busca import buscar_produtos
+from .repositorio import repo
 from .utils import current_user_id, login_required
 
 bp = Blueprint("produtos", __name__)
@@ -15,8 +18,7 @@ bp = Blueprint("produtos", __name__)
 def produtos():
     """Lista e cria produtos."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
+    r = repo()
 
     if request.method == "POST":
         nome = request.form.get("nome", "").strip()
@@ -34,38 +36,19 @@ def produtos():
             flash("Preço inválido!", "warning")
             return redirect("/produtos")
 
-        cur.execute(
-            "INSERT INTO produtos (usuario_id, nome, preco) VALUES (?, ?, ?)",
-            (uid, nome, preco),
-        )
-        con.commit()
-
-        # Cria linha de estoque para o produto
-        produto_id = cur.lastrowid
-        cur.execute(
-            """
-            INSERT OR IGNORE INTO estoque (
-                usuario_id,
-                produto_id,
-                quantidade,
-                minimo
-            )
-            VALUES (?, ?, 0, 0)
-            """,
-            (uid, produto_id),
-        )
-        con.commit()
+        # Cria também a linha de estoque do produto
+        r.produtos.criar(uid, nome, preco)
+        r.commit()
 
         flash("Produto cadastrado ✅", "success")
         return redirect("/produtos")
 
-    cur.execute(
-        "SELECT id, nome, preco FROM produtos "
-        "WHERE usuario_id = ? ORDER BY nome",
-        (uid,),
-    )
-    lista = cur.fetchall()
-    return render_template("produtos.html", produtos=lista)
+    q = request.args.get("q", "").strip()
+    if q:
+        lista = buscar_produtos(uid, q, limite=200)
+    else:
+        lista = r.produtos.listar(uid)
+    return render_template("produtos.html", produtos=lista, q=q)
 
 
 @bp.route("/produtos/editar/<int:produto_id>", methods=["GET", "POST"])
@@ -73,15 +56,9 @@ def produtos():
 def editar_produto(produto_id: int):
     """Edita um produto."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
+    r = repo()
 
-    cur.execute(
-        "SELECT id, nome, preco FROM produtos "
-        "WHERE id = ? AND usuario_id = ?",
-        (produto_id, uid),
-    )
-    produto = cur.fetchone()
+    produto = r.produtos.por_id(uid, produto_id)
 
     if not produto:
         flash("Produto não encontrado.", "warning")
@@ -101,12 +78,11 @@ def editar_produto(produto_id: int):
             flash("Preço inválido.", "warning")
             return render_template("produto_editar.html", produto=produto)
 
-        cur.execute(
-            "UPDATE produtos SET nome = ?, preco = ? "
-            "WHERE id = ? AND usuario_id = ?",
-            (nome, preco, produto_id, uid),
-        )
-        con.commit()
+        r.produtos.atualizar(uid, produto_id, nome, preco)
+        # saldo guardado dos pedidos em aberto depende do preço
+        r.cobrancas.acumular(date.today().isoformat(), uid=uid)
+        r.cobrancas.recalcular_saldos(uid)
+        r.commit()
         flash("Produto atualizado ✅", "success")
         return redirect("/produtos")
 
@@ -118,13 +94,9 @@ def editar_produto(produto_id: int):
 def excluir_produto(produto_id: int):
     """Exclui um produto."""
     uid = current_user_id()
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute(
-        "DELETE FROM produtos WHERE id = ? AND usuario_id = ?",
-        (produto_id, uid),
-    )
-    con.commit()
+    r = repo()
+
+    r.produtos.excluir(uid, produto_id)
+    r.commit()
     flash("Produto excluído ✅", "success")
     return redirect("/produtos")
@@ -8,18 +8,18 @@ from datetime import date
 from flask import Blueprint, flash, redirect, render_template, request, url_for
 
 from .asaas_service import create_or_get_customer, create_pix_payment, get_pix_qrcode
-from .db import get_db
-from .utils import vencimento_do_pedido
+from .db import registrar_pagamento, usar_tenant
+from .eventos import publicar
+from .fila import enfileirar, tarefa
+from .repositorio import repo
+from .utils import PEDIDO_MAX_ITENS, itens_do_formulario, vencimento_do_pedido
 
 bp = Blueprint("publico", __name__)
 
 
 def _usuario_padrao_id() -> int | None:
-    con = get_db()
-    cur = con.cursor()
-    cur.execute("SELECT id FROM usuarios ORDER BY id ASC LIMIT 1")
-    row = cur.fetchone()
-    return int(row["id"]) if row else None
+    uid = repo().usuarios.primeiro_id()
+    return int(uid) if uid is not None else None
 
 
 @bp.route("/loja", methods=["GET", "POST"])
@@ -28,36 +28,26 @@ def loja():
     if uid is None:
         return render_template("loja_sem_usuario.html")
 
-    con = get_db()
-    cur = con.cursor()
-
-    cur.execute(
-        "SELECT id, nome, preco FROM produtos WHERE usuario_id = ? ORDER BY nome",
-        (uid,),
-    )
-    produtos = cur.fetchall()
+    usar_tenant(uid)
+    r = repo()
+    produtos = r.loja.produtos(uid)
 
     if request.method == "POST":
         nome = (request.form.get("nome") or "").strip()
         telefone = (request.form.get("telefone") or "").strip()
-        produto_id = request.form.get("produto_id")
-        quantidade = request.form.get("quantidade")
         vencimento = (request.form.get("vencimento") or "").strip()
         hora_vencimento = (request.form.get("hora_vencimento") or "").strip() or "09:00"
 
-        if not nome or not produto_id or not quantidade:
-            flash("Preencha nome, produto e quantidade.", "error")
-            return redirect(url_for("publico.loja"))
-
         try:
-            produto_id_int = int(produto_id)
-            qtd_int = int(quantidade)
-            if qtd_int < 1:
-                raise ValueError
+            carrinho = itens_do_formulario(request.form)
         except ValueError:
             flash("Quantidade inválida.", "error")
             return redirect(url_for("publico.loja"))
 
+        if not nome or not carrinho:
+            flash("Preencha nome, produto e quantidade.", "error")
+            return redirect(url_for("publico.loja"))
+
         # valida vencimento (se não enviar, usa padrão)
         if vencimento:
             try:
@@ -67,117 +57,53 @@ def loja():
         if not vencimento:
             vencimento = vencimento_do_pedido(date.today()).isoformat()
 
-        # garante que produto existe
-        cur.execute(
-            "SELECT 1 FROM produtos WHERE id = ? AND usuario_id = ?",
-            (produto_id_int, uid),
-        )
-        if not cur.fetchone():
+        # garante que os produtos existem (e pega os preços de uma vez)
+        do_carrinho = r.pedidos.produtos(uid, [pid for pid, _ in carrinho])
+        if len(do_carrinho) != len(carrinho):
             flash("Produto inválido.", "error")
             return redirect(url_for("publico.loja"))
+        itens = [(pid, qtd, float(do_carrinho[pid]["preco"])) for pid, qtd in carrinho]
 
         # cria / reaproveita cliente por telefone (se vier)
         cliente_id = None
         if telefone:
-            cur.execute(
-                "SELECT id FROM clientes WHERE usuario_id = ? AND telefone = ? LIMIT 1",
-                (uid, telefone),
-            )
-            row = cur.fetchone()
-            if row:
-                cliente_id = int(row["id"])
+            cliente_id = r.loja.cliente_por_telefone(uid, telefone)
 
         if cliente_id is None:
-            cur.execute(
-                "INSERT INTO clientes (usuario_id, nome, telefone) VALUES (?, ?, ?)",
-                (uid, nome, telefone),
-            )
-            cliente_id = cur.lastrowid
+            cliente_id = r.loja.criar_cliente(uid, nome, telefone)
 
         hoje = date.today().isoformat()
 
-        # cria o pedido
-        cur.execute(
-            """
-            INSERT INTO pedidos (
-                usuario_id,
-                cliente_id,
-                produto_id,
-                quantidade,
-                data,
-                vencimento,
-                hora_vencimento,
-                pago
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, 0)
-            """,
-            (uid, cliente_id, produto_id_int, qtd_int, hoje, vencimento, hora_vencimento),
+        # cria o pedido (um só para o carrinho inteiro)
+        pedido_id = r.pedidos.criar(
+            uid, cliente_id, itens, hoje, vencimento, hora_vencimento
+        )
+        r.commit()
+        publicar(
+            uid,
+            "pedido_criado",
+            pedido_id=pedido_id,
+            cliente_id=cliente_id,
+            principal=round(sum(preco * qtd for _pid, qtd, preco in itens), 2),
+            mes=hoje[:7],
         )
-        pedido_id = cur.lastrowid
-        con.commit()
 
-        # Cria cobrança PIX no Asaas (se configurado)
+        # Cobrança PIX no Asaas (se configurado): uma por pedido, criada
+        # pelo worker (a loja não espera o Asaas; falhas são retentadas)
         if os.getenv("ASAAS_API_KEY"):
-            cur.execute(
-                "SELECT nome, preco FROM produtos WHERE id = ? AND usuario_id = ?",
-                (produto_id_int, uid),
+            enfileirar(
+                "asaas_cobranca",
+                usuario_id=uid,
+                pedido_id=pedido_id,
+                cliente_id=cliente_id,
+                nome=nome,
+                telefone=telefone,
+                valor=sum(preco * qtd for _pid, qtd, preco in itens),
+                vencimento=vencimento,
+                descricao=f"Pedido #{pedido_id} - " + ", ".join(
+                    f"{do_carrinho[pid]['nome']} x{qtd}" for pid, qtd, _preco in itens
+                ),
             )
-            pr = cur.fetchone()
-            if pr:
-                descricao = f"Pedido #{pedido_id} - {pr['nome']} x{qtd_int}"
-                valor = float(pr["preco"]) * int(qtd_int)
-
-                try:
-                    customer_id = create_or_get_customer(
-                        nome, telefone, external_reference=str(cliente_id)
-                    )
-                    pay = create_pix_payment(
-                        customer_id=customer_id,
-                        value=valor,
-                        due_date_iso=vencimento,
-                        description=descricao,
-                        external_reference=str(pedido_id),
-                    )
-                    pay_id = pay.get("id")
-                    invoice_url = pay.get("invoiceUrl")
-
-                    pix_payload = None
-                    pix_qr = None
-                    if pay_id:
-                        qr = get_pix_qrcode(pay_id)
-                        pix_payload = (
-                            qr.get("payload")
-                            or qr.get("brCode")
-                            or qr.get("copyPaste")
-                            or qr.get("encodedText")
-                        )
-                        pix_qr = qr.get("encodedImage")
-
-                    cur.execute(
-                        """
-                        UPDATE pedidos
-                        SET asaas_customer_id = ?,
-                            asaas_payment_id = ?,
-                            asaas_invoice_url = ?,
-                            pix_payload = ?,
-                            pix_qr_code = ?,
-                            asaas_status = ?
-                        WHERE id = ?
-                        """,
-                        (
-                            customer_id,
-                            pay_id,
-                            invoice_url,
-                            pix_payload,
-                            pix_qr,
-                            "PAYMENT_CREATED",
-                            pedido_id,
-                        ),
-                    )
-                    con.commit()
-
-                except Exception:
-                    # não quebra a loja se Asaas falhar; pedido continua criado
-                    pass
 
         return redirect(url_for("publico.sucesso"))
 
@@ -187,9 +113,60 @@ def loja():
         "loja.html",
         produtos=produtos,
         venc_padrao=venc_padrao,
+        max_itens=PEDIDO_MAX_ITENS,
     )
 
 
 @bp.route("/loja/sucesso")
 def sucesso():
     return render_template("loja_sucesso.html")
+
+
+@tarefa("asaas_cobranca", prioridade=5)
+def criar_cobranca_asaas(usuario_id: int, pedido_id: int, cliente_id: int, nome: str,
+                         telefone: str, valor: float, vencimento: str, descricao: str) -> None:
+    """Cria a cobrança PIX do pedido no Asaas e guarda o QR.
+
+    O id da cobrança é gravado antes de buscar o QR: se a busca falhar, a
+    nova tentativa só busca o QR, sem criar outra cobrança.
+    """
+    usar_tenant(usuario_id)
+    r = repo()
+    atual = r.loja.cobranca_do_pedido(pedido_id)
+    if atual is None or atual["pago"] or atual["pix_payload"]:
+        return
+
+    dados = {
+        "customer_id": atual["asaas_customer_id"],
+        "payment_id": atual["asaas_payment_id"],
+        "invoice_url": atual["asaas_invoice_url"],
+        "pix_payload": None,
+        "pix_qr_code": None,
+        "status": "PAYMENT_CREATED",
+    }
+    if not dados["payment_id"]:
+        dados["customer_id"] = create_or_get_customer(
+            nome, telefone, external_reference=str(cliente_id)
+        )
+        pay = create_pix_payment(
+            customer_id=dados["customer_id"],
+            value=valor,
+            due_date_iso=vencimento,
+            description=descricao,
+            external_reference=str(pedido_id),
+        )
+        dados["payment_id"] = pay.get("id")
+        dados["invoice_url"] = pay.get("invoiceUrl")
+        r.loja.salvar_cobranca_asaas(pedido_id, dados)
+        registrar_pagamento(dados["payment_id"], usuario_id)
+
+    if dados["payment_id"]:
+        qr = get_pix_qrcode(dados["payment_id"])
+        dados["pix_payload"] = (
+            qr.get("payload")
+            or qr.get("brCode")
+            or qr.get("copyPaste")
+            or qr.get("encodedText")
+        )
+        dados["pix_qr_code"] = qr.get("encodedImage")
+        r.loja.salvar_cobranca_asaas(pedido_id, dados)
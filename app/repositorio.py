@@ -0,0 +1,1400 @@
+"""Camada de acesso a dados (repositórios) com backend SQLite ou PostgreSQL.
+
+As queries de usuários, clientes, produtos, estoque, busca, pedidos,
+cobranças, financeiro, dashboard, loja, webhook e scheduler ficam aqui,
+escritas uma vez com parâmetros nomeados (`:uid`). Cada backend cuida da
+conexão e do dialeto:
+
+- sqlite (padrão): usa `db.get_db()` / `db.get_catalogo()` (shards inclusos).
+- postgres: pool de conexões (psycopg 3 + psycopg_pool), uma por request.
+  `pip install "psycopg[binary]" psycopg_pool` e DATABASE_URL=postgresql://...
+  Criar as tabelas: `flask --app run repositorio init-postgres`.
+
+Ainda só SQLite (não passam por aqui): importação/exportação (com Postgres
+respondem 501, ver `apenas_sqlite`), sessões no servidor (use
+SESSION_BACKEND=cookie com Postgres) e shards.
+
+Uso nas views:
+    r = repo()
+    r.pedidos.listar(uid)
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import date, timedelta
+from typing import Any, Iterable
+
+import click
+from flask import Blueprint, Flask, abort, g
+
+from .db import COLUNAS_ITENS, COLUNAS_PEDIDOS, get_catalogo, get_db
+
+bp = Blueprint("repositorio", __name__)
+
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlite").strip().lower()
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+
+
+class RegistroDuplicado(Exception):
+    """Violação de unicidade (ex.: username já existe)."""
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+class Backend(ABC):
+    """Executa SQL com parâmetros nomeados num banco específico."""
+
+    nome = ""
+
+    @abstractmethod
+    def _con(self, catalogo: bool = False):
+        ...
+
+    @abstractmethod
+    def _cursor(self, sql: str, params: dict, catalogo: bool):
+        ...
+
+    def todos(self, sql: str, params: dict | None = None, catalogo: bool = False) -> list:
+        return self._cursor(sql, params or {}, catalogo).fetchall()
+
+    def um(self, sql: str, params: dict | None = None, catalogo: bool = False):
+        return self._cursor(sql, params or {}, catalogo).fetchone()
+
+    def valor(self, sql: str, params: dict | None = None, catalogo: bool = False, padrao=None):
+        row = self.um(sql, params, catalogo)
+        return row[0] if row is not None and row[0] is not None else padrao
+
+    def executar(self, sql: str, params: dict | None = None, catalogo: bool = False) -> int:
+        return self._cursor(sql, params or {}, catalogo).rowcount
+
+    @abstractmethod
+    def executar_lote(self, sql: str, lista: Iterable[dict], catalogo: bool = False) -> None:
+        ...
+
+    @abstractmethod
+    def inserir(self, sql: str, params: dict, catalogo: bool = False) -> int:
+        """INSERT que devolve o id gerado."""
+
+    def commit(self, catalogo: bool = False) -> None:
+        self._con(catalogo).commit()
+
+
+class BackendSQLite(Backend):
+    """SQLite via `db.py` (conexão da request, tenant e catálogo)."""
+
+    nome = "sqlite"
+
+    def _con(self, catalogo: bool = False):
+        return get_catalogo() if catalogo else get_db()
+
+    def _cursor(self, sql, params, catalogo):
+        return self._con(catalogo).execute(sql, params)
+
+    def executar_lote(self, sql, lista, catalogo=False):
+        self._con(catalogo).executemany(sql, list(lista))
+
+    def inserir(self, sql, params, catalogo=False):
+        try:
+            return int(self._cursor(sql, params, catalogo).lastrowid)
+        except sqlite3.IntegrityError as exc:
+            # solta o lock de escrita (como o rollback do Postgres)
+            self._con(catalogo).rollback()
+            raise RegistroDuplicado(str(exc)) from exc
+
+
+class Linha(tuple):
+    """Linha do Postgres acessível por índice e por nome (como sqlite3.Row)."""
+
+    def __new__(cls, nomes: dict[str, int], valores):
+        obj = super().__new__(cls, valores)
+        obj._nomes = nomes
+        return obj
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            return tuple.__getitem__(self, self._nomes[chave])
+        return tuple.__getitem__(self, chave)
+
+    def keys(self) -> list[str]:
+        return list(self._nomes)
+
+
+def _linha_factory(cursor):
+    nomes = {col.name: i for i, col in enumerate(cursor.description or ())}
+    return lambda valores: Linha(nomes, valores)
+
+
+_PARAM = re.compile(r"(?<!:):([A-Za-z_]\w*)")
+
+
+def _sql_pg(sql: str) -> str:
+    """`:nome` -> `%(nome)s` (e `%` literal escapado)."""
+    return _PARAM.sub(r"%(\1)s", sql.replace("%", "%%"))
+
+
+class BackendPostgres(Backend):
+    """PostgreSQL com pool (psycopg_pool); uma conexão por request em `g`."""
+
+    nome = "postgres"
+
+    def __init__(self, url: str, minimo: int = PG_POOL_MIN, maximo: int = PG_POOL_MAX):
+        self.url = url
+        self.minimo = minimo
+        self.maximo = maximo
+        self._pool = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reiniciar_no_filho)
+
+    def _reiniciar_no_filho(self) -> None:
+        """Sockets do pool não podem ser compartilhados entre processos."""
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    from psycopg_pool import ConnectionPool
+
+                    self._pool = ConnectionPool(
+                        self.url,
+                        min_size=self.minimo,
+                        max_size=self.maximo,
+                        kwargs={"row_factory": _linha_factory},
+                        open=True,
+                    )
+        return self._pool
+
+    def _con(self, catalogo: bool = False):
+        if "pg" not in g:
+            g.pg = self.pool().getconn()
+        return g.pg
+
+    def devolver(self, _exc=None) -> None:
+        con = g.pop("pg", None)
+        if con is not None:
+            con.rollback()  # descarta o que não foi commitado
+            self.pool().putconn(con)
+
+    def _cursor(self, sql, params, catalogo):
+        import psycopg
+
+        try:
+            return self._con(catalogo).execute(_sql_pg(sql), params)
+        except psycopg.errors.UniqueViolation as exc:
+            self._con(catalogo).rollback()
+            raise RegistroDuplicado(str(exc)) from exc
+
+    def executar_lote(self, sql, lista, catalogo=False):
+        with self._con(catalogo).cursor() as cur:
+            cur.executemany(_sql_pg(sql), list(lista))
+
+    def inserir(self, sql, params, catalogo=False):
+        return int(self._cursor(sql + " RETURNING id", params, catalogo).fetchone()[0])
+
+
+_backend: Backend | None = None
+
+
+def backend() -> Backend:
+    """Backend configurado em DB_BACKEND (criado uma vez por processo)."""
+    global _backend
+    if _backend is None:
+        if DB_BACKEND == "postgres":
+            url = os.getenv("DATABASE_URL", "").strip()
+            if not url:
+                raise RuntimeError("DB_BACKEND=postgres requer DATABASE_URL")
+            _backend = BackendPostgres(url)
+        else:
+            _backend = BackendSQLite()
+    return _backend
+
+
+# ---------------------------------------------------------------------------
+# Repositórios
+# ---------------------------------------------------------------------------
+def _em(prefixo: str, valores: list) -> tuple[str, dict]:
+    """("(:p0, :p1, ...)", {"p0": ..., ...}) para um IN com parâmetros."""
+    nomes = [f"{prefixo}{n}" for n in range(len(valores))]
+    return "(" + ", ".join(":" + n for n in nomes) + ")", dict(zip(nomes, valores))
+
+
+def sql_itens(alias: str, dialeto: str = "sqlite", itens: str = "pedido_itens") -> str:
+    """Colunas com os itens do pedido `alias`: `produto_nome` ("Arroz x2,
+    Feijão x1"), `quantidade` e `principal_atual` (pelo preço de hoje, menos
+    o que já foi abatido por pagamentos parciais).
+
+    Subconsultas por pedido (índice `idx_pedido_itens_pedido`). `itens` é a
+    tabela ou view dos itens (ver `fontes_pedidos`).
+    """
+    if dialeto == "postgres":
+        descricao = "string_agg(pr.nome || ' x' || i.quantidade, ', ' ORDER BY i.id)"
+    else:
+        descricao = "group_concat(pr.nome || ' x' || i.quantidade, ', ')"
+    colunas = {
+        "produto_nome": f"SELECT {descricao} FROM {{t}} i JOIN produtos pr ON pr.id = i.produto_id",
+        "quantidade": "SELECT SUM(i.quantidade) FROM {t} i",
+        "principal_atual": "SELECT SUM(pr.preco * i.quantidade) FROM {t} i "
+                           "JOIN produtos pr ON pr.id = i.produto_id",
+    }
+    # Numa view com UNION ALL a subconsulta correlacionada não usa o índice:
+    # os itens de um pedido estão todos numa das tabelas, consulta as duas
+    tabelas = (
+        ("pedido_itens", "pedido_itens_arquivo") if itens == "pedido_itens_todos" else (itens,)
+    )
+    partes = []
+    for nome, sql in colunas.items():
+        subs = ", ".join(
+            f"({sql.format(t=t)} WHERE i.pedido_id = {alias}.id)" for t in tabelas
+        )
+        expr = f"COALESCE({subs})" if len(tabelas) > 1 else subs
+        if nome == "principal_atual":
+            expr += f" - COALESCE({alias}.valor_abatido, 0)"
+        partes.append(f"{expr} AS {nome}")
+    return "\n        " + ",\n        ".join(partes)
+
+
+# Chave em `controle`: pedidos pagos antes deste dia podem estar no arquivo
+ARQUIVO_CORTE = "pedidos_arquivados_ate"
+
+
+def fontes_pedidos(corte: str | None, de: str | None) -> tuple[str, str]:
+    """(pedidos, itens) para uma leitura a partir de `de` (None = tudo).
+
+    Só usa as views com o arquivo (`pedidos_todos`, `pedido_itens_todos`)
+    quando o período alcança o `corte` do arquivamento: um pedido arquivado
+    tem data e pagamento anteriores a ele.
+    """
+    if corte and (de is None or de < corte):
+        return "pedidos_todos", "pedido_itens_todos"
+    return "pedidos", "pedido_itens"
+
+
+class _Repo:
+    def __init__(self, db: Backend):
+        self.db = db
+
+    def _itens(self, alias: str, itens: str = "pedido_itens") -> str:
+        return sql_itens(alias, self.db.nome, itens)
+
+    def _corte(self) -> str | None:
+        return self.db.valor(
+            "SELECT valor FROM controle WHERE chave = :chave", {"chave": ARQUIVO_CORTE}
+        )
+
+
+class Usuarios(_Repo):
+    """Tabela `usuarios` (catálogo, no modo shard)."""
+
+    def por_id(self, uid: int):
+        return self.db.um(
+            "SELECT id, username FROM usuarios WHERE id = :uid", {"uid": uid}, catalogo=True
+        )
+
+    def por_username(self, username: str):
+        return self.db.um(
+            "SELECT id, senha_hash FROM usuarios WHERE username = :username",
+            {"username": username},
+            catalogo=True,
+        )
+
+    def criar(self, username: str, senha_hash: bytes) -> int:
+        uid = self.db.inserir(
+            "INSERT INTO usuarios (username, senha_hash) VALUES (:username, :senha_hash)",
+            {"username": username, "senha_hash": senha_hash},
+            catalogo=True,
+        )
+        self.db.commit(catalogo=True)
+        return uid
+
+    def trocar_hash(self, uid: int, senha_hash: bytes) -> None:
+        self.db.executar(
+            "UPDATE usuarios SET senha_hash = :senha_hash WHERE id = :uid",
+            {"uid": uid, "senha_hash": senha_hash},
+            catalogo=True,
+        )
+        self.db.commit(catalogo=True)
+
+    def primeiro_id(self) -> int | None:
+        return self.db.valor("SELECT id FROM usuarios ORDER BY id ASC LIMIT 1", catalogo=True)
+
+
+def _termos(q: str) -> list[str]:
+    """Palavras da busca (sem aspas/operadores do FTS)."""
+    return re.findall(r"\w+", q or "")[:8]
+
+
+def _match_fts(uid: int, colunas: str, termos: list[str]) -> str:
+    """Expressão MATCH do FTS5: dono + prefixo de cada palavra."""
+    prefixos = " AND ".join(f'"{t}"*' for t in termos)
+    return f"usuario_id:{int(uid)} AND {{{colunas}}}: ({prefixos})"
+
+
+def _prefixos(colunas: tuple[str, ...], termos: list[str]) -> tuple[str, dict]:
+    """Cada palavra casa com o início de alguma palavra de uma das colunas."""
+    partes, params = [], {}
+    for n, termo in enumerate(termos):
+        params[f"t{n}"], params[f"m{n}"] = f"{termo}%", f"% {termo}%"
+        partes.append(
+            "(" + " OR ".join(f"{c} ILIKE :t{n} OR {c} ILIKE :m{n}" for c in colunas) + ")"
+        )
+    return " AND ".join(partes), params
+
+
+class Clientes(_Repo):
+    """Cadastro de clientes e busca por nome/telefone."""
+
+    def listar(self, uid: int) -> list:
+        return self.db.todos(
+            "SELECT id, nome, telefone FROM clientes WHERE usuario_id = :uid ORDER BY nome",
+            {"uid": uid},
+        )
+
+    def por_id(self, uid: int, cliente_id: int):
+        return self.db.um(
+            "SELECT id, nome, telefone FROM clientes WHERE id = :id AND usuario_id = :uid",
+            {"id": cliente_id, "uid": uid},
+        )
+
+    def criar(self, uid: int, nome: str, telefone: str) -> int:
+        return self.db.inserir(
+            "INSERT INTO clientes (usuario_id, nome, telefone) VALUES (:uid, :nome, :telefone)",
+            {"uid": uid, "nome": nome, "telefone": telefone},
+        )
+
+    def atualizar(self, uid: int, cliente_id: int, nome: str, telefone: str) -> None:
+        self.db.executar(
+            "UPDATE clientes SET nome = :nome, telefone = :telefone "
+            "WHERE id = :id AND usuario_id = :uid",
+            {"id": cliente_id, "uid": uid, "nome": nome, "telefone": telefone},
+        )
+
+    def excluir(self, uid: int, cliente_id: int) -> None:
+        self.db.executar(
+            "DELETE FROM clientes WHERE id = :id AND usuario_id = :uid",
+            {"id": cliente_id, "uid": uid},
+        )
+
+    def buscar(self, uid: int, q: str, limite: int) -> list:
+        """Top-N clientes cujo nome/telefone casa com `q` (prefixo de cada palavra).
+
+        SQLite: índice FTS5 `clientes_fts` (ignora acentos), ou LIKE sem
+        FTS5. Postgres: ILIKE por palavra.
+        """
+        termos = _termos(q)
+        if not termos:
+            return []
+        if self.db.nome == "postgres":
+            filtro, params = _prefixos(("nome", "telefone"), termos)
+            return self.db.todos(
+                f"SELECT id, nome, telefone FROM clientes WHERE usuario_id = :uid AND {filtro} "
+                "ORDER BY nome LIMIT :limite",
+                {"uid": uid, "limite": limite, **params},
+            )
+        try:
+            return self.db.todos(
+                """
+                SELECT c.id, c.nome, c.telefone
+                FROM clientes_fts f
+                JOIN clientes c ON c.id = f.rowid
+                WHERE clientes_fts MATCH :match
+                ORDER BY f.rank, c.nome
+                LIMIT :limite
+                """,
+                {"match": _match_fts(uid, "nome telefone", termos), "limite": limite},
+            )
+        except sqlite3.OperationalError:
+            return self.db.todos(
+                "SELECT id, nome, telefone FROM clientes "
+                "WHERE usuario_id = :uid AND (nome LIKE :contem OR telefone LIKE :inicio) "
+                "ORDER BY nome LIMIT :limite",
+                {"uid": uid, "contem": f"%{q.strip()}%", "inicio": f"{q.strip()}%",
+                 "limite": limite},
+            )
+
+
+class Produtos(_Repo):
+    """Cadastro de produtos e busca por nome."""
+
+    def listar(self, uid: int) -> list:
+        return self.db.todos(
+            "SELECT id, nome, preco FROM produtos WHERE usuario_id = :uid ORDER BY nome",
+            {"uid": uid},
+        )
+
+    def por_id(self, uid: int, produto_id: int):
+        return self.db.um(
+            "SELECT id, nome, preco FROM produtos WHERE id = :id AND usuario_id = :uid",
+            {"id": produto_id, "uid": uid},
+        )
+
+    def criar(self, uid: int, nome: str, preco: float) -> int:
+        """Cria o produto já com a linha de estoque zerada."""
+        produto_id = self.db.inserir(
+            "INSERT INTO produtos (usuario_id, nome, preco) VALUES (:uid, :nome, :preco)",
+            {"uid": uid, "nome": nome, "preco": preco},
+        )
+        self.db.executar(
+            "INSERT INTO estoque (usuario_id, produto_id, quantidade, minimo) "
+            "VALUES (:uid, :id, 0, 0) ON CONFLICT DO NOTHING",
+            {"uid": uid, "id": produto_id},
+        )
+        return produto_id
+
+    def atualizar(self, uid: int, produto_id: int, nome: str, preco: float) -> None:
+        self.db.executar(
+            "UPDATE produtos SET nome = :nome, preco = :preco "
+            "WHERE id = :id AND usuario_id = :uid",
+            {"id": produto_id, "uid": uid, "nome": nome, "preco": preco},
+        )
+
+    def excluir(self, uid: int, produto_id: int) -> None:
+        self.db.executar(
+            "DELETE FROM produtos WHERE id = :id AND usuario_id = :uid",
+            {"id": produto_id, "uid": uid},
+        )
+
+    def buscar(self, uid: int, q: str, limite: int) -> list:
+        """Top-N produtos cujo nome casa com `q` (como `Clientes.buscar`)."""
+        termos = _termos(q)
+        if not termos:
+            return []
+        if self.db.nome == "postgres":
+            filtro, params = _prefixos(("nome",), termos)
+            return self.db.todos(
+                f"SELECT id, nome, preco FROM produtos WHERE usuario_id = :uid AND {filtro} "
+                "ORDER BY nome LIMIT :limite",
+                {"uid": uid, "limite": limite, **params},
+            )
+        try:
+            return self.db.todos(
+                """
+                SELECT p.id, p.nome, p.preco
+                FROM produtos_fts f
+                JOIN produtos p ON p.id = f.rowid
+                WHERE produtos_fts MATCH :match
+                ORDER BY f.rank, p.nome
+                LIMIT :limite
+                """,
+                {"match": _match_fts(uid, "nome", termos), "limite": limite},
+            )
+        except sqlite3.OperationalError:
+            return self.db.todos(
+                "SELECT id, nome, preco FROM produtos "
+                "WHERE usuario_id = :uid AND nome LIKE :contem ORDER BY nome LIMIT :limite",
+                {"uid": uid, "contem": f"%{q.strip()}%", "limite": limite},
+            )
+
+
+class Estoque(_Repo):
+    """Quantidade e mínimo por produto."""
+
+    def garantir_linhas(self, uid: int) -> None:
+        """Cria a linha de estoque (zerada) dos produtos que ainda não têm."""
+        self.db.executar(
+            """
+            INSERT INTO estoque (usuario_id, produto_id, quantidade, minimo)
+            SELECT :uid, p.id, 0, 0 FROM produtos p
+            WHERE p.usuario_id = :uid
+              AND NOT EXISTS (
+                  SELECT 1 FROM estoque e
+                  WHERE e.usuario_id = :uid AND e.produto_id = p.id
+              )
+            ON CONFLICT DO NOTHING
+            """,
+            {"uid": uid},
+        )
+
+    def listar(self, uid: int) -> list:
+        return self.db.todos(
+            """
+            SELECT p.id, p.nome, p.preco, e.quantidade, e.minimo
+            FROM produtos p
+            LEFT JOIN estoque e
+              ON e.produto_id = p.id AND e.usuario_id = p.usuario_id
+            WHERE p.usuario_id = :uid
+            ORDER BY p.nome
+            """,
+            {"uid": uid},
+        )
+
+    def do_produto(self, uid: int, produto_id: int):
+        """(quantidade, minimo) do produto, ou None."""
+        return self.db.um(
+            "SELECT quantidade, minimo FROM estoque "
+            "WHERE usuario_id = :uid AND produto_id = :id",
+            {"uid": uid, "id": produto_id},
+        )
+
+    def atualizar(self, uid: int, produto_id: int, quantidade: int, minimo: int) -> None:
+        self.db.executar(
+            "UPDATE estoque SET quantidade = :quantidade, minimo = :minimo "
+            "WHERE usuario_id = :uid AND produto_id = :id",
+            {"uid": uid, "id": produto_id, "quantidade": quantidade, "minimo": minimo},
+        )
+
+
+class Pedidos(_Repo):
+    """Criação, listagem e baixa simples de pedidos."""
+
+    def cliente_existe(self, uid: int, cliente_id: int) -> bool:
+        return self.db.um(
+            "SELECT 1 FROM clientes WHERE id = :id AND usuario_id = :uid",
+            {"id": cliente_id, "uid": uid},
+        ) is not None
+
+    def produto_existe(self, uid: int, produto_id: int) -> bool:
+        return self.db.um(
+            "SELECT 1 FROM produtos WHERE id = :id AND usuario_id = :uid",
+            {"id": produto_id, "uid": uid},
+        ) is not None
+
+    def tem_clientes(self, uid: int) -> bool:
+        return bool(self.db.valor(
+            "SELECT EXISTS (SELECT 1 FROM clientes WHERE usuario_id = :uid)", {"uid": uid}
+        ))
+
+    def tem_produtos(self, uid: int) -> bool:
+        return bool(self.db.valor(
+            "SELECT EXISTS (SELECT 1 FROM produtos WHERE usuario_id = :uid)", {"uid": uid}
+        ))
+
+    def produtos(self, uid: int, ids: Iterable[int]) -> dict[int, Any]:
+        """{id: linha (id, nome, preco)} dos produtos do usuário entre `ids`."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        em, params = _em("p", ids)
+        linhas = self.db.todos(
+            f"SELECT id, nome, preco FROM produtos WHERE usuario_id = :uid AND id IN {em}",
+            {"uid": uid, **params},
+        )
+        return {int(r["id"]): r for r in linhas}
+
+    def criar(
+        self,
+        uid: int,
+        cliente_id: int,
+        itens: list[tuple[int, int, float]],
+        data: str,
+        vencimento: str,
+        hora_vencimento: str = "09:00",
+    ) -> int:
+        """Insere um pedido em aberto com os itens [(produto_id, quantidade,
+        preço)] (sem commit)."""
+        pedido_id = self.db.inserir(
+            """
+            INSERT INTO pedidos (
+                usuario_id, cliente_id, data, vencimento, hora_vencimento,
+                pago, valor_principal
+            ) VALUES (
+                :uid, :cliente_id, :data, :vencimento, :hora_vencimento,
+                0, :principal
+            )
+            """,
+            {
+                "uid": uid,
+                "cliente_id": cliente_id,
+                "data": data,
+                "vencimento": vencimento,
+                "hora_vencimento": hora_vencimento,
+                "principal": sum(float(preco) * qtd for _pid, qtd, preco in itens),
+            },
+        )
+        self.db.executar_lote(
+            """
+            INSERT INTO pedido_itens (pedido_id, usuario_id, produto_id, quantidade)
+            VALUES (:pedido_id, :uid, :produto_id, :quantidade)
+            """,
+            (
+                {"pedido_id": pedido_id, "uid": uid, "produto_id": pid, "quantidade": qtd}
+                for pid, qtd, _preco in itens
+            ),
+        )
+        return pedido_id
+
+    def agrupar_legados(self) -> int:
+        """Junta os pedidos antigos (um produto por linha) do mesmo carrinho.
+
+        Mesmo carrinho = em aberto, sem cobrança no Asaas nem pagamento
+        parcial, mesmo cliente, data e vencimento. Os itens passam para o pedido de menor id, que ganha o
+        principal somado; os outros são apagados. Sem commit; retorna
+        quantos pedidos foram apagados.
+        """
+        grupos: dict[tuple, list[int]] = {}
+        for row in self.db.todos(
+            """
+            SELECT id, usuario_id, cliente_id, data, vencimento, hora_vencimento
+            FROM pedidos
+            WHERE pago = 0 AND asaas_payment_id IS NULL AND produto_id IS NOT NULL
+              AND valor_abatido IS NULL
+            ORDER BY id
+            """
+        ):
+            chave = (row["usuario_id"], row["cliente_id"], row["data"],
+                     row["vencimento"], row["hora_vencimento"])
+            grupos.setdefault(chave, []).append(int(row["id"]))
+
+        apagados = 0
+        for alvo, *outros in grupos.values():
+            if not outros:
+                continue
+            em, params = _em("o", outros)
+            params["alvo"] = alvo
+            self.db.executar(
+                f"UPDATE pedido_itens SET pedido_id = :alvo WHERE pedido_id IN {em}", params
+            )
+            self.db.executar(f"DELETE FROM pedidos WHERE id IN {em}", params)
+            # total_atualizado nulo: o próximo acúmulo refaz os juros do carrinho
+            self.db.executar(
+                """
+                UPDATE pedidos SET
+                    produto_id = NULL,
+                    quantidade = NULL,
+                    total_atualizado = NULL,
+                    valor_principal = (
+                        SELECT SUM(pr.preco * i.quantidade) FROM pedido_itens i
+                        JOIN produtos pr ON pr.id = i.produto_id
+                        WHERE i.pedido_id = :alvo
+                    )
+                WHERE id = :alvo
+                """,
+                {"alvo": alvo},
+            )
+            apagados += len(outros)
+        return apagados
+
+    def listar(self, uid: int) -> list:
+        """(id, data, cliente, itens, quantidade, total, pago)."""
+        return self.db.todos(
+            f"""
+            SELECT id, data, cliente, produto_nome, quantidade,
+                   COALESCE(valor_principal, principal_atual) AS total, pago
+            FROM (
+                SELECT
+                    pedidos.id,
+                    pedidos.data,
+                    clientes.nome AS cliente,
+                    pedidos.valor_principal,
+                    pedidos.pago,
+                    {self._itens("pedidos")}
+                FROM pedidos
+                JOIN clientes ON clientes.id = pedidos.cliente_id
+                WHERE pedidos.usuario_id = :uid
+            ) AS t
+            ORDER BY id DESC
+            """,
+            {"uid": uid},
+        )
+
+    def marcar_pago(self, uid: int, pedido_id: int):
+        """Marca como pago; retorna (cliente_id, valor_principal, valor_abatido)
+        se o pedido estava em aberto, senão None."""
+        params = {"id": pedido_id, "uid": uid}
+        row = self.db.um(
+            "SELECT cliente_id, valor_principal, valor_abatido FROM pedidos "
+            "WHERE id = :id AND usuario_id = :uid AND pago = 0",
+            params,
+        )
+        alterados = self.db.executar(
+            "UPDATE pedidos SET pago = 1 WHERE id = :id AND usuario_id = :uid AND pago = 0",
+            params,
+        )
+        self.db.commit()
+        return row if alterados else None
+
+
+class Cobrancas(_Repo):
+    """Pedidos em aberto: listagem, vencimento e baixa."""
+
+    # ordens da lista paginada de clientes (ver `clientes_em_aberto`)
+    ORDENS = {
+        "total": "t.total DESC, t.cliente_id",
+        "atraso": "COALESCE(t.vencimento, '9999-12-31'), t.total DESC, t.cliente_id",
+        "nome": "t.nome, t.cliente_id",
+    }
+
+    def clientes_em_aberto(
+        self,
+        uid: int,
+        ordem: str = "total",
+        busca: str = "",
+        atrasados_ate: str | None = None,
+        limite: int = 20,
+        offset: int = 0,
+    ) -> list:
+        """Uma página de clientes com saldo em aberto (de `clientes_saldo`).
+
+        `vencimento` é o mais antigo em aberto; com `atrasados_ate`, só os
+        clientes com algum vencimento anterior a essa data. `total_linhas`
+        traz o total de clientes do filtro (para a paginação).
+        """
+        filtro, params = "", {"uid": uid, "limite": limite, "offset": offset}
+        if busca:
+            filtro += " AND LOWER(c.nome) LIKE :busca"
+            params["busca"] = f"%{busca.lower()}%"
+        atraso = ""
+        if atrasados_ate:
+            atraso = " WHERE t.vencimento < :atrasados_ate"
+            params["atrasados_ate"] = atrasados_ate
+        return self.db.todos(
+            f"""
+            SELECT t.*, COUNT(*) OVER () AS total_linhas
+            FROM (
+                SELECT
+                    saldo.cliente_id      AS cliente_id,
+                    c.nome                AS nome,
+                    c.telefone            AS telefone,
+                    saldo.principal       AS principal,
+                    saldo.juros           AS juros,
+                    saldo.total           AS total,
+                    saldo.pedidos_abertos AS pedidos_abertos,
+                    (SELECT MIN(p.vencimento) FROM pedidos p
+                      WHERE p.cliente_id = saldo.cliente_id AND p.pago = 0) AS vencimento
+                FROM clientes_saldo saldo
+                JOIN clientes c ON c.id = saldo.cliente_id
+                WHERE saldo.usuario_id = :uid AND saldo.pedidos_abertos > 0{filtro}
+            ) AS t{atraso}
+            ORDER BY {self.ORDENS.get(ordem, self.ORDENS["total"])}
+            LIMIT :limite OFFSET :offset
+            """,
+            params,
+        )
+
+    def abertos(self, uid: int, clientes: list[int] | None = None) -> list:
+        """Pedidos em aberto do usuário (ou só dos `clientes` indicados)."""
+        filtro, params = "", {"uid": uid}
+        if clientes is not None:
+            em, lista = _em("c", clientes or [None])
+            filtro = f" AND pedidos.cliente_id IN {em}"
+            params.update(lista)
+        return self.db.todos(
+            f"""
+            SELECT
+                pedidos.id           AS pedido_id,
+                clientes.id          AS cliente_id,
+                clientes.nome        AS cliente_nome,
+                clientes.telefone    AS cliente_telefone,
+                pedidos.data         AS data_pedido,
+                pedidos.vencimento   AS vencimento,
+                pedidos.hora_vencimento AS hora_vencimento,
+                pedidos.valor_principal AS valor_principal,
+                pedidos.valor_abatido AS valor_abatido,
+                pedidos.dias_atraso  AS dias_atraso,
+                pedidos.juros        AS juros,
+                pedidos.total_atualizado AS total_atualizado,
+                saldo.principal      AS saldo_principal,
+                saldo.juros          AS saldo_juros,
+                saldo.total          AS saldo_total,
+                {self._itens("pedidos")}
+            FROM pedidos
+            JOIN clientes ON clientes.id = pedidos.cliente_id
+            LEFT JOIN clientes_saldo saldo ON saldo.cliente_id = pedidos.cliente_id
+            WHERE pedidos.pago = 0 AND pedidos.usuario_id = :uid{filtro}
+            ORDER BY saldo.total DESC, clientes.nome, clientes.id, pedidos.data
+            """,
+            params,
+        )
+
+    def alterar_vencimento(self, uid: int, pedido_id: int, data: str, hora: str) -> None:
+        self.db.executar(
+            """
+            UPDATE pedidos
+            SET vencimento = :data, hora_vencimento = :hora
+            WHERE id = :id AND usuario_id = :uid AND pago = 0
+            """,
+            {"data": data, "hora": hora, "id": pedido_id, "uid": uid},
+        )
+        # o saldo guardado depende do vencimento: recalcula já este pedido
+        self.acumular(date.today().isoformat(), uid=uid, pedido_id=pedido_id)
+        self.db.commit()
+
+    def aberto(self, uid: int, pedido_id: int):
+        return self.db.um(
+            f"""
+            SELECT
+                pedidos.id         AS pedido_id,
+                pedidos.cliente_id AS cliente_id,
+                pedidos.data       AS data_pedido,
+                pedidos.vencimento AS vencimento,
+                pedidos.valor_principal AS valor_principal,
+                pedidos.valor_abatido AS valor_abatido,
+                {self._itens("pedidos")}
+            FROM pedidos
+            WHERE pedidos.id = :id AND pedidos.usuario_id = :uid AND pedidos.pago = 0
+            """,
+            {"id": pedido_id, "uid": uid},
+        )
+
+    def dar_baixa_lote(self, uid: int, baixas: list[dict], parcial: dict | None = None) -> None:
+        """Baixa vários pedidos numa transação (um executemany + commit).
+
+        Cada item: {"id", "juros", "data", "valor"}; o `valor_pago` gravado
+        inclui o que já tinha sido abatido do pedido. Pedidos já pagos ficam
+        como estão. `parcial` ({"id", "valor", "data"}) abate a sobra do
+        pagamento de mais um pedido, na mesma transação (ver `abater`).
+        """
+        self.db.executar_lote(
+            """
+            UPDATE pedidos
+            SET pago = 1,
+                juros = :juros,
+                data_pagamento = :data,
+                valor_pago = :valor + COALESCE(valor_abatido, 0)
+            WHERE id = :id AND usuario_id = :uid AND pago = 0
+            """,
+            ({**b, "uid": uid} for b in baixas),
+        )
+        if parcial is not None:
+            self.abater(uid, parcial["id"], parcial["valor"], parcial["data"])
+        self.db.commit()
+
+    def abater(self, uid: int, pedido_id: int, valor: float, hoje: str) -> None:
+        """Pagamento parcial: soma `valor` ao já abatido do pedido em aberto
+        e refaz juros e total sobre o que falta (sem commit).
+
+        O abatido sai do principal em aberto (`principal_atual`,
+        `clientes_saldo`) e entra no `valor_pago` quando o pedido é quitado.
+        """
+        self.db.executar(
+            """
+            UPDATE pedidos
+            SET valor_abatido = COALESCE(valor_abatido, 0) + :valor,
+                total_atualizado = NULL
+            WHERE id = :id AND usuario_id = :uid AND pago = 0
+            """,
+            {"valor": valor, "id": pedido_id, "uid": uid},
+        )
+        self.acumular(hoje, uid=uid, pedido_id=pedido_id)
+
+    def pendentes_whatsapp(self) -> list:
+        """Em aberto e sem WhatsApp enviado (todos os usuários do banco)."""
+        return self.db.todos(
+            f"""
+            SELECT
+                p.id              AS pedido_id,
+                p.vencimento      AS vencimento,
+                p.hora_vencimento AS hora_vencimento,
+                p.whatsapp_enviado AS whatsapp_enviado,
+                p.asaas_invoice_url AS asaas_invoice_url,
+                p.pix_payload AS pix_payload,
+                p.dias_atraso     AS dias_atraso,
+                p.juros           AS juros,
+                p.total_atualizado AS total_atualizado,
+                c.nome            AS cliente_nome,
+                c.telefone        AS cliente_telefone,
+                {self._itens("p")}
+            FROM pedidos p
+            JOIN clientes c ON c.id = p.cliente_id
+            WHERE p.pago = 0
+              AND (p.whatsapp_enviado IS NULL OR p.whatsapp_enviado = 0)
+            """
+        )
+
+    def marcar_whatsapp_enviado(self, enviados: list[tuple[str, int]]) -> None:
+        """[(enviado_em, pedido_id), ...] num único lote."""
+        self.db.executar_lote(
+            """
+            UPDATE pedidos
+            SET whatsapp_enviado = 1,
+                whatsapp_enviado_em = :em
+            WHERE id = :id
+            """,
+            ({"em": em, "id": pid} for em, pid in enviados),
+        )
+        self.db.commit()
+
+    # -- juros acumulados (job diário) -------------------------------------
+    _SQL_ACUMULAR = {
+        "sqlite": """
+            UPDATE pedidos SET
+                valor_principal = c.principal,
+                dias_atraso = c.dias,
+                juros = (c.principal - c.abatido) * :taxa * c.dias,
+                total_atualizado = (c.principal - c.abatido)
+                    + (c.principal - c.abatido) * :taxa * c.dias
+            FROM (
+                SELECT
+                    p.id AS id,
+                    (SELECT SUM(pr.preco * i.quantidade) FROM pedido_itens i
+                      JOIN produtos pr ON pr.id = i.produto_id
+                      WHERE i.pedido_id = p.id) AS principal,
+                    COALESCE(p.valor_abatido, 0) AS abatido,
+                    MAX(CAST(julianday(:hoje) - julianday(p.vencimento) AS INTEGER), 0) AS dias
+                FROM pedidos p
+                WHERE p.pago = 0 AND p.vencimento IS NOT NULL{filtro}
+            ) AS c
+            WHERE pedidos.id = c.id
+              AND (pedidos.dias_atraso IS NOT c.dias
+                   OR pedidos.valor_principal IS NOT c.principal
+                   OR pedidos.total_atualizado IS NULL)
+        """,
+        "postgres": """
+            UPDATE pedidos SET
+                valor_principal = c.principal,
+                dias_atraso = c.dias,
+                juros = (c.principal - c.abatido) * :taxa * c.dias,
+                total_atualizado = (c.principal - c.abatido)
+                    + (c.principal - c.abatido) * :taxa * c.dias
+            FROM (
+                SELECT
+                    p.id AS id,
+                    (SELECT SUM(pr.preco * i.quantidade) FROM pedido_itens i
+                      JOIN produtos pr ON pr.id = i.produto_id
+                      WHERE i.pedido_id = p.id) AS principal,
+                    COALESCE(p.valor_abatido, 0) AS abatido,
+                    GREATEST(CAST(:hoje AS DATE) - CAST(p.vencimento AS DATE), 0) AS dias
+                FROM pedidos p
+                WHERE p.pago = 0 AND p.vencimento IS NOT NULL{filtro}
+            ) AS c
+            WHERE pedidos.id = c.id
+              AND (pedidos.dias_atraso IS DISTINCT FROM c.dias
+                   OR pedidos.valor_principal IS DISTINCT FROM c.principal
+                   OR pedidos.total_atualizado IS NULL)
+        """,
+    }
+
+    def sem_vencimento(self) -> list:
+        """Em aberto sem vencimento gravado (pedidos antigos)."""
+        return self.db.todos(
+            "SELECT id, data FROM pedidos WHERE pago = 0 AND vencimento IS NULL"
+        )
+
+    def gravar_vencimentos(self, vencimentos: list[tuple[int, str]]) -> None:
+        self.db.executar_lote(
+            "UPDATE pedidos SET vencimento = :venc WHERE id = :id",
+            ({"id": pid, "venc": venc} for pid, venc in vencimentos),
+        )
+
+    def acumular(self, hoje: str, uid: int | None = None, pedido_id: int | None = None) -> int:
+        """Atualiza dias de atraso, juros e total dos pedidos em aberto.
+
+        Os juros correm sobre o principal menos o que já foi abatido. Um
+        único UPDATE; só as linhas cujo saldo mudou são gravadas. Não faz
+        commit. Retorna quantas linhas mudaram.
+        """
+        from .utils import TAXA_JUROS_DIA
+
+        filtro, params = "", {"hoje": hoje, "taxa": TAXA_JUROS_DIA}
+        if uid is not None:
+            filtro += " AND p.usuario_id = :uid"
+            params["uid"] = uid
+        if pedido_id is not None:
+            filtro += " AND p.id = :pedido_id"
+            params["pedido_id"] = pedido_id
+        sql = self._SQL_ACUMULAR[self.db.nome].format(filtro=filtro)
+        return self.db.executar(sql, params)
+
+    def recalcular_saldos(self, uid: int | None = None) -> None:
+        """Refaz `clientes_saldo` a partir dos pedidos em aberto (sem commit)."""
+        from .db import SQL_SALDOS_APAGAR, SQL_SALDOS_INSERIR
+
+        filtro, params = "", {}
+        if uid is not None:
+            filtro, params = " AND usuario_id = :uid", {"uid": uid}
+        self.db.executar(SQL_SALDOS_APAGAR.format(filtro=filtro), params)
+        self.db.executar(
+            SQL_SALDOS_INSERIR.format(filtro=filtro.replace("usuario_id", "p.usuario_id")),
+            params,
+        )
+
+    def marcar_acumulado(self, hoje: str) -> None:
+        """Grava a data do último acúmulo completo (ver `acumulado_em`)."""
+        self.db.executar(
+            "DELETE FROM controle WHERE chave = 'juros_acumulados_em'"
+        )
+        self.db.executar(
+            "INSERT INTO controle (chave, valor) VALUES ('juros_acumulados_em', :hoje)",
+            {"hoje": hoje},
+        )
+
+    def acumulado_em(self) -> str | None:
+        """Dia do último acúmulo completo: saldos guardados valem até o fim dele."""
+        return self.db.valor("SELECT valor FROM controle WHERE chave = 'juros_acumulados_em'")
+
+    def abertos_saldos(self) -> list:
+        """Todos os pedidos em aberto com o saldo guardado (para conferência)."""
+        return self.db.todos(
+            f"""
+            SELECT
+                p.id AS pedido_id,
+                p.data AS data_pedido,
+                p.vencimento AS vencimento,
+                p.dias_atraso AS dias_atraso,
+                p.juros AS juros,
+                p.total_atualizado AS total_atualizado,
+                {self._itens("p")}
+            FROM pedidos p
+            WHERE p.pago = 0
+            """
+        )
+
+
+class Financeiro(_Repo):
+    """Painel financeiro do usuário (rollup `financeiro_diario` + pedidos)."""
+
+    @staticmethod
+    def _periodo(coluna: str, de: str | None, ate: str | None) -> tuple[str, dict]:
+        """Filtro de/ate (YYYY-MM-DD) sobre uma coluna de texto ISO."""
+        where, params = "", {}
+        if de:
+            where += f" AND {coluna} >= :de"
+            params["de"] = de
+        if ate:
+            # `< dia seguinte` cobre colunas com hora e usa o índice
+            where += f" AND {coluna} < :ate_fim"
+            params["ate_fim"] = (date.fromisoformat(ate) + timedelta(days=1)).isoformat()
+        return where, params
+
+    def versao(self, uid: int) -> int:
+        return int(self.db.valor(
+            "SELECT versao FROM financeiro_versao WHERE usuario_id = :uid",
+            {"uid": uid},
+            padrao=0,
+        ))
+
+    def resumo(self, uid: int, de: str | None = None, ate: str | None = None) -> dict:
+        """Recebido, juros e prazo médio (dias) do período, pelo rollup."""
+        where, params = self._periodo("dia", de, ate)
+        row = self.db.um(
+            f"""
+            SELECT
+                COALESCE(SUM(recebido), 0) AS recebido,
+                COALESCE(SUM(juros), 0) AS juros,
+                COALESCE(SUM(pagamentos), 0) AS pagamentos,
+                COALESCE(SUM(dias_para_pagar), 0) AS dias
+            FROM financeiro_diario
+            WHERE usuario_id = :uid{where}
+            """,
+            {"uid": uid, **params},
+        )
+        pagamentos = int(row["pagamentos"])
+        return {
+            "recebido": float(row["recebido"]),
+            "juros": float(row["juros"]),
+            "pagamentos": pagamentos,
+            "prazo_medio": float(row["dias"]) / pagamentos if pagamentos else None,
+        }
+
+    def por_dia(self, uid: int, de: str | None = None, ate: str | None = None,
+                limite: int = 31) -> list:
+        where, params = self._periodo("dia", de, ate)
+        return self.db.todos(
+            f"""
+            SELECT dia, recebido, juros, pagamentos
+            FROM financeiro_diario
+            WHERE usuario_id = :uid AND pagamentos > 0{where}
+            ORDER BY dia DESC
+            LIMIT :limite
+            """,
+            {"uid": uid, "limite": limite, **params},
+        )
+
+    def qtd_abertos(self, uid: int) -> int:
+        return int(self.db.valor(
+            "SELECT COUNT(*) FROM pedidos WHERE usuario_id = :uid AND pago = 0",
+            {"uid": uid},
+            padrao=0,
+        ))
+
+    def ultimos_pagamentos(self, uid: int, de: str | None = None, ate: str | None = None,
+                           limite: int = 20) -> list:
+        """Pagamentos mais recentes do período; o arquivo só é lido se os da
+        tabela quente não bastarem para encher a lista."""
+        where, params = self._periodo("p.data_pagamento", de, ate)
+        params.update(uid=uid, limite=limite)
+
+        def consultar(pedidos: str, itens: str) -> list:
+            return self.db.todos(
+                f"""
+                SELECT
+                    p.id,
+                    p.data_pagamento,
+                    p.valor_pago,
+                    c.nome AS cliente,
+                    {self._itens("p", itens)}
+                FROM {pedidos} p
+                JOIN clientes c ON c.id = p.cliente_id
+                WHERE p.usuario_id = :uid AND p.pago = 1{where}
+                ORDER BY p.data_pagamento DESC
+                LIMIT :limite
+                """,
+                params,
+            )
+
+        linhas = consultar("pedidos", "pedido_itens")
+        corte = self._corte()
+        if fontes_pedidos(corte, de)[0] == "pedidos":
+            return linhas
+        if len(linhas) == limite and linhas[-1]["data_pagamento"] >= corte:
+            return linhas  # tudo no arquivo é mais antigo que o último da lista
+        linhas += consultar("pedidos_arquivo", "pedido_itens_arquivo")
+        linhas.sort(key=lambda r: r["data_pagamento"] or "", reverse=True)
+        return linhas[:limite]
+
+
+class Dashboard(_Repo):
+    """Resumo da tela inicial."""
+
+    def total_por_status(self, uid: int, pago: int) -> float:
+        """Principal em aberto (`pago=0`) ou recebido (`pago=1`); o abatido
+        dos pedidos em aberto conta como recebido."""
+        aberto = self.db.um(
+            """
+            SELECT COALESCE(SUM(valor_principal), 0) AS principal,
+                   COALESCE(SUM(valor_abatido), 0) AS abatido
+            FROM pedidos
+            WHERE pago = 0 AND usuario_id = :uid
+            """,
+            {"uid": uid},
+        )
+        if not pago:
+            return aberto["principal"] - aberto["abatido"]
+        total = aberto["abatido"] + self.db.valor(
+            "SELECT SUM(valor_principal) FROM pedidos WHERE pago = 1 AND usuario_id = :uid",
+            {"uid": uid},
+            padrao=0,
+        )
+        if self._corte():
+            total += self.db.valor(
+                "SELECT SUM(valor_principal) FROM pedidos_arquivo WHERE usuario_id = :uid",
+                {"uid": uid},
+                padrao=0,
+            )
+        return total
+
+    def contar_clientes(self, uid: int) -> int:
+        return self.db.valor(
+            "SELECT COUNT(*) FROM clientes WHERE usuario_id = :uid", {"uid": uid}, padrao=0
+        )
+
+    def contar_pedidos(self, uid: int) -> int:
+        pedidos, _ = fontes_pedidos(self._corte(), None)
+        return self.db.valor(
+            f"SELECT COUNT(*) FROM {pedidos} WHERE usuario_id = :uid", {"uid": uid}, padrao=0
+        )
+
+    def top_devedores(self, uid: int, limite: int = 5) -> list:
+        """[(cliente, total em aberto)] lidos de `clientes_saldo` pelo índice."""
+        return self.db.todos(
+            """
+            SELECT clientes.nome, saldo.total
+            FROM clientes_saldo saldo
+            JOIN clientes ON clientes.id = saldo.cliente_id
+            WHERE saldo.usuario_id = :uid AND saldo.pedidos_abertos > 0
+            ORDER BY saldo.total DESC
+            LIMIT :limite
+            """,
+            {"uid": uid, "limite": limite},
+        )
+
+    def total_por_mes(self, uid: int, meses: int = 6) -> list:
+        """[(AAAA-MM, total)] dos últimos `meses`, do mais recente ao mais antigo."""
+        hoje = date.today()
+        ano, mes = divmod(hoje.year * 12 + hoje.month - meses, 12)
+        de = date(ano, mes + 1, 1).isoformat()
+        pedidos, _ = fontes_pedidos(self._corte(), de)
+        return self.db.todos(
+            f"""
+            SELECT substr(data, 1, 7) AS mes,
+                   SUM(valor_principal) AS total
+            FROM {pedidos}
+            WHERE usuario_id = :uid AND data >= :de
+            GROUP BY mes
+            ORDER BY mes DESC
+            LIMIT :meses
+            """,
+            {"uid": uid, "de": de, "meses": meses},
+        )
+
+
+class Loja(_Repo):
+    """Consultas da área pública e do webhook do Asaas."""
+
+    def produtos(self, uid: int) -> list:
+        return self.db.todos(
+            "SELECT id, nome, preco FROM produtos WHERE usuario_id = :uid ORDER BY nome",
+            {"uid": uid},
+        )
+
+    def cliente_por_telefone(self, uid: int, telefone: str) -> int | None:
+        return self.db.valor(
+            "SELECT id FROM clientes WHERE usuario_id = :uid AND telefone = :telefone LIMIT 1",
+            {"uid": uid, "telefone": telefone},
+        )
+
+    def criar_cliente(self, uid: int, nome: str, telefone: str) -> int:
+        return self.db.inserir(
+            "INSERT INTO clientes (usuario_id, nome, telefone) VALUES (:uid, :nome, :telefone)",
+            {"uid": uid, "nome": nome, "telefone": telefone},
+        )
+
+    def salvar_cobranca_asaas(self, pedido_id: int, dados: dict[str, Any]) -> None:
+        self.db.executar(
+            """
+            UPDATE pedidos
+            SET asaas_customer_id = :customer_id,
+                asaas_payment_id = :payment_id,
+                asaas_invoice_url = :invoice_url,
+                pix_payload = :pix_payload,
+                pix_qr_code = :pix_qr_code,
+                asaas_status = :status
+            WHERE id = :id
+            """,
+            {**dados, "id": pedido_id},
+        )
+        self.db.commit()
+
+    def cobranca_do_pedido(self, pedido_id: int):
+        return self.db.um(
+            """
+            SELECT pago, asaas_customer_id, asaas_payment_id, asaas_invoice_url,
+                   pix_payload
+            FROM pedidos WHERE id = :id
+            """,
+            {"id": pedido_id},
+        )
+
+    def pedido_do_pagamento(self, payment_id: str):
+        return self.db.um(
+            "SELECT id, usuario_id, cliente_id, pago, valor_principal, valor_pago, "
+            "valor_abatido FROM pedidos WHERE asaas_payment_id = :pid LIMIT 1",
+            {"pid": payment_id},
+        )
+
+    def baixa_webhook(self, pedido_id: int, data: str, valor: float | None, evento: str) -> None:
+        self.db.executar(
+            """
+            UPDATE pedidos
+            SET pago = 1,
+                data_pagamento = :data,
+                valor_pago = :valor + COALESCE(valor_abatido, 0),
+                asaas_status = :evento,
+                -- juros recebidos = o que veio acima do principal em aberto
+                -- (o acumulado pelo job não foi necessariamente cobrado)
+                juros = CASE
+                    WHEN :valor > COALESCE(valor_principal - COALESCE(valor_abatido, 0), :valor)
+                    THEN :valor - (valor_principal - COALESCE(valor_abatido, 0))
+                    ELSE 0
+                END
+            WHERE id = :id
+            """,
+            {"data": data, "valor": valor, "evento": evento, "id": pedido_id},
+        )
+        self.db.commit()
+
+
+class Arquivo(_Repo):
+    """Partição fria dos pedidos pagos (ver arquivo.py)."""
+
+    def corte(self) -> str | None:
+        return self._corte()
+
+    def arquivar_lote(self, corte: str, lote: int, agora: str) -> int:
+        """Move até `lote` pedidos pagos antes de `corte` (e os itens) para
+        o arquivo, numa transação. Retorna quantos foram movidos."""
+        ids = [
+            int(r["id"]) for r in self.db.todos(
+                """
+                SELECT id FROM pedidos
+                WHERE pago = 1 AND data_pagamento < :corte
+                ORDER BY id
+                LIMIT :lote
+                """,
+                {"corte": corte, "lote": lote},
+            )
+        ]
+        if not ids:
+            return 0
+        em, params = _em("a", ids)
+        cols = ", ".join(COLUNAS_PEDIDOS)
+        self.db.executar(
+            f"INSERT INTO pedidos_arquivo ({cols}, arquivado_em) "
+            f"SELECT {cols}, :agora FROM pedidos WHERE id IN {em}",
+            {**params, "agora": agora},
+        )
+        cols = ", ".join(COLUNAS_ITENS)
+        self.db.executar(
+            f"INSERT INTO pedido_itens_arquivo ({cols}) "
+            f"SELECT {cols} FROM pedido_itens WHERE pedido_id IN {em}",
+            params,
+        )
+        self.db.executar(f"DELETE FROM pedido_itens WHERE pedido_id IN {em}", params)
+        # os triggers ignoram o DELETE de quem já está no arquivo
+        self.db.executar(f"DELETE FROM pedidos WHERE id IN {em}", params)
+        if (self._corte() or "") < corte:
+            self.db.executar(
+                "DELETE FROM controle WHERE chave = :chave", {"chave": ARQUIVO_CORTE}
+            )
+            self.db.executar(
+                "INSERT INTO controle (chave, valor) VALUES (:chave, :corte)",
+                {"chave": ARQUIVO_CORTE, "corte": corte},
+            )
+        self.db.commit()
+        return len(ids)
+
+
+class Repositorios:
+    """Todos os repositórios sobre o mesmo backend."""
+
+    def __init__(self, db: Backend):
+        self.db = db
+        self.usuarios = Usuarios(db)
+        self.clientes = Clientes(db)
+        self.produtos = Produtos(db)
+        self.estoque = Estoque(db)
+        self.pedidos = Pedidos(db)
+        self.cobrancas = Cobrancas(db)
+        self.financeiro = Financeiro(db)
+        self.dashboard = Dashboard(db)
+        self.loja = Loja(db)
+        self.arquivo = Arquivo(db)
+
+    def commit(self) -> None:
+        self.db.commit()
+
+
+def apenas_sqlite() -> None:
+    """`before_request` das telas que ainda usam o SQLite direto.
+
+    Com DB_BACKEND=postgres elas leriam e gravariam o arquivo SQLite, não o
+    banco da aplicação.
+    """
+    if backend().nome != "sqlite":
+        abort(501, description="indisponível com DB_BACKEND=postgres")
+
+
+def repo() -> Repositorios:
+    """Repositórios do backend configurado (um conjunto por request/contexto)."""
+    if "repo" not in g:
+        g.repo = Repositorios(backend())
+    return g.repo
+
+
+def instalar(app: Flask) -> None:
+    """Devolve a conexão do Postgres ao pool no fim de cada contexto."""
+    b = backend()
+    if isinstance(b, BackendPostgres):
+        app.teardown_appcontext(b.devolver)
+
+
+@bp.cli.command("init-postgres")
+def init_postgres_cli() -> None:
+    """Cria as tabelas no PostgreSQL (schema_postgres.sql)."""
+    b = backend()
+    if not isinstance(b, BackendPostgres):
+        raise click.ClickException("defina DB_BACKEND=postgres e DATABASE_URL")
+    caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_postgres.sql")
+    with open(caminho, encoding="utf-8") as fh:
+        ddl = fh.read()
+    with b.pool().connection() as con:
+        con.execute(ddl)
+    click.echo("schema aplicado")
@@ -1,9 +1,24 @@
-"""Scheduler de cobranças automáticas.
+"""Jobs periódicos (cobranças automáticas, juros, arquivo, backup).
+
+Rodam na fila do worker.py (ver fila.py): `agendar_jobs()` põe cada um na
+agenda e um executor livre pega o job na hora marcada.
 
 Como funciona:
 - A cada 1 minuto, busca pedidos em aberto (pago=0) que já chegaram no vencimento (data + hora)
   e ainda não tiveram WhatsApp enviado.
-- Envia a mensagem e marca whatsapp_enviado=1.
+- Envia as mensagens em paralelo (até WHATSAPP_CONCORRENCIA em voo, no event
+  loop do http_async) e marca whatsapp_enviado=1 nas que deram certo.
+- Uma vez por dia (JUROS_HORA, e na primeira subida do worker) grava o saldo atualizado
+  dos pedidos em aberto (`cobrancas.acumular_juros`) e confere o resultado
+  contra o cálculo na hora; divergências vão para o log.
+- Uma vez por dia (ARQUIVO_HORA) move os pedidos pagos antigos para o
+  arquivo e roda incremental_vacuum + ANALYZE (ver arquivo.py).
+- Uma vez por dia (BACKUP_HORA) faz o backup online dos bancos SQLite, com
+  rotação dos snapshots (ver backup.py).
+- A cada 1 minuto apaga as sessões vencidas.
+- A cada 10 minutos apaga os eventos das telas ao vivo mais velhos que
+  EVENTOS_RETENCAO (ver eventos.py).
+- Um horário perdido (worker fora do ar) roda assim que o worker volta.
 
 IMPORTANTE:
 - Isso só roda se o sistema estiver EXECUTANDO num servidor ligado 24/7.
@@ -11,16 +26,34 @@ IMPORTANTE:
 
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
+import logging
 import os
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from flask import Flask
+from flask import Flask, current_app
+
+from .arquivo import ARQUIVO_AUTOMATICO, ARQUIVO_HORA, arquivar_e_limpar
+from .backup import BACKUP_AUTOMATICO, BACKUP_HORA, backup_tudo
+from .cobrancas import (
+    acumular_juros,
+    saldos_em_dia,
+    verificar_juros,
+)
+from .db import listar_tenants, shards_ativos, usar_tenant
+from .eventos import limpar as limpar_eventos
+from .fila import agendar, tarefa
+from .metricas import scheduler_itens, scheduler_pendentes
+from .repositorio import repo
+from .http_async import reunir
+from .sessoes import limpar_sessoes_expiradas
+from .utils import calcular_juros, dias_de_atraso
+from .whatsapp_service import enviar_whatsapp_async
 
-from .db import get_db
-from .whatsapp_service import enviar_whatsapp
+WHATSAPP_CONCORRENCIA = int(os.getenv("WHATSAPP_CONCORRENCIA", "20"))
+JUROS_AUTOMATICO = os.getenv("JUROS_AUTOMATICO", "1") == "1"
+JUROS_HORA = int(os.getenv("JUROS_HORA", "0"))
 
-TAXA_JUROS_DIA = 0.03  # 3% ao dia
+log = logging.getLogger(__name__)
 
 
 def _agora_local() -> datetime:
@@ -41,119 +74,187 @@ def _parse_data_hora(data_iso: str | None, hora_hhmm: str | None) -> datetime |
         return None
 
 
-def _calcular_total(
-    preco: float, qtd: int, venc_dt: datetime, agora: datetime
-) -> tuple[float, float, int]:
-    principal = float(preco) * int(qtd)
-    dias_atraso = max((agora.date() - venc_dt.date()).days, 0)
-    juros = principal * TAXA_JUROS_DIA * dias_atraso if dias_atraso > 0 else 0.0
-    total = principal + juros
-    return total, juros, dias_atraso
+def _calcular_total(row, venc_dt: datetime, agora: datetime, guardado: bool) -> tuple[float, float, int]:
+    """(total, juros, dias): saldo gravado pelo job ou calculado na hora."""
+    if guardado and row["total_atualizado"] is not None:
+        return float(row["total_atualizado"]), float(row["juros"] or 0), int(row["dias_atraso"] or 0)
+    principal = float(row["principal_atual"] or 0)
+    dias = dias_de_atraso(agora.date(), venc_dt.date())
+    juros = calcular_juros(principal, dias)
+    return principal + juros, juros, dias
+
+
+@tarefa("cobrancas_whatsapp", tentativas=1, visibilidade=600)
+def _job_enviar_cobrancas() -> None:
+    _enviar_cobrancas(current_app._get_current_object())
 
 
-def _job_enviar_cobrancas(app: Flask) -> None:
+def _enviar_cobrancas(app: Flask) -> None:
+    """Roda o envio em cada tenant (um shard por vez, no modo shard)."""
     with app.app_context():
-        con = get_db()
-        cur = con.cursor()
-
-        cur.execute(
-            """
-            SELECT
-                p.id              AS pedido_id,
-                p.vencimento      AS vencimento,
-                p.hora_vencimento AS hora_vencimento,
-                p.quantidade      AS quantidade,
-                p.whatsapp_enviado AS whatsapp_enviado,
-                p.asaas_invoice_url AS asaas_invoice_url,
-                p.pix_payload AS pix_payload,
-                c.nome            AS cliente_nome,
-                c.telefone        AS cliente_telefone,
-                pr.nome           AS produto_nome,
-                pr.preco          AS produto_preco
-            FROM pedidos p
-            JOIN clientes c ON c.id = p.cliente_id
-            JOIN produtos pr ON pr.id = p.produto_id
-            WHERE p.pago = 0
-              AND (p.whatsapp_enviado IS NULL OR p.whatsapp_enviado = 0)
-            """
-        )
+        tenants = listar_tenants() if shards_ativos() else [None]
+
+    pendentes = 0
+    for uid in tenants:
+        with app.app_context():
+            if uid is not None:
+                usar_tenant(uid)
+            pendentes += _enviar_cobrancas_banco()
+
+    # backlog: cobranças já vencidas ainda sem WhatsApp
+    scheduler_pendentes.set(pendentes, job="cobrancas_whatsapp")
+
+
+def _enviar_cobrancas_banco() -> int:
+    """Envia as cobranças vencidas do banco atual; retorna o backlog."""
+    cobrancas = repo().cobrancas
+    rows = cobrancas.pendentes_whatsapp()
+    agora = _agora_local()
+    guardado = saldos_em_dia(agora.date())
+
+    pendentes = sum(
+        1 for r in rows
+        if (dt := _parse_data_hora(r["vencimento"], r["hora_vencimento"]))
+        and dt <= agora
+    )
 
-        rows = cur.fetchall()
-        agora = _agora_local()
+    envios: list[tuple[int, str, str]] = []
+    for r in rows:
+        venc_dt = _parse_data_hora(r["vencimento"], r["hora_vencimento"])
+        if venc_dt is None:
+            continue
 
-        for r in rows:
-            venc_dt = _parse_data_hora(r["vencimento"], r["hora_vencimento"])
-            if venc_dt is None:
-                continue
+        if agora < venc_dt:
+            continue
 
-            if agora < venc_dt:
-                continue
+        telefone = r["cliente_telefone"] or ""
+        if not telefone:
+            scheduler_itens.inc(job="cobrancas_whatsapp", resultado="sem_telefone")
+            continue
 
-            telefone = r["cliente_telefone"] or ""
-            if not telefone:
-                continue
+        total, juros, dias = _calcular_total(r, venc_dt, agora, guardado)
 
-            total, juros, dias = _calcular_total(
-                float(r["produto_preco"]),
-                int(r["quantidade"] or 0),
-                venc_dt,
-                agora,
-            )
+        nome = r["cliente_nome"]
+        produto = r["produto_nome"]
+        pedido_id = int(r["pedido_id"])
 
-            nome = r["cliente_nome"]
-            produto = r["produto_nome"]
-            pedido_id = int(r["pedido_id"])
+        msg = (
+            f"Olá {nome}! 👋\n\n"
+            f"Sua cobrança chegou agora ({venc_dt.strftime('%d/%m/%Y %H:%M')}).\n"
+            f"Pedido #{pedido_id}: {produto}\n"
+            f"Total atualizado: R$ {total:.2f}\n"
+        )
 
-            msg = (
-                f"Olá {nome}! 👋\n\n"
-                f"Sua cobrança chegou agora ({venc_dt.strftime('%d/%m/%Y %H:%M')}).\n"
-                f"Pedido #{pedido_id}: {produto} x{int(r['quantidade'])}\n"
-                f"Total atualizado: R$ {total:.2f}\n"
+        if dias > 0:
+            msg += (
+                f"Inclui juros de R$ {juros:.2f} "
+                f"(3% ao dia, {dias} dia(s) de atraso).\n"
             )
 
-            if dias > 0:
-                msg += (
-                    f"Inclui juros de R$ {juros:.2f} "
-                    f"(3% ao dia, {dias} dia(s) de atraso).\n"
-                )
+        # Se houver PIX, inclui link e código copia-e-cola
+        if r["asaas_invoice_url"]:
+            msg += f"\nLink do pagamento (Pix): {r['asaas_invoice_url']}\n"
+
+        if r["pix_payload"]:
+            msg += f"\nPix Copia e Cola:\n{r['pix_payload']}\n"
+
+        msg += "\nResponda aqui confirmando o pagamento 🙂"
+
+        envios.append((pedido_id, telefone, msg))
+
+    if not envios:
+        return pendentes
+
+    resultados = reunir(
+        [enviar_whatsapp_async(tel, msg) for _, tel, msg in envios],
+        limite=WHATSAPP_CONCORRENCIA,
+    )
+    enviados = []
+    for (pedido_id, _, _), ok in zip(envios, resultados):
+        ok = ok is True  # exceção do provedor conta como falha
+        scheduler_itens.inc(
+            job="cobrancas_whatsapp", resultado="enviado" if ok else "falha"
+        )
+        if ok:
+            enviados.append((agora.isoformat(timespec="seconds"), pedido_id))
+
+    if enviados:
+        cobrancas.marcar_whatsapp_enviado(enviados)
 
-            # Se houver PIX, inclui link e código copia-e-cola
-            if r["asaas_invoice_url"]:
-                msg += f"\nLink do pagamento (Pix): {r['asaas_invoice_url']}\n"
+    return pendentes
 
-            if r["pix_payload"]:
-                msg += f"\nPix Copia e Cola:\n{r['pix_payload']}\n"
 
-            msg += "\nResponda aqui confirmando o pagamento 🙂"
+@tarefa("acumular_juros", tentativas=3, visibilidade=3600)
+def _job_acumular_juros() -> None:
+    _acumular_juros(current_app._get_current_object())
 
-            ok = enviar_whatsapp(telefone, msg)
 
-            if ok:
-                cur.execute(
-                    """
-                    UPDATE pedidos
-                    SET whatsapp_enviado = 1,
-                        whatsapp_enviado_em = ?
-                    WHERE id = ?
-                    """,
-                    (agora.isoformat(timespec="seconds"), pedido_id),
+def _acumular_juros(app: Flask) -> None:
+    """Acumula os juros do dia e confere, tenant por tenant."""
+    with app.app_context():
+        tenants = listar_tenants() if shards_ativos() else [None]
+
+    hoje = date.today()
+    for uid in tenants:
+        with app.app_context():
+            if uid is not None:
+                usar_tenant(uid)
+            alterados = acumular_juros(hoje)
+            scheduler_itens.inc(alterados, job="acumular_juros", resultado="atualizado")
+            divergencias = verificar_juros(hoje)
+            if divergencias:
+                scheduler_itens.inc(
+                    len(divergencias), job="acumular_juros", resultado="divergente"
+                )
+                log.warning(
+                    "juros divergentes (tenant=%s): %d pedido(s), ex.: %s",
+                    uid, len(divergencias), divergencias[:5],
                 )
-                con.commit()
 
 
-def start_scheduler(app: Flask) -> None:
-    """Inicia o scheduler em background, se habilitado."""
-    if os.getenv("WHATSAPP_AUTOMATICO", "0") != "1":
-        return
+@tarefa("arquivar_pedidos", tentativas=3, visibilidade=3600)
+def _job_arquivar() -> None:
+    _arquivar(current_app._get_current_object())
+
+
+def _arquivar(app: Flask) -> None:
+    """Arquiva os pedidos pagos antigos, tenant por tenant."""
+    with app.app_context():
+        tenants = listar_tenants() if shards_ativos() else [None]
+
+    for uid in tenants:
+        with app.app_context():
+            if uid is not None:
+                usar_tenant(uid)
+            movidos = arquivar_e_limpar()
+            scheduler_itens.inc(movidos, job="arquivar_pedidos", resultado="arquivado")
+
+
+@tarefa("backup", tentativas=2, visibilidade=4 * 3600, prioridade=-10)
+def _job_backup() -> None:
+    for r in backup_tudo():
+        scheduler_itens.inc(job="backup", resultado="erro" if "erro" in r else "ok")
+
+
+@tarefa("limpar_sessoes", tentativas=1)
+def _job_limpar_sessoes() -> None:
+    limpar_sessoes_expiradas(current_app._get_current_object())
+
+
+@tarefa("limpar_eventos", tentativas=1)
+def _job_limpar_eventos() -> None:
+    scheduler_itens.inc(limpar_eventos(), job="limpar_eventos", resultado="apagado")
 
-    sched = BackgroundScheduler(daemon=True)
-    sched.add_job(
-        lambda: _job_enviar_cobrancas(app),
-        "interval",
-        minutes=1,
-        id="cobrancas_whatsapp",
-    )
-    sched.start()
 
-    # evita que o scheduler seja coletado pelo GC
-    app.extensions["apscheduler"] = sched
+def agendar_jobs() -> None:
+    """Põe os jobs habilitados na agenda da fila (worker.py / run.py)."""
+    if os.getenv("WHATSAPP_AUTOMATICO", "0") == "1":
+        agendar("cobrancas_whatsapp", a_cada=60)
+    if JUROS_AUTOMATICO:
+        agendar("acumular_juros", hora=JUROS_HORA, minuto=5, ao_subir=True)
+    if ARQUIVO_AUTOMATICO:
+        agendar("arquivar_pedidos", hora=ARQUIVO_HORA, minuto=15)
+    if BACKUP_AUTOMATICO:
+        agendar("backup", hora=BACKUP_HORA, minuto=30)
+    agendar("limpar_sessoes", a_cada=60)
+    agendar("limpar_eventos", a_cada=600)
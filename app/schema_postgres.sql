@@ -0,0 +1,309 @@
+-- Schema PostgreSQL equivalente ao init_db() (db.py) para as tabelas usadas
+-- pelos repositórios. Datas continuam em TEXT ISO (mesmo formato do SQLite).
+-- Aplicar: flask --app run repositorio init-postgres
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id BIGSERIAL PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    senha_hash BYTEA NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS clientes (
+    id BIGSERIAL PRIMARY KEY,
+    usuario_id BIGINT,
+    nome TEXT NOT NULL,
+    telefone TEXT
+);
+
+CREATE TABLE IF NOT EXISTS produtos (
+    id BIGSERIAL PRIMARY KEY,
+    usuario_id BIGINT,
+    nome TEXT NOT NULL,
+    preco DOUBLE PRECISION NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pedidos (
+    id BIGSERIAL PRIMARY KEY,
+    usuario_id BIGINT,
+    cliente_id BIGINT,
+    produto_id BIGINT,
+    quantidade INTEGER,
+    data TEXT,
+    vencimento TEXT,
+    hora_vencimento TEXT,
+    pago INTEGER DEFAULT 0,
+    juros DOUBLE PRECISION DEFAULT 0,
+    data_pagamento TEXT,
+    valor_pago DOUBLE PRECISION,
+    asaas_customer_id TEXT,
+    asaas_payment_id TEXT,
+    asaas_invoice_url TEXT,
+    pix_payload TEXT,
+    pix_qr_code TEXT,
+    asaas_status TEXT,
+    whatsapp_enviado INTEGER DEFAULT 0,
+    whatsapp_enviado_em TEXT,
+    valor_principal DOUBLE PRECISION,
+    dias_atraso INTEGER,
+    total_atualizado DOUBLE PRECISION,
+    valor_abatido DOUBLE PRECISION
+);
+
+-- Saldo atualizado gravado pelo job diário de juros (bancos já criados)
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS valor_principal DOUBLE PRECISION;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS dias_atraso INTEGER;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS total_atualizado DOUBLE PRECISION;
+-- Já recebido de um pedido em aberto (pagamento parcial)
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS valor_abatido DOUBLE PRECISION;
+
+-- Itens do pedido (carrinho); pedidos antigos usam produto_id/quantidade
+CREATE TABLE IF NOT EXISTS pedido_itens (
+    id BIGSERIAL PRIMARY KEY,
+    pedido_id BIGINT NOT NULL,
+    usuario_id BIGINT,
+    produto_id BIGINT NOT NULL,
+    quantidade INTEGER NOT NULL
+);
+
+-- Pedidos antigos (um produto por linha) ganham o seu item (idempotente)
+INSERT INTO pedido_itens (pedido_id, usuario_id, produto_id, quantidade)
+SELECT p.id, p.usuario_id, p.produto_id, COALESCE(p.quantidade, 0)
+FROM pedidos p
+WHERE p.produto_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM pedido_itens i WHERE i.pedido_id = p.id);
+
+UPDATE pedidos
+SET valor_principal = (SELECT preco FROM produtos WHERE id = pedidos.produto_id)
+                      * COALESCE(quantidade, 0)
+WHERE valor_principal IS NULL AND produto_id IS NOT NULL;
+
+-- Arquivo dos pedidos pagos antigos (ver arquivo.py); as views juntam as
+-- duas partes para os relatórios de histórico
+CREATE TABLE IF NOT EXISTS pedidos_arquivo (
+    id BIGINT PRIMARY KEY,
+    usuario_id BIGINT,
+    cliente_id BIGINT,
+    produto_id BIGINT,
+    quantidade INTEGER,
+    data TEXT,
+    vencimento TEXT,
+    hora_vencimento TEXT,
+    pago INTEGER,
+    juros DOUBLE PRECISION,
+    data_pagamento TEXT,
+    valor_pago DOUBLE PRECISION,
+    asaas_customer_id TEXT,
+    asaas_payment_id TEXT,
+    asaas_invoice_url TEXT,
+    pix_payload TEXT,
+    pix_qr_code TEXT,
+    asaas_status TEXT,
+    whatsapp_enviado INTEGER,
+    whatsapp_enviado_em TEXT,
+    valor_principal DOUBLE PRECISION,
+    dias_atraso INTEGER,
+    total_atualizado DOUBLE PRECISION,
+    arquivado_em TEXT,
+    valor_abatido DOUBLE PRECISION
+);
+ALTER TABLE pedidos_arquivo ADD COLUMN IF NOT EXISTS valor_abatido DOUBLE PRECISION;
+
+CREATE TABLE IF NOT EXISTS pedido_itens_arquivo (
+    id BIGINT PRIMARY KEY,
+    pedido_id BIGINT NOT NULL,
+    usuario_id BIGINT,
+    produto_id BIGINT NOT NULL,
+    quantidade INTEGER NOT NULL
+);
+
+CREATE OR REPLACE VIEW pedidos_todos AS
+    SELECT id, usuario_id, cliente_id, produto_id, quantidade, data, vencimento,
+           hora_vencimento, pago, juros, data_pagamento, valor_pago,
+           asaas_customer_id, asaas_payment_id, asaas_invoice_url, pix_payload,
+           pix_qr_code, asaas_status, whatsapp_enviado, whatsapp_enviado_em,
+           valor_principal, dias_atraso, total_atualizado, valor_abatido
+    FROM pedidos
+    UNION ALL
+    SELECT id, usuario_id, cliente_id, produto_id, quantidade, data, vencimento,
+           hora_vencimento, pago, juros, data_pagamento, valor_pago,
+           asaas_customer_id, asaas_payment_id, asaas_invoice_url, pix_payload,
+           pix_qr_code, asaas_status, whatsapp_enviado, whatsapp_enviado_em,
+           valor_principal, dias_atraso, total_atualizado, valor_abatido
+    FROM pedidos_arquivo;
+
+CREATE OR REPLACE VIEW pedido_itens_todos AS
+    SELECT id, pedido_id, usuario_id, produto_id, quantidade FROM pedido_itens
+    UNION ALL
+    SELECT id, pedido_id, usuario_id, produto_id, quantidade FROM pedido_itens_arquivo;
+
+CREATE TABLE IF NOT EXISTS controle (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+
+CREATE TABLE IF NOT EXISTS estoque (
+    id BIGSERIAL PRIMARY KEY,
+    usuario_id BIGINT NOT NULL,
+    produto_id BIGINT NOT NULL,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    minimo INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (usuario_id, produto_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_pedidos_usuario_data ON pedidos (usuario_id, data);
+CREATE INDEX IF NOT EXISTS idx_pedido_itens_pedido ON pedido_itens (pedido_id);
+CREATE INDEX IF NOT EXISTS idx_pedidos_pagamento ON pedidos (asaas_payment_id);
+CREATE INDEX IF NOT EXISTS idx_clientes_usuario_telefone ON clientes (usuario_id, telefone);
+CREATE INDEX IF NOT EXISTS idx_produtos_usuario_nome ON produtos (usuario_id, nome);
+CREATE INDEX IF NOT EXISTS idx_pedidos_usuario_pago_pagamento
+    ON pedidos (usuario_id, pago, data_pagamento);
+CREATE INDEX IF NOT EXISTS idx_pedidos_abertos_vencimento
+    ON pedidos (vencimento) WHERE pago = 0;
+CREATE INDEX IF NOT EXISTS idx_pedidos_cliente_abertos
+    ON pedidos (cliente_id, vencimento) WHERE pago = 0;
+CREATE INDEX IF NOT EXISTS idx_pedidos_arquivo_usuario_data
+    ON pedidos_arquivo (usuario_id, data, valor_principal);
+CREATE INDEX IF NOT EXISTS idx_pedidos_arquivo_usuario_pagamento
+    ON pedidos_arquivo (usuario_id, data_pagamento);
+CREATE INDEX IF NOT EXISTS idx_pedido_itens_arquivo_pedido
+    ON pedido_itens_arquivo (pedido_id);
+
+-- Rollup diário do financeiro e versão por usuário (cache do painel),
+-- mantidos pelo trigger abaixo como no SQLite (ver db._criar_financeiro).
+CREATE TABLE IF NOT EXISTS financeiro_diario (
+    usuario_id BIGINT NOT NULL,
+    dia TEXT NOT NULL,
+    recebido DOUBLE PRECISION NOT NULL DEFAULT 0,
+    juros DOUBLE PRECISION NOT NULL DEFAULT 0,
+    pagamentos INTEGER NOT NULL DEFAULT 0,
+    dias_para_pagar INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (usuario_id, dia)
+);
+
+CREATE TABLE IF NOT EXISTS financeiro_versao (
+    usuario_id BIGINT PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION financeiro_somar(p pedidos, sinal INTEGER) RETURNS void AS $$
+BEGIN
+    IF p.usuario_id IS NULL THEN
+        RETURN;
+    END IF;
+    IF p.pago = 1 AND p.data_pagamento IS NOT NULL THEN
+        INSERT INTO financeiro_diario AS f
+            (usuario_id, dia, recebido, juros, pagamentos, dias_para_pagar)
+        VALUES (
+            p.usuario_id,
+            substr(p.data_pagamento, 1, 10),
+            sinal * COALESCE(p.valor_pago, 0),
+            sinal * COALESCE(p.juros, 0),
+            sinal,
+            sinal * COALESCE(substr(p.data_pagamento, 1, 10)::date - substr(p.data, 1, 10)::date, 0)
+        )
+        ON CONFLICT (usuario_id, dia) DO UPDATE SET
+            recebido = f.recebido + EXCLUDED.recebido,
+            juros = f.juros + EXCLUDED.juros,
+            pagamentos = f.pagamentos + EXCLUDED.pagamentos,
+            dias_para_pagar = f.dias_para_pagar + EXCLUDED.dias_para_pagar;
+    END IF;
+    INSERT INTO financeiro_versao AS v (usuario_id, versao) VALUES (p.usuario_id, 1)
+    ON CONFLICT (usuario_id) DO UPDATE SET versao = v.versao + 1;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION financeiro_trigger() RETURNS trigger AS $$
+BEGIN
+    -- pedido arquivado: já está em pedidos_arquivo, o rollup fica como está
+    IF TG_OP = 'DELETE' AND EXISTS (SELECT 1 FROM pedidos_arquivo WHERE id = OLD.id) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM financeiro_somar(OLD, -1);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM financeiro_somar(NEW, 1);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS financeiro_pedidos ON pedidos;
+CREATE TRIGGER financeiro_pedidos
+    AFTER INSERT OR DELETE OR UPDATE OF usuario_id, data, pago, valor_pago, juros, data_pagamento
+    ON pedidos
+    FOR EACH ROW EXECUTE FUNCTION financeiro_trigger();
+
+-- Saldo em aberto por cliente, mantido como no SQLite (ver db._criar_saldos)
+CREATE TABLE IF NOT EXISTS clientes_saldo (
+    cliente_id BIGINT PRIMARY KEY,
+    usuario_id BIGINT,
+    principal DOUBLE PRECISION NOT NULL DEFAULT 0,
+    juros DOUBLE PRECISION NOT NULL DEFAULT 0,
+    total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    pedidos_abertos INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_clientes_saldo_usuario_total
+    ON clientes_saldo (usuario_id, total DESC);
+
+CREATE OR REPLACE FUNCTION saldo_somar(p pedidos, sinal INTEGER) RETURNS void AS $$
+DECLARE
+    principal DOUBLE PRECISION;
+BEGIN
+    IF p.pago <> 0 OR NOT EXISTS (SELECT 1 FROM clientes WHERE id = p.cliente_id) THEN
+        RETURN;
+    END IF;
+    principal := COALESCE(
+        p.valor_principal,
+        (SELECT preco FROM produtos WHERE id = p.produto_id) * COALESCE(p.quantidade, 0),
+        0
+    ) - COALESCE(p.valor_abatido, 0);
+    INSERT INTO clientes_saldo AS s
+        (cliente_id, usuario_id, principal, juros, total, pedidos_abertos)
+    VALUES (
+        p.cliente_id,
+        p.usuario_id,
+        sinal * principal,
+        sinal * COALESCE(p.juros, 0),
+        sinal * (principal + COALESCE(p.juros, 0)),
+        sinal
+    )
+    ON CONFLICT (cliente_id) DO UPDATE SET
+        principal = s.principal + EXCLUDED.principal,
+        juros = s.juros + EXCLUDED.juros,
+        total = s.total + EXCLUDED.total,
+        pedidos_abertos = s.pedidos_abertos + EXCLUDED.pedidos_abertos;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION saldo_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM saldo_somar(OLD, -1);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM saldo_somar(NEW, 1);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS saldo_pedidos ON pedidos;
+CREATE TRIGGER saldo_pedidos
+    AFTER INSERT OR DELETE OR UPDATE OF usuario_id, cliente_id, produto_id, quantidade, pago,
+                                        valor_principal, valor_abatido, juros
+    ON pedidos
+    FOR EACH ROW EXECUTE FUNCTION saldo_trigger();
+
+CREATE OR REPLACE FUNCTION saldo_cliente_apagado() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM clientes_saldo WHERE cliente_id = OLD.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS saldo_clientes ON clientes;
+CREATE TRIGGER saldo_clientes
+    AFTER DELETE ON clientes
+    FOR EACH ROW EXECUTE FUNCTION saldo_cliente_apagado();
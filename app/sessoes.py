@@ -0,0 +1,283 @@
+"""Sessões no servidor (revogáveis) com cache LRU em memória.
+
+O cookie guarda só um id aleatório; os dados ficam na tabela `sessoes`.
+Assim dá para derrubar todas as sessões de um usuário (ex.: senha vazada)
+e limpar as expiradas num job (`worker.py`).
+
+Variáveis de ambiente:
+- SESSION_BACKEND: "sqlite" (default) ou "cookie" (sessão assinada do Flask).
+- SESSION_CACHE_MAX: sessões mantidas no LRU por processo. Default 1024.
+- SESSION_CACHE_TTL: segundos que uma sessão fica no LRU sem reler o banco.
+  Também é o atraso máximo para uma revogação valer nos outros workers.
+  Default 30.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from flask import Flask, session
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from .db import conectar
+
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "1024"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))
+
+
+class ArmazemSessoes(ABC):
+    """Interface de armazenamento de sessões no servidor."""
+
+    @abstractmethod
+    def carregar(self, sid: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def salvar(self, sid: str, dados: dict, expira_em: float) -> None:
+        ...
+
+    @abstractmethod
+    def remover(self, sid: str) -> None:
+        ...
+
+    @abstractmethod
+    def revogar_usuario(self, usuario_id: int) -> int:
+        ...
+
+    @abstractmethod
+    def limpar_expiradas(self) -> int:
+        ...
+
+
+class ArmazemSQLite(ArmazemSessoes):
+    """Sessões na tabela `sessoes`, com um LRU na frente."""
+
+    def __init__(self, max_cache: int = SESSION_CACHE_MAX, ttl: float = SESSION_CACHE_TTL):
+        self.max_cache = max_cache
+        self.ttl = ttl
+        self._cache: OrderedDict[str, tuple[float, float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reiniciar_no_filho)
+
+    def _reiniciar_no_filho(self) -> None:
+        """Cada worker começa com LRU vazio e lock novo."""
+        self._lock = threading.Lock()
+        self._cache.clear()
+
+    # ---- LRU ----
+    def _cache_get(self, sid: str) -> dict | None:
+        agora = time.time()
+        with self._lock:
+            item = self._cache.get(sid)
+            if item is None:
+                return None
+            lido_em, expira_em, dados = item
+            if agora - lido_em > self.ttl or agora >= expira_em:
+                del self._cache[sid]
+                return None
+            self._cache.move_to_end(sid)
+            return dict(dados)
+
+    def _cache_put(self, sid: str, dados: dict, expira_em: float) -> None:
+        with self._lock:
+            self._cache[sid] = (time.time(), expira_em, dict(dados))
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.max_cache:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, sid: str | None = None, usuario_id: int | None = None) -> None:
+        with self._lock:
+            if sid is not None:
+                self._cache.pop(sid, None)
+            if usuario_id is not None:
+                for chave in [
+                    k for k, (_, _, d) in self._cache.items()
+                    if d.get("user_id") == usuario_id
+                ]:
+                    del self._cache[chave]
+
+    # ---- banco ----
+    def carregar(self, sid: str) -> dict | None:
+        dados = self._cache_get(sid)
+        if dados is not None:
+            return dados
+
+        con = conectar()
+        try:
+            row = con.execute(
+                "SELECT dados, expira_em FROM sessoes WHERE id = ? AND expira_em > ?",
+                (sid, time.time()),
+            ).fetchone()
+        finally:
+            con.close()
+        if row is None:
+            return None
+
+        dados = json.loads(row["dados"])
+        self._cache_put(sid, dados, float(row["expira_em"]))
+        return dados
+
+    def salvar(self, sid: str, dados: dict, expira_em: float) -> None:
+        usuario_id = dados.get("user_id")
+        con = conectar()
+        try:
+            con.execute(
+                """
+                INSERT INTO sessoes (id, usuario_id, dados, criado_em, expira_em)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    usuario_id = excluded.usuario_id,
+                    dados = excluded.dados,
+                    expira_em = excluded.expira_em
+                """,
+                (sid, usuario_id, json.dumps(dados), time.time(), expira_em),
+            )
+            con.commit()
+        finally:
+            con.close()
+        self._cache_put(sid, dados, expira_em)
+
+    def remover(self, sid: str) -> None:
+        self._cache_drop(sid=sid)
+        con = conectar()
+        try:
+            con.execute("DELETE FROM sessoes WHERE id = ?", (sid,))
+            con.commit()
+        finally:
+            con.close()
+
+    def revogar_usuario(self, usuario_id: int) -> int:
+        self._cache_drop(usuario_id=usuario_id)
+        con = conectar()
+        try:
+            cur = con.execute(
+                "DELETE FROM sessoes WHERE usuario_id = ?", (usuario_id,)
+            )
+            con.commit()
+            return cur.rowcount
+        finally:
+            con.close()
+
+    def limpar_expiradas(self) -> int:
+        con = conectar()
+        try:
+            cur = con.execute(
+                "DELETE FROM sessoes WHERE expira_em <= ?", (time.time(),)
+            )
+            con.commit()
+            return cur.rowcount
+        finally:
+            con.close()
+
+
+BACKENDS: dict[str, type[ArmazemSessoes]] = {
+    "sqlite": ArmazemSQLite,
+}
+
+
+class SessaoServidor(CallbackDict, SessionMixin):
+    """Dicionário de sessão que marca quando foi alterado."""
+
+    def __init__(self, dados: dict | None = None, sid: str | None = None, nova: bool = False):
+        def ao_alterar(self):
+            self.modified = True
+
+        super().__init__(dados or {}, ao_alterar)
+        self.sid = sid
+        self.new = nova
+        self.modified = False
+        self.regenerar = False
+
+
+class InterfaceSessaoServidor(SessionInterface):
+    """SessionInterface que guarda os dados num `ArmazemSessoes`."""
+
+    def __init__(self, armazem: ArmazemSessoes):
+        self.armazem = armazem
+
+    @staticmethod
+    def _novo_sid() -> str:
+        return secrets.token_urlsafe(32)
+
+    def open_session(self, app: Flask, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            dados = self.armazem.carregar(sid)
+            if dados is not None:
+                return SessaoServidor(dados, sid=sid)
+        return SessaoServidor(sid=self._novo_sid(), nova=True)
+
+    def save_session(self, app: Flask, sess: SessaoServidor, response) -> None:
+        nome = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not sess:
+            if sess.modified and not sess.new:
+                self.armazem.remover(sess.sid)
+                response.delete_cookie(nome, domain=domain, path=path)
+            return
+
+        if sess.regenerar and not sess.new:
+            self.armazem.remover(sess.sid)
+            sess.sid = self._novo_sid()
+
+        if not (sess.modified or sess.new or sess.regenerar):
+            return
+
+        expira_em = time.time() + app.permanent_session_lifetime.total_seconds()
+        self.armazem.salvar(sess.sid, dict(sess), expira_em)
+        response.set_cookie(
+            nome,
+            sess.sid,
+            expires=self.get_expiration_time(app, sess),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def configurar_sessoes(app: Flask) -> None:
+    """Instala o backend de sessão escolhido em SESSION_BACKEND."""
+    backend = os.getenv("SESSION_BACKEND", "sqlite").strip().lower()
+    if backend == "cookie":
+        return
+    armazem = BACKENDS[backend]()
+    app.session_interface = InterfaceSessaoServidor(armazem)
+    app.extensions["sessoes"] = armazem
+
+
+def _armazem(app: Flask) -> ArmazemSessoes | None:
+    return app.extensions.get("sessoes")
+
+
+def regenerar_sessao() -> None:
+    """Troca o id da sessão atual no próximo save (evita session fixation)."""
+    if isinstance(session._get_current_object(), SessaoServidor):
+        session.regenerar = True
+
+
+def revogar_sessoes_usuario(app: Flask, usuario_id: int) -> int:
+    """Derruba todas as sessões do usuário. Retorna quantas foram removidas."""
+    armazem = _armazem(app)
+    if armazem is None:
+        return 0
+    return armazem.revogar_usuario(int(usuario_id))
+
+
+def limpar_sessoes_expiradas(app: Flask) -> int:
+    """Remove sessões vencidas do armazenamento."""
+    armazem = _armazem(app)
+    if armazem is None:
+        return 0
+    return armazem.limpar_expiradas()
@@ -0,0 +1,201 @@
+"""Ferramentas do modo shard (um arquivo SQLite por usuário).
+
+- `flask shards dividir [--limpar]`: copia os dados de cada usuário do banco
+  principal para o seu shard (mesmos ids) e preenche o roteamento do
+  webhook; o rollup do financeiro é refeito no shard, arquivo incluso. Com
+  `--limpar`, apaga do banco principal as linhas dos usuários copiados (só
+  depois de todas as cópias) e faz VACUUM.
+- `consultar_tenants(sql)`: roda a mesma consulta em todos os tenants (em
+  paralelo, um shard por thread) para relatórios de administração.
+- /admin/tenants: totais por usuário.
+
+Ver `db.py` para a configuração (DB_SHARDS_DIR).
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import Blueprint, render_template
+
+from .db import (
+    caminho_db,
+    conectar,
+    get_catalogo,
+    listar_tenants,
+    recalcular_financeiro,
+    shards_ativos,
+)
+from .utils import admin_required
+
+bp = Blueprint("shards", __name__)
+
+# Tabelas com dados do tenant (coluna usuario_id), copiadas para o shard
+TABELAS_TENANT = (
+    "clientes", "produtos", "pedidos", "pedido_itens", "estoque",
+    "pedidos_arquivo", "pedido_itens_arquivo",
+)
+# Rollup do financeiro: refeito no shard a partir dos pedidos copiados
+TABELAS_ROLLUP = ("financeiro_diario", "financeiro_versao")
+
+SHARDS_PARALELISMO = int(os.getenv("SHARDS_PARALELISMO", "8"))
+
+
+def _colunas(con, esquema: str, tabela: str) -> list[str]:
+    return [r[1] for r in con.execute(f"PRAGMA {esquema}.table_info({tabela})")]
+
+
+def dividir(limpar: bool = False) -> dict[int, dict[str, int]]:
+    """Copia os dados de cada usuário para o seu shard.
+
+    Idempotente (INSERT OR IGNORE pelos ids). Retorna as linhas copiadas
+    por usuário e tabela.
+    """
+    if not shards_ativos():
+        raise RuntimeError("defina DB_SHARDS_DIR para usar shards")
+
+    catalogo = conectar()
+    copiados: dict[int, dict[str, int]] = {}
+    try:
+        tenants = [int(r["id"]) for r in catalogo.execute("SELECT id FROM usuarios")]
+        for uid in tenants:
+            shard = conectar(uid)
+            try:
+                shard.execute("ATTACH DATABASE ? AS origem", (caminho_db(),))
+                copiados[uid] = {}
+                for tabela in TABELAS_TENANT:
+                    destino = _colunas(shard, "main", tabela)
+                    cols = ", ".join(c for c in _colunas(shard, "origem", tabela) if c in destino)
+                    cur = shard.execute(
+                        f"INSERT OR IGNORE INTO main.{tabela} ({cols}) "
+                        f"SELECT {cols} FROM origem.{tabela} WHERE usuario_id = ?",
+                        (uid,),
+                    )
+                    copiados[uid][tabela] = cur.rowcount
+                # os triggers só somam os pedidos copiados para `pedidos`;
+                # o arquivo entra no rollup pelo recálculo
+                recalcular_financeiro(shard, uid)
+                shard.commit()
+                shard.execute("DETACH DATABASE origem")
+            finally:
+                shard.close()
+
+        # Roteamento do webhook: cobrança -> tenant
+        catalogo.execute(
+            """
+            INSERT OR REPLACE INTO pagamentos_tenant (asaas_payment_id, usuario_id)
+            SELECT asaas_payment_id, usuario_id FROM pedidos
+            WHERE asaas_payment_id IS NOT NULL AND usuario_id IS NOT NULL
+            """
+        )
+        catalogo.commit()
+
+        if limpar:
+            # só os usuários copiados: linhas sem usuário, ou de quem se
+            # cadastrou durante a divisão, ficam no principal
+            catalogo.execute("CREATE TEMP TABLE copiados (id INTEGER PRIMARY KEY)")
+            catalogo.executemany(
+                "INSERT INTO temp.copiados (id) VALUES (?)", [(uid,) for uid in tenants]
+            )
+            # itens antes dos pedidos; o rollup por último (os triggers de
+            # `pedidos` mexem nele)
+            for tabela in tuple(reversed(TABELAS_TENANT)) + TABELAS_ROLLUP:
+                catalogo.execute(
+                    f"DELETE FROM {tabela} WHERE usuario_id IN (SELECT id FROM temp.copiados)"
+                )
+            catalogo.commit()
+            catalogo.execute("VACUUM")
+    finally:
+        catalogo.close()
+    return copiados
+
+
+def consultar_tenants(sql: str, params: dict | None = None) -> dict[int, list]:
+    """Executa `sql` em cada tenant; o parâmetro `:uid` recebe o usuário.
+
+    Com shards, cada consulta vai para o arquivo do usuário (em paralelo);
+    sem shards, todas rodam no banco principal filtradas por `:uid`.
+    """
+    tenants = listar_tenants()
+
+    def consultar(uid: int) -> list:
+        con = conectar(uid, leitura=True)
+        try:
+            return con.execute(sql, {**(params or {}), "uid": uid}).fetchall()
+        finally:
+            con.close()
+
+    with ThreadPoolExecutor(max_workers=max(SHARDS_PARALELISMO, 1)) as pool:
+        return dict(zip(tenants, pool.map(consultar, tenants)))
+
+
+_SQL_RESUMO = """
+    SELECT
+        (SELECT COUNT(*) FROM clientes WHERE usuario_id = :uid) AS clientes,
+        (SELECT COUNT(*) FROM pedidos_todos WHERE usuario_id = :uid) AS pedidos,
+        (SELECT COUNT(*) FROM pedidos WHERE usuario_id = :uid AND pago = 0) AS abertos,
+        (SELECT COALESCE(SUM(valor_pago), 0) FROM pedidos_todos
+          WHERE usuario_id = :uid AND pago = 1) AS recebido
+"""
+
+
+def resumo_tenants() -> list[dict]:
+    """Totais por usuário (clientes, pedidos, em aberto, recebido)."""
+    nomes = {
+        int(r["id"]): r["username"]
+        for r in get_catalogo().execute("SELECT id, username FROM usuarios")
+    }
+    linhas = []
+    for uid, rows in consultar_tenants(_SQL_RESUMO).items():
+        r = rows[0]
+        linhas.append(
+            {
+                "usuario_id": uid,
+                "username": nomes.get(uid, "?"),
+                "clientes": int(r["clientes"]),
+                "pedidos": int(r["pedidos"]),
+                "abertos": int(r["abertos"]),
+                "recebido": float(r["recebido"] or 0),
+            }
+        )
+    return linhas
+
+
+@bp.route("/admin/tenants")
+@admin_required
+def tenants():
+    """Relatório de administração com todos os usuários."""
+    linhas = resumo_tenants()
+    totais = {
+        chave: sum(l[chave] for l in linhas)
+        for chave in ("clientes", "pedidos", "abertos", "recebido")
+    }
+    return render_template(
+        "admin_tenants.html", linhas=linhas, totais=totais, shards=shards_ativos()
+    )
+
+
+@bp.cli.command("dividir")
+@click.option("--limpar", is_flag=True, help="apaga do banco principal o que foi copiado")
+def dividir_cli(limpar: bool) -> None:
+    """Divide o banco principal em um shard por usuário."""
+    try:
+        copiados = dividir(limpar=limpar)
+    except RuntimeError as exc:
+        raise click.ClickException(str(exc)) from exc
+    for uid, tabelas in copiados.items():
+        resumo = ", ".join(f"{t}={n}" for t, n in tabelas.items())
+        click.echo(f"usuario {uid}: {resumo}")
+
+
+@bp.cli.command("relatorio")
+def relatorio_cli() -> None:
+    """Imprime os totais por usuário (todos os shards)."""
+    for l in resumo_tenants():
+        click.echo(
+            f"{l['usuario_id']:>5} {l['username']:<20} clientes={l['clientes']} "
+            f"pedidos={l['pedidos']} abertos={l['abertos']} recebido={l['recebido']:.2f}"
+        )
+
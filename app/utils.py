@@ -2,10 +2,15 @@
 
 from __future__ import annotations
 
+import os
+from dataclasses import dataclass
 from datetime import date, timedelta
 from functools import wraps
 
-from flask import flash, redirect, session, url_for
+from flask import abort, flash, g, redirect, request, session, url_for
+
+from .db import listar_tenants, shards_ativos, usar_tenant
+from .repositorio import repo
 
 
 def apenas_numeros(texto: str) -> str:
@@ -13,12 +18,33 @@ def apenas_numeros(texto: str) -> str:
     return "".join(ch for ch in (texto or "") if ch.isdigit())
 
 
+@dataclass(frozen=True)
+class ContextoUsuario:
+    """Dados do usuário logado, carregados uma vez por request."""
+
+    id: int
+    username: str
+
+
+def usuario_atual() -> ContextoUsuario | None:
+    """Retorna o contexto do usuário logado (cacheado em `g`)."""
+    if "usuario" not in g:
+        g.usuario = None
+        user_id = session.get("user_id")
+        if user_id is not None:
+            row = repo().usuarios.por_id(int(user_id))
+            if row:
+                g.usuario = ContextoUsuario(int(row["id"]), row["username"])
+    return g.usuario
+
+
 def login_required(func):
     """Decorator: exige usuário logado."""
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        if "user_id" not in session:
+        if usuario_atual() is None:
+            session.clear()
             flash("Faça login para acessar o sistema.", "warning")
             return redirect(url_for("auth.login"))
         return func(*args, **kwargs)
@@ -26,9 +52,40 @@ def login_required(func):
     return wrapper
 
 
+def _admins() -> set[str]:
+    """Usernames com acesso às páginas /admin (ADMIN_USUARIOS=ana,joao)."""
+    return {
+        u.strip() for u in os.getenv("ADMIN_USUARIOS", "").split(",") if u.strip()
+    }
+
+
+def admin_required(func):
+    """Decorator: exige usuário logado e listado em ADMIN_USUARIOS."""
+
+    @wraps(func)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if usuario_atual().username not in _admins():
+            flash("Acesso restrito ao administrador.", "warning")
+            return redirect("/")
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def por_tenant(func) -> dict:
+    """Roda `func()` no banco de cada tenant (ou uma vez, sem shards)."""
+    resultados = {}
+    for uid in listar_tenants() if shards_ativos() else [None]:
+        if uid is not None:
+            usar_tenant(uid)
+        resultados[uid] = func()
+    return resultados
+
+
 def current_user_id() -> int:
     """Retorna o id do usuário logado."""
-    return int(session["user_id"])
+    return usuario_atual().id
 
 
 def primeiro_dia_util(ano: int, mes: int) -> date:
@@ -48,3 +105,61 @@ def vencimento_do_pedido(data_pedido: date) -> date:
         return primeiro_dia_util(ano + 1, 1)
 
     return primeiro_dia_util(ano, mes + 1)
+
+
+def data_param(nome: str) -> str | None:
+    """Lê uma data YYYY-MM-DD da query string (ou None; 400 se inválida)."""
+    valor = (request.args.get(nome) or "").strip()
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor).isoformat()
+    except ValueError:
+        abort(400)
+
+
+# Juros simples do fiado (cobranças, exportação e lembretes do WhatsApp)
+TAXA_JUROS_DIA = 0.03  # 3% ao dia
+
+
+def dias_de_atraso(hoje: date, vencimento: date) -> int:
+    """Retorna dias de atraso (nunca negativo)."""
+    return max((hoje - vencimento).days, 0)
+
+
+def calcular_juros(principal: float, dias_atraso: int) -> float:
+    """Calcula juros simples por dia de atraso."""
+    if dias_atraso <= 0:
+        return 0.0
+    return float(principal) * float(TAXA_JUROS_DIA) * int(dias_atraso)
+
+
+def vencimento_efetivo(data_pedido_iso: str, vencimento_iso: str | None) -> date:
+    """Resolve vencimento: usa campo vencimento se existir, senão calcula pelo padrão do sistema."""
+    if vencimento_iso:
+        return date.fromisoformat(vencimento_iso)
+    return vencimento_do_pedido(date.fromisoformat(data_pedido_iso))
+
+
+# Linhas de produto no carrinho (loja e novo pedido)
+PEDIDO_MAX_ITENS = int(os.getenv("PEDIDO_MAX_ITENS", "10"))
+
+
+def itens_do_formulario(form) -> list[tuple[int, int]]:
+    """[(produto_id, quantidade)] do carrinho.
+
+    O formulário repete os campos `produto_id` e `quantidade`, uma dupla por
+    linha; linhas sem produto são ignoradas e o mesmo produto em duas linhas
+    soma as quantidades. ValueError se alguma quantidade for inválida.
+    """
+    itens: dict[int, int] = {}
+    for produto, quantidade in zip(form.getlist("produto_id"), form.getlist("quantidade")):
+        if not (produto or "").strip():
+            continue
+        produto_id, qtd = int(produto), int(quantidade)
+        if qtd < 1:
+            raise ValueError("quantidade inválida")
+        itens[produto_id] = itens.get(produto_id, 0) + qtd
+    if len(itens) > PEDIDO_MAX_ITENS:
+        raise ValueError("itens demais")
+    return list(itens.items())
@@ -17,7 +17,8 @@ import os
 import re
 from typing import Optional
 
-import requests
+from . import http_async
+from .metricas import medir_provedor, provedor_erros
 
 
 def normalizar_telefone_br(telefone: str) -> Optional[str]:
@@ -37,7 +38,7 @@ def normalizar_telefone_br(telefone: str) -> Optional[str]:
     return "55" + digits
 
 
-def enviar_whatsapp_twilio(telefone_e164_sem_sinal: str, mensagem: str) -> bool:
+async def enviar_whatsapp_twilio_async(telefone_e164_sem_sinal: str, mensagem: str) -> bool:
     """Envia mensagem WhatsApp pelo Twilio. Retorna True/False."""
     account_sid = os.getenv("TWILIO_ACCOUNT_SID", "").strip()
     auth_token = os.getenv("TWILIO_AUTH_TOKEN", "").strip()
@@ -55,13 +56,27 @@ def enviar_whatsapp_twilio(telefone_e164_sem_sinal: str, mensagem: str) -> bool:
         "Body": mensagem,
     }
 
-    resp = requests.post(url, data=data, auth=(account_sid, auth_token), timeout=30)
-    return 200 <= resp.status_code < 300
+    with medir_provedor("twilio", "enviar_whatsapp"):
+        resp = await http_async.cliente().post(url, data=data, auth=(account_sid, auth_token))
+    ok = 200 <= resp.status_code < 300
+    if not ok:
+        provedor_erros.inc(provedor="twilio", operacao="enviar_whatsapp")
+    return ok
 
 
-def enviar_whatsapp(telefone: str, mensagem: str) -> bool:
+async def enviar_whatsapp_async(telefone: str, mensagem: str) -> bool:
     """Ponto único de envio (por enquanto Twilio)."""
     tel = normalizar_telefone_br(telefone)
     if not tel:
         return False
-    return enviar_whatsapp_twilio(tel, mensagem)
+    return await enviar_whatsapp_twilio_async(tel, mensagem)
+
+
+def enviar_whatsapp_twilio(telefone_e164_sem_sinal: str, mensagem: str) -> bool:
+    """Versão síncrona de `enviar_whatsapp_twilio_async`."""
+    return http_async.executar(enviar_whatsapp_twilio_async(telefone_e164_sem_sinal, mensagem))
+
+
+def enviar_whatsapp(telefone: str, mensagem: str) -> bool:
+    """Versão síncrona de `enviar_whatsapp_async`."""
+    return http_async.executar(enviar_whatsapp_async(telefone, mensagem))
@@ -0,0 +1,4 @@
+"""Benchmark do sistema de vendas (dados sintéticos + rotas quentes).
+
+Rode com `python -m bench --help`.
+"""
@@ -0,0 +1,158 @@
+"""Benchmark do sistema: gera um tenant sintético e mede as rotas quentes.
+
+Uso:
+    python -m bench                          # tamanho padrão, JSON no stdout
+    python -m bench --pedidos 50000 --saida bench.json
+    python -m bench --comparar bench_antes.json --saida bench_depois.json
+
+O banco é um arquivo temporário (DATABASE_PATH), nunca o database.db real.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _comparar(anterior: dict, atual: dict) -> None:
+    """Imprime no stderr a variação de p95 e queries por rota."""
+    print(f"{'rota':34} {'p95 antes':>10} {'p95 agora':>10} {'Δ%':>7} {'queries':>12}", file=sys.stderr)
+    for nome, agora in atual["rotas"].items():
+        antes = anterior.get("rotas", {}).get(nome)
+        if not antes:
+            continue
+        delta = (
+            (agora["p95_ms"] - antes["p95_ms"]) / antes["p95_ms"] * 100
+            if antes["p95_ms"] else 0.0
+        )
+        queries = f"{antes['queries_por_request']}→{agora['queries_por_request']}"
+        print(
+            f"{nome:34} {antes['p95_ms']:>10.2f} {agora['p95_ms']:>10.2f} {delta:>+7.1f} {queries:>12}",
+            file=sys.stderr,
+        )
+
+
+def _comparar_startup(anterior: dict, atual: dict) -> None:
+    antes = (anterior.get("startup") or {}).get("quente_p50")
+    agora = (atual.get("startup") or {}).get("quente_p50")
+    if not antes or not agora:
+        return
+    print(
+        f"{'create_app() quente':34} {antes['create_app_ms']:>10.2f} {agora['create_app_ms']:>10.2f}"
+        f" {'':>7} {str(antes['modulos']) + '→' + str(agora['modulos']):>12}",
+        file=sys.stderr,
+    )
+    if agora.get("pesados"):
+        print(f"  importados no boot: {', '.join(agora['pesados'])}", file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=3)
+    parser.add_argument("--clientes", type=int, default=500)
+    parser.add_argument("--produtos", type=int, default=100)
+    parser.add_argument("--pedidos", type=int, default=5000, help="pedidos por usuário")
+    parser.add_argument("--iteracoes", type=int, default=50)
+    parser.add_argument("--aquecimento", type=int, default=3)
+    parser.add_argument("--latencia-provedor", type=float, default=0.0, help="ms simulados por chamada Asaas/Twilio")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--boots", type=int, default=5, help="execuções do benchmark de startup (0 desliga)")
+    parser.add_argument("--saida", help="arquivo JSON de saída (default: stdout)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="bench-vendas-")
+    os.environ["DATABASE_PATH"] = os.path.join(scratch, "bench.db")
+    os.environ["WHATSAPP_AUTOMATICO"] = "0"
+    os.environ["ASAAS_API_KEY"] = "bench"  # exercita o caminho PIX (stubado)
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+    from app import create_app
+    from app.db import get_db
+
+    from .dados import Tamanho, gerar
+    from .startup import medir_startup
+    from .rotas import (
+        ContadorQueries,
+        instalar_contador,
+        medir_fila,
+        medir_job_cobrancas,
+        medir_rotas,
+        pico_rss_kb,
+        stubar_provedores,
+    )
+
+    contador = ContadorQueries()
+    instalar_contador(contador)
+    chamadas = stubar_provedores(args.latencia_provedor)
+
+    app = create_app()
+    tamanho = Tamanho(
+        usuarios=args.usuarios,
+        clientes=args.clientes,
+        produtos=args.produtos,
+        pedidos=args.pedidos,
+    )
+    inicio = time.perf_counter()
+    with app.app_context():
+        gerar(get_db(), tamanho, seed=args.seed)
+    tempo_geracao = time.perf_counter() - inicio
+
+    rotas = medir_rotas(app, contador, args.iteracoes, args.aquecimento)
+    rotas["scheduler._job_enviar_cobrancas"] = medir_job_cobrancas(
+        app, contador, max(args.iteracoes // 10, 1)
+    )
+    fila = medir_fila(app)
+
+    startup = (
+        medir_startup(args.boots, os.path.join(scratch, "boot.db")) if args.boots else None
+    )
+
+    resultado = {
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "tamanho": vars(tamanho),
+        "iteracoes": args.iteracoes,
+        "geracao_s": round(tempo_geracao, 3),
+        "db_bytes": os.path.getsize(os.environ["DATABASE_PATH"]),
+        "chamadas_provedor": chamadas,
+        "pico_rss_kb": pico_rss_kb(),
+        "startup": startup,
+        "rotas": rotas,
+        "fila": fila,
+    }
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            anterior = json.load(fh)
+        _comparar(anterior, resultado)
+        _comparar_startup(anterior, resultado)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
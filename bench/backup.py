@@ -0,0 +1,143 @@
+"""Mede o backup online (app/backup.py) de um banco grande com escrita ativa.
+
+Gera um tenant pequeno, engorda o banco até `--gb` GB com cópias dos
+pedidos (pix_qr_code aleatório, como os payloads PIX reais) e roda
+`backup.criar` enquanto uma thread grava um pedido a cada `--intervalo-ms`,
+medindo a latência de cada commit. Por fim restaura o snapshot num arquivo
+novo e confere o integrity_check.
+
+Uso:
+    python -m bench.backup --gb 2
+    python -m bench.backup --gb 0.2 --paginas 256 --pausa 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from .rotas import percentil
+
+_LOTE = 2000
+_QR_BYTES = 2048
+
+
+def _engordar(con: sqlite3.Connection, alvo: int) -> None:
+    """Duplica pedidos (sem id) até o arquivo passar de `alvo` bytes."""
+    cols = [r[1] for r in con.execute("PRAGMA table_info(pedidos)") if r[1] not in ("id", "pix_qr_code")]
+    lista = ", ".join(cols)
+    while os.path.getsize(con.execute("PRAGMA database_list").fetchone()[2]) < alvo:
+        con.execute(
+            f"INSERT INTO pedidos ({lista}, pix_qr_code) "
+            f"SELECT {lista}, hex(randomblob({_QR_BYTES})) FROM pedidos "
+            f"ORDER BY random() LIMIT {_LOTE}"
+        )
+        con.commit()
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _escritor(caminho: str, intervalo: float, parar: threading.Event, latencias: list[float]) -> None:
+    con = sqlite3.connect(caminho, timeout=30)
+    try:
+        modelo = con.execute(
+            "SELECT usuario_id, cliente_id, produto_id, data, valor_principal FROM pedidos LIMIT 1"
+        ).fetchone()
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            con.execute(
+                "INSERT INTO pedidos (usuario_id, cliente_id, produto_id, quantidade, data, pago, valor_principal) "
+                "VALUES (?, ?, ?, 1, ?, 0, ?)",
+                (modelo[0], modelo[1], modelo[2], modelo[3], modelo[4]),
+            )
+            con.commit()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            parar.wait(intervalo)
+    finally:
+        con.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.backup", description=__doc__.splitlines()[0])
+    parser.add_argument("--gb", type=float, default=1.0, help="tamanho do banco a copiar")
+    parser.add_argument("--paginas", type=int, help="BACKUP_PAGINAS (default: o do app)")
+    parser.add_argument("--pausa", type=float, help="BACKUP_PAUSA em segundos (default: o do app)")
+    parser.add_argument("--intervalo-ms", type=float, default=10.0, help="intervalo entre escritas")
+    parser.add_argument("--manter", action="store_true", help="não apaga a pasta temporária")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="bench-backup-")
+    os.environ["DATABASE_PATH"] = os.path.join(scratch, "bench.db")
+    os.environ["BACKUP_DIR"] = os.path.join(scratch, "backups")
+    os.environ["WHATSAPP_AUTOMATICO"] = "0"
+    if args.paginas is not None:
+        os.environ["BACKUP_PAGINAS"] = str(args.paginas)
+    if args.pausa is not None:
+        os.environ["BACKUP_PAUSA"] = str(args.pausa)
+
+    from app import backup, create_app
+    from app.db import get_db
+
+    from .dados import Tamanho, gerar
+
+    try:
+        app = create_app()
+        with app.app_context():
+            gerar(get_db(), Tamanho(clientes=100, produtos=20, pedidos=2000))
+        con = sqlite3.connect(os.environ["DATABASE_PATH"])
+        inicio = time.perf_counter()
+        _engordar(con, int(args.gb * 1024**3))
+        con.close()
+        geracao = time.perf_counter() - inicio
+
+        latencias: list[float] = []
+        parar = threading.Event()
+        escritor = threading.Thread(
+            target=_escritor,
+            args=(os.environ["DATABASE_PATH"], args.intervalo_ms / 1000, parar, latencias),
+        )
+        escritor.start()
+        try:
+            r = backup.criar("principal", os.environ["DATABASE_PATH"])
+        finally:
+            parar.set()
+            escritor.join()
+
+        inicio = time.perf_counter()
+        restaurado = os.path.join(scratch, "restaurado.db")
+        backup.restaurar(r["arquivo"], restaurado)
+        tempo_restauro = time.perf_counter() - inicio
+        ok = sqlite3.connect(restaurado).execute("PRAGMA quick_check").fetchone()[0]
+
+        resultado = {
+            "geracao_s": round(geracao, 1),
+            "paginas_por_passo": backup.BACKUP_PAGINAS,
+            "pausa_s": backup.BACKUP_PAUSA,
+            "db_bytes": r["bytes_banco"],
+            "gz_bytes": r["bytes"],
+            "razao": round(r["bytes"] / r["bytes_banco"], 3),
+            "backup_s": r["segundos"],
+            "mb_s": round(r["bytes_banco"] / 1e6 / r["segundos"], 1),
+            "reinicios": r["reinicios"],
+            "escritas": len(latencias),
+            "escrita_p50_ms": round(percentil(latencias, 50), 2),
+            "escrita_p99_ms": round(percentil(latencias, 99), 2),
+            "escrita_max_ms": round(max(latencias, default=0.0), 2),
+            "restauro_s": round(tempo_restauro, 1),
+            "restaurado": ok,
+        }
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    finally:
+        if not args.manter:
+            shutil.rmtree(scratch, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Teste de carga: sobe o gunicorn em cada perfil e mede throughput.
+
+Para cada perfil (sync, gthread, gevent) o gunicorn é iniciado com
+`gunicorn.conf.py` servindo `bench.servidor:app` (Asaas/Twilio stubados com
+latência simulada) e N clientes concorrentes disparam, por D segundos, a
+mistura das rotas públicas: GET /loja, POST /loja (3 chamadas ao provedor)
+e o webhook do Asaas.
+
+Uso:
+    python -m bench.carga --concorrencia 32 --duracao 10 --latencia-provedor 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from .rotas import percentil
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERFIS = ("sync", "gthread", "gevent")
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _preparar_banco(caminho: str, pedidos: int) -> tuple[int, list[str]]:
+    """Gera um tenant e devolve (produto_id, payment_ids em aberto)."""
+    os.environ["DATABASE_PATH"] = caminho
+    from app import create_app
+    from app.db import get_db
+
+    from .dados import Tamanho, gerar
+
+    app = create_app()
+    with app.app_context():
+        con = get_db()
+        gerar(con, Tamanho(usuarios=1, pedidos=pedidos))
+        produto_id = con.execute("SELECT MIN(id) FROM produtos").fetchone()[0]
+        pagamentos = [
+            r[0]
+            for r in con.execute(
+                "SELECT asaas_payment_id FROM pedidos "
+                "WHERE pago = 0 AND asaas_payment_id IS NOT NULL"
+            )
+        ]
+    return int(produto_id), pagamentos
+
+
+def _esperar(porta: int, processo: subprocess.Popen, limite: float = 30.0) -> None:
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("gunicorn terminou antes de subir")
+        try:
+            con = http.client.HTTPConnection("127.0.0.1", porta, timeout=2)
+            con.request("GET", "/loja")
+            con.getresponse().read()
+            con.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn não respondeu a tempo")
+
+
+def _cliente(porta, fim, produto_id, pagamentos, n, latencias, erros, lock):
+    """Uma conexão keep-alive disparando a mistura de rotas até `fim`."""
+    con = http.client.HTTPConnection("127.0.0.1", porta, timeout=120)
+    i = 0
+    while time.monotonic() < fim:
+        i += 1
+        tipo = i % 4
+        if tipo == 0:
+            corpo = urlencode(
+                {"nome": f"Carga {n}-{i}", "telefone": f"11{n:03d}{i:06d}",
+                 "produto_id": produto_id, "quantidade": 1}
+            )
+            args = ("POST", "/loja", corpo, {"Content-Type": "application/x-www-form-urlencoded"})
+        elif tipo == 1 and pagamentos:
+            corpo = json.dumps(
+                {"event": "PAYMENT_RECEIVED",
+                 "payment": {"id": pagamentos[(n * 7919 + i) % len(pagamentos)], "value": 10.0}}
+            )
+            args = ("POST", "/webhook/asaas", corpo, {"Content-Type": "application/json"})
+        else:
+            args = ("GET", "/loja", None, {})
+
+        inicio = time.perf_counter()
+        try:
+            con.request(*args)
+            resp = con.getresponse()
+            resp.read()
+            ok = resp.status < 400
+        except (OSError, http.client.HTTPException):
+            ok = False
+            con.close()
+            con = http.client.HTTPConnection("127.0.0.1", porta, timeout=120)
+        duracao = time.perf_counter() - inicio
+        with lock:
+            latencias.append(duracao)
+            if not ok:
+                erros[0] += 1
+    con.close()
+
+
+def medir_perfil(perfil: str, caminho_db: str, produto_id: int, pagamentos: list[str], args) -> dict:
+    """Sobe o gunicorn no perfil e aplica a carga."""
+    if perfil == "gevent" and importlib.util.find_spec("gevent") is None:
+        return {"indisponivel": "gevent não instalado"}
+
+    porta = _porta_livre()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=caminho_db,
+        GUNICORN_PERFIL=perfil,
+        GUNICORN_BIND=f"127.0.0.1:{porta}",
+        BENCH_LATENCIA_PROVEDOR_MS=str(args.latencia_provedor),
+        ASAAS_API_KEY="bench",
+        WHATSAPP_AUTOMATICO="0",
+        PYTHONPATH=RAIZ,
+    )
+    if args.workers:
+        env["GUNICORN_WORKERS"] = str(args.workers)
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "bench.servidor:app"],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _esperar(porta, processo)
+        latencias: list[float] = []
+        erros = [0]
+        lock = threading.Lock()
+        fim = time.monotonic() + args.duracao
+        threads = [
+            threading.Thread(
+                target=_cliente,
+                args=(porta, fim, produto_id, pagamentos, n, latencias, erros, lock),
+            )
+            for n in range(args.concorrencia)
+        ]
+        inicio = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        total = time.perf_counter() - inicio
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+    return {
+        "requests": len(latencias),
+        "erros": erros[0],
+        "req_s": round(len(latencias) / total, 1) if total else 0.0,
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.carga", description=__doc__.splitlines()[0])
+    parser.add_argument("--perfis", default=",".join(PERFIS))
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--duracao", type=float, default=10.0, help="segundos por perfil")
+    parser.add_argument("--latencia-provedor", type=float, default=50.0, help="ms por chamada Asaas")
+    parser.add_argument("--workers", type=int, default=0, help="fixa GUNICORN_WORKERS (0 = derivado da CPU)")
+    parser.add_argument("--pedidos", type=int, default=2000)
+    parser.add_argument("--saida", help="arquivo JSON de saída (default: stdout)")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    os.environ["WHATSAPP_AUTOMATICO"] = "0"
+    caminho_db = os.path.join(tempfile.mkdtemp(prefix="bench-carga-"), "carga.db")
+    produto_id, pagamentos = _preparar_banco(caminho_db, args.pedidos)
+
+    resultado = {
+        "cpus": os.cpu_count(),
+        "concorrencia": args.concorrencia,
+        "duracao_s": args.duracao,
+        "latencia_provedor_ms": args.latencia_provedor,
+        "perfis": {},
+    }
+    for perfil in [p.strip() for p in args.perfis.split(",") if p.strip()]:
+        resultado["perfis"][perfil] = medir_perfil(perfil, caminho_db, produto_id, pagamentos, args)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
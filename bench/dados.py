@@ -0,0 +1,149 @@
+"""Gerador de dados sintéticos (tenants realistas) para o benchmark."""
+
+from __future__ import annotations
+
+import random
+import sqlite3
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import bcrypt
+
+from app.utils import vencimento_do_pedido
+
+NOMES = [
+    "Ana", "João", "Maria", "José", "Antônio", "Francisca", "Carlos", "Paulo",
+    "Lúcia", "Pedro", "Luiz", "Márcia", "Sebastião", "Conceição", "Raimundo",
+]
+SOBRENOMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Ferreira",
+    "Costa", "Rodrigues", "Almeida", "Nascimento", "Araújo", "Gonçalves",
+]
+PRODUTOS = [
+    "Pão francês", "Leite integral", "Café 500g", "Arroz 5kg", "Feijão 1kg",
+    "Açúcar 1kg", "Refrigerante 2L", "Cerveja lata", "Óleo de soja",
+    "Macarrão", "Biscoito", "Sabão em pó", "Detergente", "Papel higiênico",
+]
+
+SENHA_PADRAO = "bench123"
+
+
+@dataclass
+class Tamanho:
+    """Quantidades geradas por tenant."""
+
+    usuarios: int = 1
+    clientes: int = 200
+    produtos: int = 50
+    pedidos: int = 2000
+    fracao_paga: float = 0.6
+    fracao_pix: float = 0.3
+    dias_historico: int = 365
+
+
+def gerar(con: sqlite3.Connection, tamanho: Tamanho, seed: int = 42) -> list[str]:
+    """Popula o banco e retorna os usernames criados.
+
+    Pedidos pagos e em aberto são misturados; parte dos em aberto já venceu
+    (gera juros) e parte tem cobrança PIX (asaas_payment_id) para o webhook.
+    """
+    rnd = random.Random(seed)
+    hoje = date.today()
+    # custo mínimo: o benchmark mede rotas, não o bcrypt
+    senha_hash = bcrypt.hashpw(SENHA_PADRAO.encode("utf-8"), bcrypt.gensalt(rounds=4))
+
+    usernames: list[str] = []
+    for n in range(tamanho.usuarios):
+        username = f"bench{n + 1}"
+        cur = con.execute(
+            "INSERT INTO usuarios (username, senha_hash) VALUES (?, ?)",
+            (username, senha_hash),
+        )
+        uid = cur.lastrowid
+        usernames.append(username)
+
+        con.executemany(
+            "INSERT INTO clientes (usuario_id, nome, telefone) VALUES (?, ?, ?)",
+            [
+                (
+                    uid,
+                    f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)} {i}",
+                    f"11{rnd.randint(900000000, 999999999)}",
+                )
+                for i in range(tamanho.clientes)
+            ],
+        )
+        cliente_ids = [
+            r[0] for r in con.execute("SELECT id FROM clientes WHERE usuario_id = ?", (uid,))
+        ]
+
+        con.executemany(
+            "INSERT INTO produtos (usuario_id, nome, preco) VALUES (?, ?, ?)",
+            [
+                (uid, f"{rnd.choice(PRODUTOS)} #{i}", round(rnd.uniform(2, 80), 2))
+                for i in range(tamanho.produtos)
+            ],
+        )
+        precos = dict(
+            con.execute("SELECT id, preco FROM produtos WHERE usuario_id = ?", (uid,)).fetchall()
+        )
+        produto_ids = list(precos)
+        con.executemany(
+            "INSERT OR IGNORE INTO estoque (usuario_id, produto_id, quantidade, minimo) "
+            "VALUES (?, ?, ?, ?)",
+            [(uid, pid, rnd.randint(0, 40), rnd.randint(0, 10)) for pid in produto_ids],
+        )
+
+        pedidos, carrinhos = [], []
+        for i in range(tamanho.pedidos):
+            data = hoje - timedelta(days=rnd.randint(0, tamanho.dias_historico))
+            venc = vencimento_do_pedido(data)
+            pago = rnd.random() < tamanho.fracao_paga
+            data_pag = valor_pago = None
+            if pago:
+                data_pag = min(venc + timedelta(days=rnd.randint(-20, 10)), hoje)
+                data_pag = max(data_pag, data).isoformat() + "T10:00:00"
+                valor_pago = round(rnd.uniform(5, 300), 2)
+            pix = None
+            if not pago and rnd.random() < tamanho.fracao_pix:
+                pix = f"pay_bench_{uid}_{i}"
+            itens = [
+                (pid, rnd.randint(1, 5))
+                for pid in rnd.sample(produto_ids, min(rnd.randint(1, 3), len(produto_ids)))
+            ]
+            carrinhos.append(itens)
+            pedidos.append(
+                (
+                    uid,
+                    rnd.choice(cliente_ids),
+                    round(sum(precos[pid] * qtd for pid, qtd in itens), 2),
+                    data.isoformat(),
+                    venc.isoformat(),
+                    "09:00",
+                    int(pago),
+                    data_pag,
+                    valor_pago,
+                    pix,
+                )
+            )
+        # um pedido (carrinho) com 1 a 3 itens
+        for pedido, itens in zip(pedidos, carrinhos):
+            pedido_id = con.execute(
+                """
+                INSERT INTO pedidos (
+                    usuario_id, cliente_id, valor_principal, data,
+                    vencimento, hora_vencimento, pago, data_pagamento,
+                    valor_pago, asaas_payment_id
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                pedido,
+            ).lastrowid
+            con.executemany(
+                "INSERT INTO pedido_itens (pedido_id, usuario_id, produto_id, quantidade) "
+                "VALUES (?, ?, ?, ?)",
+                [(pedido_id, uid, pid, qtd) for pid, qtd in itens],
+            )
+
+    con.commit()
+    return usernames
@@ -0,0 +1,227 @@
+"""Executa as rotas quentes pelo test client e mede latência e queries."""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import resource
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from flask import Flask
+
+import app.db as db_mod
+import app.fila as fila_mod
+import app.publico as publico_mod
+import app.scheduler as scheduler_mod
+import app.sessoes as sessoes_mod
+
+from .dados import SENHA_PADRAO
+
+
+class ContadorQueries:
+    """Trace callback do sqlite3 que conta statements executados."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, sql: str) -> None:
+        # linhas "-- TRIGGER x" são o SQLite avisando de triggers
+        if not sql.startswith("--"):
+            self.total += 1
+
+
+def instalar_contador(contador: ContadorQueries) -> None:
+    """Faz toda conexão nova do app reportar ao contador."""
+    original = db_mod.conectar
+
+    def conectar_contando(*args, **kwargs):
+        con = original(*args, **kwargs)
+        con.set_trace_callback(contador)
+        return con
+
+    db_mod.conectar = conectar_contando
+    sessoes_mod.conectar = conectar_contando
+
+
+def stubar_provedores(latencia_ms: float = 0.0) -> dict:
+    """Troca Asaas/Twilio por stubs (com latência simulada opcional)."""
+    chamadas = {"asaas": 0, "whatsapp": 0}
+
+    def espera():
+        if latencia_ms:
+            time.sleep(latencia_ms / 1000)
+
+    def create_or_get_customer(nome, telefone, external_reference=None):
+        chamadas["asaas"] += 1
+        espera()
+        return f"cus_{external_reference}"
+
+    def create_pix_payment(customer_id, value, due_date_iso, description, external_reference=None):
+        chamadas["asaas"] += 1
+        espera()
+        return {"id": f"pay_loja_{external_reference}", "invoiceUrl": "https://example.invalid/i"}
+
+    def get_pix_qrcode(payment_id):
+        chamadas["asaas"] += 1
+        espera()
+        return {"payload": "00020126BENCH", "encodedImage": ""}
+
+    async def enviar_whatsapp_async(telefone, mensagem):
+        chamadas["whatsapp"] += 1
+        if latencia_ms:
+            await asyncio.sleep(latencia_ms / 1000)
+        return True
+
+    publico_mod.create_or_get_customer = create_or_get_customer
+    publico_mod.create_pix_payment = create_pix_payment
+    publico_mod.get_pix_qrcode = get_pix_qrcode
+    scheduler_mod.enviar_whatsapp_async = enviar_whatsapp_async
+    return chamadas
+
+
+def percentil(valores: list[float], p: float) -> float:
+    """Percentil nearest-rank."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[max(math.ceil(p / 100 * len(ordenados)) - 1, 0)]
+
+
+@dataclass
+class Medicao:
+    """Amostras de uma rota."""
+
+    latencias: list[float] = field(default_factory=list)
+    queries: list[int] = field(default_factory=list)
+    erros: int = 0
+
+    def resumo(self) -> dict:
+        n = len(self.latencias)
+        return {
+            "n": n,
+            "erros": self.erros,
+            "p50_ms": round(percentil(self.latencias, 50) * 1000, 3),
+            "p95_ms": round(percentil(self.latencias, 95) * 1000, 3),
+            "p99_ms": round(percentil(self.latencias, 99) * 1000, 3),
+            "queries_por_request": round(sum(self.queries) / n, 2) if n else 0,
+        }
+
+
+def _login(client, username: str) -> None:
+    resp = client.post("/login", data={"username": username, "senha": SENHA_PADRAO})
+    if resp.status_code != 302 or resp.location.endswith("/login"):
+        raise RuntimeError(f"login falhou para {username}")
+
+
+def cenarios(app: Flask) -> dict[str, Callable]:
+    """Monta as funções (client, i) -> status de cada rota medida."""
+    with app.app_context():
+        con = db_mod.get_db()
+        produto_id = con.execute(
+            "SELECT id FROM produtos WHERE usuario_id = 1 ORDER BY id LIMIT 1"
+        ).fetchone()[0]
+        pagamentos = [
+            r[0]
+            for r in con.execute(
+                "SELECT asaas_payment_id FROM pedidos "
+                "WHERE pago = 0 AND asaas_payment_id IS NOT NULL ORDER BY id"
+            )
+        ]
+
+    def get(caminho):
+        return lambda client, i: client.get(caminho).status_code
+
+    def loja_post(client, i):
+        return client.post(
+            "/loja",
+            data={
+                "nome": f"Cliente Loja {i}",
+                "telefone": f"1199{i:07d}",
+                "produto_id": str(produto_id),
+                "quantidade": "2",
+            },
+        ).status_code
+
+    def webhook(client, i):
+        pay_id = pagamentos[i % len(pagamentos)] if pagamentos else "inexistente"
+        return client.post(
+            "/webhook/asaas",
+            json={
+                "event": "PAYMENT_RECEIVED",
+                "payment": {"id": pay_id, "value": 10.0, "paymentDate": "2026-01-01"},
+            },
+        ).status_code
+
+    return {
+        "dashboard.home": get("/"),
+        "pedidos.listar_pedidos": get("/listar_pedidos"),
+        "cobrancas.cobrancas": get("/cobrancas"),
+        "financeiro.financeiro": get("/financeiro"),
+        "estoque.estoque": get("/estoque"),
+        "publico.loja GET": get("/loja"),
+        "publico.loja POST": loja_post,
+        "asaas_webhook.webhook_asaas": webhook,
+    }
+
+
+def medir_rotas(
+    app: Flask, contador: ContadorQueries, iteracoes: int, aquecimento: int
+) -> dict[str, dict]:
+    """Executa cada cenário `iteracoes` vezes (após aquecimento)."""
+    client = app.test_client()
+    _login(client, "bench1")
+    publico = app.test_client()
+
+    resultados: dict[str, dict] = {}
+    for nome, cenario in cenarios(app).items():
+        c = publico if nome.startswith(("publico", "asaas")) else client
+        med = Medicao()
+        for i in range(aquecimento + iteracoes):
+            antes = contador.total
+            inicio = time.perf_counter()
+            status = cenario(c, i)
+            duracao = time.perf_counter() - inicio
+            if i < aquecimento:
+                continue
+            med.latencias.append(duracao)
+            med.queries.append(contador.total - antes)
+            if status >= 400:
+                med.erros += 1
+        resultados[nome] = med.resumo()
+    return resultados
+
+
+def medir_job_cobrancas(app: Flask, contador: ContadorQueries, iteracoes: int) -> dict:
+    """Roda o envio de cobranças (`_enviar_cobrancas`) com provedores stubados."""
+    med = Medicao()
+    for _ in range(iteracoes):
+        with app.app_context():
+            con = db_mod.get_db()
+            con.execute("UPDATE pedidos SET whatsapp_enviado = 0 WHERE pago = 0")
+            con.commit()
+        antes = contador.total
+        inicio = time.perf_counter()
+        scheduler_mod._enviar_cobrancas(app)
+        med.latencias.append(time.perf_counter() - inicio)
+        med.queries.append(contador.total - antes)
+    return med.resumo()
+
+
+def medir_fila(app: Flask) -> dict:
+    """Processa os jobs que as rotas enfileiraram (cobranças da loja, baixas
+    do webhook) e mede a vazão da fila."""
+    inicio = time.perf_counter()
+    jobs = fila_mod.processar(app)
+    duracao = time.perf_counter() - inicio
+    return {
+        "jobs": jobs,
+        "s": round(duracao, 3),
+        "jobs_por_s": round(jobs / duracao, 1) if duracao else 0.0,
+    }
+
+
+def pico_rss_kb() -> int:
+    """Pico de memória residente do processo (KB, Linux)."""
+    return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
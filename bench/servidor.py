@@ -0,0 +1,17 @@
+"""App para o teste de carga: provedores stubados com latência simulada.
+
+    BENCH_LATENCIA_PROVEDOR_MS=50 gunicorn -c gunicorn.conf.py bench.servidor:app
+"""
+
+from __future__ import annotations
+
+import os
+
+from app import create_app
+
+from .rotas import stubar_provedores
+
+os.environ.setdefault("ASAAS_API_KEY", "bench")
+stubar_provedores(float(os.getenv("BENCH_LATENCIA_PROVEDOR_MS", "0")))
+
+app = create_app()
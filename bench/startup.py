@@ -0,0 +1,91 @@
+"""Mede o boot: tempo de `import app` + `create_app()` e módulos importados.
+
+Cada execução roda num processo novo (como um worker do gunicorn ou um
+comando `flask`). A primeira usa um banco vazio (cria o schema, "fria"); as
+demais encontram o schema em dia ("quentes").
+
+Uso isolado:
+    python -m bench.startup --execucoes 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from .rotas import percentil
+
+META_BOOT_MS = 100.0
+# Importados só quando usados (provedores, backend PostgreSQL): se um deles
+# aparecer no boot, algum import ficou adiantado
+IMPORTS_TARDIOS = ("httpx", "psycopg", "psycopg_pool")
+
+# Roda no processo filho: imprime um JSON com as medições.
+_SCRIPT = """
+import json, sys, time
+antes = set(sys.modules)
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+create_app()
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "modulos": len(set(sys.modules) - antes),
+    "pesados": sorted(m for m in sys.argv[1:] if m in sys.modules),
+}))
+"""
+
+
+def _executar(caminho_db: str) -> dict:
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DATABASE_PATH=caminho_db, PYTHONPATH=raiz)
+    saida = subprocess.run(
+        [sys.executable, "-c", _SCRIPT, *IMPORTS_TARDIOS],
+        capture_output=True, text=True, check=True, cwd=raiz, env=env,
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def medir_startup(execucoes: int = 5, caminho_db: str | None = None) -> dict:
+    """Boot frio (schema novo) + `execucoes` boots quentes."""
+    if caminho_db is None:
+        caminho_db = os.path.join(tempfile.mkdtemp(prefix="bench-boot-"), "boot.db")
+    if os.path.exists(caminho_db):
+        os.remove(caminho_db)
+
+    fria = _executar(caminho_db)
+    quentes = [_executar(caminho_db) for _ in range(max(execucoes, 1))]
+
+    def p50(chave: str) -> float:
+        return round(percentil([q[chave] for q in quentes], 50), 2)
+
+    create_app_ms = p50("create_app_ms")
+    return {
+        "fria": {k: (round(v, 2) if isinstance(v, float) else v) for k, v in fria.items()},
+        "quente_p50": {
+            "import_ms": p50("import_ms"),
+            "create_app_ms": create_app_ms,
+            "modulos": quentes[0]["modulos"],
+            "pesados": quentes[0]["pesados"],
+        },
+        "meta_create_app_ms": META_BOOT_MS,
+        "dentro_da_meta": create_app_ms < META_BOOT_MS and not quentes[0]["pesados"],
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.startup", description=__doc__.splitlines()[0])
+    parser.add_argument("--execucoes", type=int, default=5)
+    args = parser.parse_args(argv)
+    print(json.dumps(medir_startup(args.execucoes), indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
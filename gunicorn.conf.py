@@ -0,0 +1,96 @@
+"""Configuração do gunicorn para produção.
+
+Uso:
+    gunicorn -c gunicorn.conf.py run:app
+
+O app é carregado uma vez no master (`preload_app`) e os workers nascem por
+fork, já com tudo importado. Pools e caches por processo (bcrypt, LRU de
+sessões, métricas) se recriam sozinhos no filho via `os.register_at_fork`;
+a conexão SQLite usada pelo `init_db()` no master é fechada antes do fork
+e cada worker abre as suas por request.
+Os jobs (fila) NÃO rodam aqui: use `python worker.py` num processo separado.
+
+Perfis (GUNICORN_PERFIL):
+- sync:    1 request por worker; workers = 2 x CPU + 1.
+- gthread: (padrão) threads por worker; enquanto uma request espera a vez
+           de escrever no SQLite as outras seguem. Cada aba com as telas
+           ao vivo (/eventos) prende uma thread enquanto aberta; o
+           limite padrão delas é GUNICORN_THREADS - 2.
+- gevent:  greenlets (requer `pip install gevent`); centenas de requests
+           em espera por worker.
+
+Variáveis de ambiente: GUNICORN_BIND (ou PORT), GUNICORN_PERFIL,
+GUNICORN_WORKERS, GUNICORN_THREADS, GUNICORN_CONEXOES, GUNICORN_TIMEOUT.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import multiprocessing
+import os
+import sys
+
+# Asaas e Twilio (httpx) só são chamados pela fila, no worker.py; a maior
+# espera dentro de uma request é a vez de escrever no SQLite.
+ESPERA_ESCRITA_S = float(os.getenv("DB_ESCRITA_TIMEOUT", "30"))
+
+CPUS = multiprocessing.cpu_count()
+
+perfil = os.getenv("GUNICORN_PERFIL", "gthread").strip().lower()
+if perfil == "gevent" and importlib.util.find_spec("gevent") is None:
+    print("gunicorn.conf: gevent não instalado, usando gthread", file=sys.stderr)
+    perfil = "gthread"
+
+if perfil == "gevent":
+    # Com preload o app é importado no master: o patch precisa vir antes.
+    from gevent import monkey
+
+    monkey.patch_all()
+
+bind = os.getenv("GUNICORN_BIND") or f"0.0.0.0:{os.getenv('PORT', '8000')}"
+preload_app = True
+worker_class = perfil
+
+if perfil == "sync":
+    workers = int(os.getenv("GUNICORN_WORKERS", str(CPUS * 2 + 1)))
+    # o worker inteiro fica preso na espera: o timeout cobre o pior caso
+    timeout = int(os.getenv("GUNICORN_TIMEOUT", str(int(ESPERA_ESCRITA_S) + 10)))
+elif perfil == "gevent":
+    workers = int(os.getenv("GUNICORN_WORKERS", str(CPUS + 1)))
+    worker_connections = int(os.getenv("GUNICORN_CONEXOES", "500"))
+    timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+else:
+    workers = int(os.getenv("GUNICORN_WORKERS", str(CPUS + 1)))
+    threads = int(os.getenv("GUNICORN_THREADS", "8"))
+    # gthread/gevent: o heartbeat não depende da request, basta o padrão
+    timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+
+# No deploy/restart, deixa as requests em andamento (inclusive as que estão
+# esperando a escrita) terminarem antes de matar o worker. As conexões de
+# /eventos caem aqui e o navegador reconecta sozinho.
+graceful_timeout = int(ESPERA_ESCRITA_S) + 5
+keepalive = 5
+
+# Recicla workers de tempos em tempos (vazamentos lentos), sem sincronia
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG") or None
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Registra o worker novo (o estado por processo já foi recriado)."""
+    server.log.info(
+        "worker %s (perfil=%s, threads=%s)", worker.pid, perfil, globals().get("threads", 1)
+    )
+
+
+def worker_exit(server, worker):
+    """Grava as métricas finais do worker antes de sair."""
+    from app.metricas import flush
+
+    try:
+        flush()
+    except OSError:
+        pass
@@ -1,10 +1,15 @@
 import os
 from app import create_app
+from app.fila import Trabalhador
+from app.scheduler import agendar_jobs
 
 app = create_app()
 
 if __name__ == "__main__":
     debug = os.getenv("FLASK_DEBUG") == "1"
-    # Se o WhatsApp automático estiver ligado, desativamos o reloader para não duplicar o scheduler
+    # Se o WhatsApp automático estiver ligado, desativamos o reloader para não duplicar os executores
     use_reloader = False if os.getenv("WHATSAPP_AUTOMATICO", "0") == "1" else debug
+    # Em produção a fila roda no worker.py; aqui, numa thread do servidor de desenvolvimento
+    agendar_jobs()
+    Trabalhador(app).iniciar_em_thread()
     app.run(debug=debug, use_reloader=use_reloader)
@@ -102,6 +102,64 @@
       }
     });
 
+    // =========================
+    // Ao vivo (SSE): páginas com data-eventos no body
+    // =========================
+    const avisar = (mensagem, categoria) => {
+      let caixa = document.querySelector(".alerts");
+      if (!caixa) {
+        caixa = document.createElement("div");
+        caixa.className = "alerts";
+        document.querySelector(".content")?.before(caixa);
+      }
+      const a = document.createElement("div");
+      a.className = `alert ${categoria}`;
+      const msg = document.createElement("span");
+      msg.className = "alert-msg";
+      msg.textContent = mensagem;
+      a.appendChild(msg);
+      caixa.appendChild(a);
+      setTimeout(() => {
+        a.classList.add("hide");
+        setTimeout(() => a.remove(), 220);
+      }, 5000);
+    };
+
+    const brl = (v) => `R$ ${Number(v || 0).toFixed(2)}`;
+    const avisos = {
+      pedido_criado: (d) => [`Novo pedido #${d.pedido_id}: ${brl(d.principal)}`, "info"],
+      pedido_pago: (d) => [
+        d.origem === "asaas"
+          ? `PIX recebido ✅ ${brl(d.valor)} (pedido #${d.pedidos.join(", #")})`
+          : `Baixa registrada ✅ ${brl(d.valor)}`,
+        "success",
+      ],
+      estoque: (d) => d.baixo
+        ? [`Estoque baixo ⚠️ ${d.nome}: ${d.quantidade} (mínimo ${d.minimo})`, "warning"]
+        : null,
+    };
+
+    const urlEventos = body.dataset.eventos;
+    if (urlEventos && window.EventSource) {
+      // o navegador reconecta sozinho (com Last-Event-ID) se cair
+      const fonte = new EventSource(urlEventos);
+      Object.entries(avisos).forEach(([tipo, aviso]) => {
+        fonte.addEventListener(tipo, (e) => {
+          let dados;
+          try {
+            dados = JSON.parse(e.data);
+          } catch {
+            return;
+          }
+          const texto = aviso(dados);
+          if (texto) avisar(...texto);
+          // cada página aplica o delta no que mostra
+          document.dispatchEvent(new CustomEvent(`aovivo:${tipo}`, { detail: dados }));
+        });
+      });
+      window.addEventListener("beforeunload", () => fonte.close());
+    }
+
     // =========================
     // Busca instantânea - pedidos
     // =========================
@@ -135,5 +193,92 @@
         }
       });
     }
+
+    // =========================
+    // Autocomplete (cliente/produto) - busca no servidor
+    // =========================
+    const formatarItem = (tipo, item) => {
+      if (tipo === "produto") {
+        const preco = Number(item.preco || 0).toFixed(2);
+        return `${item.nome} - R$ ${preco}`;
+      }
+      return item.telefone ? `${item.nome} (${item.telefone})` : item.nome;
+    };
+
+    document.querySelectorAll("input[data-autocomplete]").forEach((campo) => {
+      const url = campo.dataset.autocomplete;
+      const tipo = campo.dataset.tipo || "";
+      const hidden = document.getElementById(campo.dataset.target);
+      const lista = campo.parentElement.querySelector(".autocomplete-list");
+      if (!url || !hidden || !lista) return;
+
+      let timer = null;
+      let controller = null;
+
+      const fechar = () => {
+        lista.innerHTML = "";
+        lista.classList.remove("open");
+      };
+
+      const escolher = (item) => {
+        hidden.value = item.id;
+        campo.value = formatarItem(tipo, item);
+        fechar();
+      };
+
+      const buscar = async () => {
+        const q = (campo.value || "").trim();
+        if (!q) {
+          fechar();
+          return;
+        }
+
+        controller?.abort();
+        controller = new AbortController();
+
+        try {
+          const resp = await fetch(`${url}?q=${encodeURIComponent(q)}`, {
+            signal: controller.signal,
+            headers: { Accept: "application/json" },
+          });
+          if (!resp.ok) return;
+          const itens = await resp.json();
+
+          lista.innerHTML = "";
+          itens.forEach((item) => {
+            const opcao = document.createElement("button");
+            opcao.type = "button";
+            opcao.className = "autocomplete-item";
+            opcao.textContent = formatarItem(tipo, item);
+            opcao.addEventListener("click", () => escolher(item));
+            lista.appendChild(opcao);
+          });
+
+          if (!itens.length) {
+            const vazio = document.createElement("div");
+            vazio.className = "autocomplete-empty";
+            vazio.textContent = "Nada encontrado.";
+            lista.appendChild(vazio);
+          }
+          lista.classList.add("open");
+        } catch (err) {
+          if (err.name !== "AbortError") fechar();
+        }
+      };
+
+      campo.addEventListener("input", () => {
+        hidden.value = ""; // texto mudou: exige nova escolha
+        clearTimeout(timer);
+        timer = setTimeout(buscar, 150);
+      });
+
+      campo.addEventListener("keydown", (e) => {
+        if (e.key === "Escape") fechar();
+      });
+
+      document.addEventListener("click", (e) => {
+        if (!campo.parentElement.contains(e.target)) fechar();
+      });
+    });
   });
 })()
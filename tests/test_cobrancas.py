@@ -0,0 +1,74 @@
+"""Baixa em lote com valor recebido: quita os mais antigos e abate a sobra."""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import auth, create_app
+from app.repositorio import repo
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "teste.db"))
+    monkeypatch.delenv("DB_SHARDS_DIR", raising=False)
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+    return create_app()
+
+
+@pytest.fixture
+def cliente_com_pedidos(app):
+    """(client logado, cliente_id, [pedido mais antigo, mais novo]) de R$ 10 e R$ 20."""
+    hoje = date.today()
+    with app.app_context():
+        auth.criar_usuario("ana", "senha123")
+        r = repo()
+        uid = r.usuarios.por_username("ana")["id"]
+        cliente_id = r.clientes.criar(uid, "Maria", "11999990000")
+        pedidos = []
+        for dias, preco in ((1, 10.0), (5, 20.0)):
+            produto_id = r.produtos.criar(uid, f"Produto {preco:.0f}", preco)
+            vencimento = (hoje + timedelta(days=dias)).isoformat()
+            pedidos.append(
+                r.pedidos.criar(uid, cliente_id, [(produto_id, 1, preco)], hoje.isoformat(), vencimento)
+            )
+        r.commit()
+    client = app.test_client()
+    client.post("/login", data={"username": "ana", "senha": "senha123"})
+    return client, cliente_id, pedidos
+
+
+def _pedido(app, pedido_id: int):
+    with app.app_context():
+        return repo().db.um(
+            "SELECT pago, valor_pago, valor_abatido FROM pedidos WHERE id = :id", {"id": pedido_id}
+        )
+
+
+def test_sobra_abate_do_pedido_seguinte(app, cliente_com_pedidos):
+    client, cliente_id, (antigo, novo) = cliente_com_pedidos
+    resp = client.post(f"/cobrancas/cliente/{cliente_id}/pagar", data={"valor": "25"})
+    assert resp.status_code == 302
+
+    assert tuple(_pedido(app, antigo)) == (1, 10, None)
+    assert tuple(_pedido(app, novo)) == (0, None, 15)
+    detalhes = client.get(f"/cobrancas/cliente/{cliente_id}").get_json()
+    [pedido] = detalhes["pedidos"]
+    assert (pedido["abatido"], pedido["principal"], pedido["total"]) == (15, 5, 5)
+
+    # o resto quita o pedido; o valor pago soma o abatimento
+    client.post(f"/cobrancas/cliente/{cliente_id}/pagar", data={"valor": "5"})
+    assert tuple(_pedido(app, novo)) == (1, 20, 15)
+
+
+def test_valor_menor_que_o_pedido_mais_antigo(app, cliente_com_pedidos):
+    client, cliente_id, (antigo, novo) = cliente_com_pedidos
+    client.post(f"/cobrancas/cliente/{cliente_id}/pagar", data={"valor": "4"})
+
+    assert tuple(_pedido(app, antigo)) == (0, None, 4)
+    assert _pedido(app, novo)["valor_abatido"] is None
+    with app.app_context():
+        [saldo] = repo().cobrancas.clientes_em_aberto(repo().usuarios.primeiro_id())
+    assert (saldo["principal"], saldo["pedidos_abertos"]) == (26, 2)
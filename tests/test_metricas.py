@@ -0,0 +1,36 @@
+"""Acesso ao /metrics: token quando configurado, senão só loopback direto."""
+
+from __future__ import annotations
+
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "teste.db"))
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    return create_app().test_client()
+
+
+def test_sem_token_so_loopback(client):
+    assert client.get("/metrics").status_code == 200
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "::1"}).status_code == 200
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "10.0.0.5"}).status_code == 403
+    # proxy reverso na mesma máquina: conecta de 127.0.0.1 em nome de outro
+    assert client.get("/metrics", headers={"X-Forwarded-For": "203.0.113.9"}).status_code == 403
+    assert client.get("/metrics", headers={"Forwarded": "for=203.0.113.9"}).status_code == 403
+
+
+def test_com_token(client, monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "segredo")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer errado"}).status_code == 401
+    resp = client.get(
+        "/metrics",
+        headers={"Authorization": "Bearer segredo", "X-Forwarded-For": "203.0.113.9"},
+        environ_base={"REMOTE_ADDR": "10.0.0.5"},
+    )
+    assert resp.status_code == 200
+    assert b"# TYPE" in resp.data
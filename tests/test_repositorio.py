@@ -0,0 +1,364 @@
+"""Repositórios contra o SQLite e, com TEST_DATABASE_URL, contra o PostgreSQL.
+
+O PostgreSQL de teste é apagado (TRUNCATE de todas as tabelas) antes de
+cada teste: não aponte TEST_DATABASE_URL para um banco com dados.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from app import create_app
+from app.repositorio import (
+    BackendPostgres,
+    BackendSQLite,
+    RegistroDuplicado,
+    Repositorios,
+)
+
+PG_URL = os.getenv("TEST_DATABASE_URL", "").strip()
+SCHEMA_PG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "schema_postgres.sql"
+)
+
+_pg: BackendPostgres | None = None
+
+
+def _postgres() -> BackendPostgres:
+    """Backend do banco de teste, com o schema aplicado e as tabelas vazias."""
+    global _pg
+    pytest.importorskip("psycopg")
+    pytest.importorskip("psycopg_pool")
+    if _pg is None:
+        _pg = BackendPostgres(PG_URL, minimo=1, maximo=2)
+        with open(SCHEMA_PG, encoding="utf-8") as fh:
+            ddl = fh.read()
+        with _pg.pool().connection() as con:
+            con.execute(ddl)
+    with _pg.pool().connection() as con:
+        tabelas = [
+            r[0] for r in con.execute(
+                "SELECT tablename FROM pg_tables WHERE schemaname = current_schema()"
+            )
+        ]
+        con.execute(f"TRUNCATE {', '.join(tabelas)} RESTART IDENTITY CASCADE")
+    return _pg
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "teste.db"))
+    monkeypatch.delenv("DB_SHARDS_DIR", raising=False)
+    return create_app()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def r(request, app):
+    if request.param == "postgres" and not PG_URL:
+        pytest.skip("defina TEST_DATABASE_URL para testar o PostgreSQL")
+    with app.app_context():
+        db = _postgres() if request.param == "postgres" else BackendSQLite()
+        try:
+            yield Repositorios(db)
+        finally:
+            if isinstance(db, BackendPostgres):
+                db.devolver()
+
+
+def _dia(dias: int = 0) -> str:
+    return (date.today() + timedelta(days=dias)).isoformat()
+
+
+def _pedido(r: Repositorios, uid: int, preco: float = 10.0, qtd: int = 2,
+            vencimento: str | None = None) -> tuple[int, int, int]:
+    """(cliente_id, produto_id, pedido_id) de um pedido em aberto."""
+    cliente_id = r.clientes.criar(uid, "Maria", "11999990000")
+    produto_id = r.produtos.criar(uid, "Caneca", preco)
+    pedido_id = r.pedidos.criar(
+        uid, cliente_id, [(produto_id, qtd, preco)], _dia(), vencimento or _dia(7)
+    )
+    r.commit()
+    return cliente_id, produto_id, pedido_id
+
+
+def test_usuarios(r):
+    uid = r.usuarios.criar("ana", b"hash1")
+    assert r.usuarios.por_id(uid)["username"] == "ana"
+    assert bytes(r.usuarios.por_username("ana")["senha_hash"]) == b"hash1"
+    assert r.usuarios.por_username("ninguem") is None
+    assert r.usuarios.primeiro_id() == uid
+
+    r.usuarios.trocar_hash(uid, b"hash2")
+    assert bytes(r.usuarios.por_username("ana")["senha_hash"]) == b"hash2"
+
+    with pytest.raises(RegistroDuplicado):
+        r.usuarios.criar("ana", b"outro")
+
+
+def test_clientes(r):
+    uid = r.usuarios.criar("ana", b"h")
+    outro = r.usuarios.criar("bia", b"h")
+    cid = r.clientes.criar(uid, "João Silva", "11988887777")
+    r.clientes.criar(uid, "Maria Souza", "21977776666")
+    r.clientes.criar(outro, "João de Outro", "11900000000")
+    r.commit()
+
+    assert [c["nome"] for c in r.clientes.listar(uid)] == ["João Silva", "Maria Souza"]
+    assert r.clientes.por_id(outro, cid) is None
+
+    assert [c["id"] for c in r.clientes.buscar(uid, "joã sil", 10)] == [cid]
+    assert [c["id"] for c in r.clientes.buscar(uid, "1198", 10)] == [cid]
+    assert r.clientes.buscar(uid, "   ", 10) == []
+
+    r.clientes.atualizar(uid, cid, "João Santos", "11911112222")
+    r.commit()
+    assert r.clientes.por_id(uid, cid)["telefone"] == "11911112222"
+
+    r.clientes.excluir(uid, cid)
+    r.commit()
+    assert r.clientes.por_id(uid, cid) is None
+    assert len(r.clientes.listar(uid)) == 1
+
+
+def test_produtos(r):
+    uid = r.usuarios.criar("ana", b"h")
+    pid = r.produtos.criar(uid, "Caneca azul", 12.5)
+    r.produtos.criar(uid, "Camiseta", 40)
+    r.commit()
+
+    assert r.produtos.por_id(uid, pid)["preco"] == 12.5
+    # já nasce com a linha de estoque zerada
+    est = r.estoque.do_produto(uid, pid)
+    assert (est["quantidade"], est["minimo"]) == (0, 0)
+
+    assert [p["id"] for p in r.produtos.buscar(uid, "can", 10)] == [pid]
+    assert len(r.produtos.buscar(uid, "ca", 1)) == 1
+
+    r.produtos.atualizar(uid, pid, "Caneca verde", 15)
+    r.commit()
+    assert [p["nome"] for p in r.produtos.listar(uid)] == ["Camiseta", "Caneca verde"]
+
+    r.produtos.excluir(uid, pid)
+    r.commit()
+    assert r.produtos.por_id(uid, pid) is None
+
+
+def test_estoque(r):
+    uid = r.usuarios.criar("ana", b"h")
+    pid = r.produtos.criar(uid, "Caneca", 10)
+    r.db.executar(
+        "DELETE FROM estoque WHERE usuario_id = :uid AND produto_id = :id", {"uid": uid, "id": pid}
+    )
+    r.commit()
+    assert r.estoque.do_produto(uid, pid) is None
+    assert r.estoque.listar(uid)[0]["quantidade"] is None
+
+    r.estoque.garantir_linhas(uid)
+    r.estoque.garantir_linhas(uid)
+    r.commit()
+    assert r.db.valor("SELECT COUNT(*) FROM estoque WHERE usuario_id = :uid", {"uid": uid}) == 1
+
+    r.estoque.atualizar(uid, pid, 7, 3)
+    r.commit()
+    est = r.estoque.do_produto(uid, pid)
+    assert (est["quantidade"], est["minimo"]) == (7, 3)
+    linha = r.estoque.listar(uid)[0]
+    assert (linha["nome"], linha["quantidade"], linha["minimo"]) == ("Caneca", 7, 3)
+
+
+def test_pedidos(r):
+    uid = r.usuarios.criar("ana", b"h")
+    assert not r.pedidos.tem_clientes(uid)
+    cliente_id, produto_id, pedido_id = _pedido(r, uid, preco=10, qtd=3)
+
+    assert r.pedidos.tem_clientes(uid) and r.pedidos.tem_produtos(uid)
+    assert r.pedidos.cliente_existe(uid, cliente_id)
+    assert not r.pedidos.cliente_existe(uid + 1, cliente_id)
+    assert r.pedidos.produto_existe(uid, produto_id)
+    assert set(r.pedidos.produtos(uid, [produto_id, 999])) == {produto_id}
+    assert r.pedidos.produtos(uid, []) == {}
+
+    [linha] = r.pedidos.listar(uid)
+    assert (linha["id"], linha["cliente"], linha["total"], linha["pago"]) == (
+        pedido_id, "Maria", 30, 0
+    )
+    assert "Caneca" in linha["produto_nome"]
+
+    pago = r.pedidos.marcar_pago(uid, pedido_id)
+    assert (pago["cliente_id"], pago["valor_principal"]) == (cliente_id, 30)
+    assert r.pedidos.marcar_pago(uid, pedido_id) is None
+
+
+def test_cobrancas(r):
+    uid = r.usuarios.criar("ana", b"h")
+    cliente_id, _produto_id, pedido_id = _pedido(r, uid, preco=100, qtd=1, vencimento=_dia(-10))
+
+    assert r.cobrancas.acumular(_dia(), uid=uid) == 1
+    assert r.cobrancas.acumular(_dia(), uid=uid) == 0  # nada mudou
+    r.cobrancas.marcar_acumulado(_dia())
+    r.commit()
+    assert r.cobrancas.acumulado_em() == _dia()
+
+    [aberto] = r.cobrancas.abertos(uid)
+    assert (aberto["pedido_id"], aberto["dias_atraso"]) == (pedido_id, 10)
+    assert aberto["total_atualizado"] == pytest.approx(100 + aberto["juros"])
+    assert aberto["juros"] > 0
+    assert r.cobrancas.abertos(uid, clientes=[]) == []
+    assert r.cobrancas.aberto(uid, pedido_id)["cliente_id"] == cliente_id
+
+    [cliente] = r.cobrancas.clientes_em_aberto(uid, atrasados_ate=_dia())
+    assert (cliente["cliente_id"], cliente["pedidos_abertos"], cliente["total_linhas"]) == (
+        cliente_id, 1, 1
+    )
+    assert cliente["total"] == pytest.approx(aberto["total_atualizado"])
+    assert r.cobrancas.clientes_em_aberto(uid, busca="outro") == []
+
+    r.cobrancas.alterar_vencimento(uid, pedido_id, _dia(5), "10:00")
+    assert r.cobrancas.aberto(uid, pedido_id)["vencimento"] == _dia(5)
+    assert r.cobrancas.abertos(uid)[0]["dias_atraso"] == 0
+
+    [pendente] = r.cobrancas.pendentes_whatsapp()
+    r.cobrancas.marcar_whatsapp_enviado([("2024-01-01 09:00", pendente["pedido_id"])])
+    assert r.cobrancas.pendentes_whatsapp() == []
+
+    r.cobrancas.dar_baixa_lote(uid, [{"id": pedido_id, "juros": 0, "data": _dia(), "valor": 100}])
+    assert r.cobrancas.abertos(uid) == []
+    assert r.cobrancas.clientes_em_aberto(uid) == []
+
+
+def test_cobrancas_pagamento_parcial(r):
+    uid = r.usuarios.criar("ana", b"h")
+    cliente_id, produto_id, antigo = _pedido(r, uid, preco=100, qtd=1, vencimento=_dia(-10))
+    novo = r.pedidos.criar(uid, cliente_id, [(produto_id, 1, 100)], _dia(), _dia(7))
+    r.commit()
+    r.cobrancas.acumular(_dia(), uid=uid)
+    r.commit()
+
+    r.cobrancas.dar_baixa_lote(uid, [], {"id": antigo, "valor": 30, "data": _dia()})
+    r.cobrancas.dar_baixa_lote(uid, [], {"id": antigo, "valor": 20, "data": _dia()})
+    pedido = r.cobrancas.aberto(uid, antigo)
+    assert (pedido["valor_abatido"], pedido["principal_atual"]) == (50, 50)
+    # juros correm só sobre o que falta
+    row = next(p for p in r.cobrancas.abertos(uid) if p["pedido_id"] == antigo)
+    assert row["juros"] == pytest.approx(50 * 0.03 * 10)
+    assert row["total_atualizado"] == pytest.approx(50 + 50 * 0.03 * 10)
+
+    [saldo] = r.cobrancas.clientes_em_aberto(uid)
+    assert (saldo["principal"], saldo["pedidos_abertos"]) == (150, 2)
+    assert saldo["total"] == pytest.approx(150 + 50 * 0.03 * 10)
+    assert r.dashboard.total_por_status(uid, 0) == 150
+    assert r.dashboard.total_por_status(uid, 1) == 50
+
+    # a reconstrução do saldo (job de juros) bate com os triggers
+    r.cobrancas.recalcular_saldos(uid)
+    r.commit()
+    [refeito] = r.cobrancas.clientes_em_aberto(uid)
+    assert (refeito["principal"], refeito["total"]) == (saldo["principal"], saldo["total"])
+
+    # quitado: o valor pago do pedido inclui o que já tinha sido abatido
+    r.cobrancas.dar_baixa_lote(uid, [{"id": antigo, "juros": 15, "data": _dia(), "valor": 65}])
+    assert r.db.valor("SELECT valor_pago FROM pedidos WHERE id = :id", {"id": antigo}) == 115
+    assert r.financeiro.resumo(uid)["recebido"] == 115
+    [saldo] = r.cobrancas.clientes_em_aberto(uid)
+    assert (saldo["principal"], saldo["pedidos_abertos"]) == (100, 1)
+    assert r.dashboard.total_por_status(uid, 1) == 100
+    assert r.cobrancas.aberto(uid, novo)["valor_abatido"] is None
+
+
+def test_financeiro(r):
+    uid = r.usuarios.criar("ana", b"h")
+    _cliente_id, _produto_id, pedido_id = _pedido(r, uid, preco=50, qtd=2)
+    _pedido(r, uid, preco=5, qtd=1)
+    assert r.financeiro.qtd_abertos(uid) == 2
+    versao = r.financeiro.versao(uid)
+
+    r.cobrancas.dar_baixa_lote(
+        uid, [{"id": pedido_id, "juros": 3, "data": _dia(), "valor": 103}]
+    )
+    assert r.financeiro.versao(uid) > versao
+    assert r.financeiro.qtd_abertos(uid) == 1
+
+    resumo = r.financeiro.resumo(uid, de=_dia(), ate=_dia())
+    assert (resumo["recebido"], resumo["juros"], resumo["pagamentos"]) == (103, 3, 1)
+    assert r.financeiro.resumo(uid, ate=_dia(-1))["pagamentos"] == 0
+
+    [dia] = r.financeiro.por_dia(uid)
+    assert (dia["dia"], dia["recebido"]) == (_dia(), 103)
+    [ultimo] = r.financeiro.ultimos_pagamentos(uid)
+    assert (ultimo["id"], ultimo["valor_pago"], ultimo["cliente"]) == (pedido_id, 103, "Maria")
+
+
+def test_dashboard(r):
+    uid = r.usuarios.criar("ana", b"h")
+    _c, _p, pago = _pedido(r, uid, preco=10, qtd=1)
+    _pedido(r, uid, preco=20, qtd=2)
+    r.pedidos.marcar_pago(uid, pago)
+
+    assert r.dashboard.contar_clientes(uid) == 2
+    assert r.dashboard.contar_pedidos(uid) == 2
+    assert r.dashboard.total_por_status(uid, 1) == 10
+    assert r.dashboard.total_por_status(uid, 0) == 40
+    [devedor] = r.dashboard.top_devedores(uid)
+    assert (devedor["nome"], devedor["total"]) == ("Maria", 40)
+    assert [tuple(m) for m in r.dashboard.total_por_mes(uid)] == [(_dia()[:7], 50)]
+
+
+def test_loja(r):
+    uid = r.usuarios.criar("ana", b"h")
+    r.produtos.criar(uid, "Caneca", 10)
+    r.commit()
+    assert [p["nome"] for p in r.loja.produtos(uid)] == ["Caneca"]
+
+    assert r.loja.cliente_por_telefone(uid, "11955554444") is None
+    cid = r.loja.criar_cliente(uid, "Zé", "11955554444")
+    r.commit()
+    assert r.loja.cliente_por_telefone(uid, "11955554444") == cid
+
+    produto_id = r.loja.produtos(uid)[0]["id"]
+    pedido_id = r.pedidos.criar(uid, cid, [(produto_id, 2, 10)], _dia(), _dia(3))
+    r.commit()
+    r.loja.salvar_cobranca_asaas(pedido_id, {
+        "customer_id": "cus_1",
+        "payment_id": "pay_1",
+        "invoice_url": "https://exemplo/fatura",
+        "pix_payload": "000201",
+        "pix_qr_code": "base64",
+        "status": "PENDING",
+    })
+    cobranca = r.loja.cobranca_do_pedido(pedido_id)
+    assert (cobranca["pago"], cobranca["asaas_payment_id"]) == (0, "pay_1")
+    assert r.loja.pedido_do_pagamento("pay_1")["id"] == pedido_id
+    assert r.loja.pedido_do_pagamento("pay_x") is None
+
+    r.loja.baixa_webhook(pedido_id, _dia(), 25.0, "PAYMENT_RECEIVED")
+    pedido = r.loja.pedido_do_pagamento("pay_1")
+    assert (pedido["pago"], pedido["valor_pago"]) == (1, 25)
+    assert r.db.valor("SELECT juros FROM pedidos WHERE id = :id", {"id": pedido_id}) == 5
+
+
+def test_arquivo(r):
+    uid = r.usuarios.criar("ana", b"h")
+    _c, _p, antigo = _pedido(r, uid, preco=10, qtd=1)
+    _c, _p, recente = _pedido(r, uid, preco=20, qtd=1)
+    _pedido(r, uid, preco=30, qtd=1)
+    r.cobrancas.dar_baixa_lote(uid, [
+        {"id": antigo, "juros": 0, "data": "2020-01-10", "valor": 10},
+        {"id": recente, "juros": 0, "data": _dia(), "valor": 20},
+    ])
+    assert r.arquivo.corte() is None
+
+    assert r.arquivo.arquivar_lote("2021-01-01", 100, "2021-01-01 00:00:00") == 1
+    assert r.arquivo.arquivar_lote("2021-01-01", 100, "2021-01-01 00:00:00") == 0
+    assert r.arquivo.corte() == "2021-01-01"
+    assert r.db.valor("SELECT COUNT(*) FROM pedidos_arquivo") == 1
+    assert r.db.valor("SELECT COUNT(*) FROM pedido_itens_arquivo") == 1
+    assert r.db.valor("SELECT COUNT(*) FROM pedidos WHERE id = :id", {"id": antigo}) == 0
+
+    # as consultas continuam vendo o pedido arquivado
+    assert r.dashboard.contar_pedidos(uid) == 3
+    assert r.dashboard.total_por_status(uid, 1) == 30
+    assert [p["id"] for p in r.financeiro.ultimos_pagamentos(uid)] == [recente, antigo]
+    assert r.financeiro.resumo(uid)["recebido"] == 30
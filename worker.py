@@ -1,13 +1,22 @@
-import time
 import os
 from app import create_app
+from app.fila import rodar
+from app.scheduler import agendar_jobs
 
-# Força habilitação do scheduler neste processo
+# Força habilitação do WhatsApp automático neste processo
 os.environ.setdefault("WHATSAPP_AUTOMATICO", "1")
 
 app = create_app()
 
 if __name__ == "__main__":
-    # Mantém o processo vivo (scheduler roda em background)
-    while True:
-        time.sleep(60)
+    # Jobs periódicos na agenda da fila: WhatsApp das cobranças (a cada
+    # minuto), acúmulo diário de juros (JUROS_HORA, e na primeira subida),
+    # arquivo dos pedidos pagos antigos (ARQUIVO_HORA), backup online dos
+    # bancos (BACKUP_HORA) e limpeza das sessões expiradas. Ver
+    # app/scheduler.py.
+    agendar_jobs()
+
+    # Executa a fila (periódicos + cobranças do Asaas e baixas do webhook)
+    # com FILA_PROCESSOS x FILA_THREADS executores, até SIGTERM/SIGINT.
+    # Ver app/fila.py.
+    rodar(app)